@@ -0,0 +1,7 @@
+"""
+Benchmarks
+Routing benchmarks on seeded synthetic boards, nothing in here needs Blender
+Run from the repository root:
+  python -m benchmarks --scale small medium --mode sequential steiner --output result.json
+  python -m benchmarks --compare old_result.json new_result.json
+"""
@@ -0,0 +1,234 @@
+"""
+Run Benchmark
+Route synthetic boards with Grid and the routing modules, and write the measurements to json
+  time: wall time of routing, not counting making the grid and the obstacles
+  pushed / expanded: search nodes of Grid.total_search_count
+  peak_memory: peak of python and numpy allocations while making the grid and routing (tracemalloc, a second run)
+  routed_net / failed_net: a net is routed when all its tips end up connected
+  tube_length: total length of all tip and ground paths in mm
+Results of two commits can be compared with --compare
+"""
+
+import os
+import sys
+import json
+import time
+import math
+import argparse
+import platform
+import subprocess
+import tracemalloc
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+import fluid_circuit_generator.path_finding as p
+import fluid_circuit_generator.parallel_routing as parallel_routing
+import fluid_circuit_generator.negotiated_routing as negotiated_routing
+import fluid_circuit_generator.rip_up_routing as rip_up_routing
+import fluid_circuit_generator.incremental_routing as incremental_routing
+
+from benchmarks import synthetic_board
+
+
+MODE_LIST = ["sequential", "parallel", "negotiated", "steiner"]
+# measurements compared by --compare, lower is better for all but routed_net
+COMPARE_KEY_LIST = ["time", "expanded", "peak_memory", "failed_net", "tube_length"]
+
+
+
+
+# make the grid of a board and route it
+# return (grid, routing time)
+def route_board(board, mode, search_mode="ASTAR", storage="DENSE"):
+  """Helper Function"""
+  grid = p.Grid(board["dimention"], search_mode, False, storage)
+  occupancy = np.zeros(grid.shape, dtype=bool)
+  if board["obstacle_list"]:
+    occupancy[tuple(np.array(board["obstacle_list"]).T)] = True
+  grid.add_obstacle_occupancy(occupancy)
+
+  start_time = time.perf_counter()
+  if mode == "sequential":
+    # same as PipeSystem.route_one_by_one
+    failed_list = []
+    error_range_dict = {}
+    for start_node, end_node in board["connection_list"]:
+      error_num = len(grid.error_message_list)
+      if not grid.connect_two_node(start_node, end_node):
+        failed_list.append((start_node, end_node))
+        error_range_dict[(start_node, end_node)] = (error_num, len(grid.error_message_list))
+    if failed_list:
+      rip_up_routing.rip_up_and_reroute(grid, board["connection_list"], failed_list, error_range_dict=error_range_dict)
+  elif mode == "parallel":
+    parallel_routing.route_parallel(grid, board["connection_list"])
+  elif mode == "negotiated":
+    negotiated_routing.route_negotiated(grid, board["connection_list"])
+  elif mode == "steiner":
+    for net in board["net_list"]:
+      grid.connect_node_group(net)
+  else:
+    raise ValueError(f"Unknown mode {mode}, choose from {MODE_LIST}")
+  return grid, time.perf_counter() - start_time
+
+
+# measurements of a routed grid, see the top of this file
+def get_routing_stats(grid, board):
+  """Helper Function"""
+  unit = board["setting"]["unit_dimention"]
+  tip_set_list = [routed_group["tip_set"] for routed_group in incremental_routing.get_routed_group_list(grid)]
+  routed_net = 0
+  for net in board["net_list"]:
+    if any(set(net) <= tip_set for tip_set in tip_set_list):
+      routed_net += 1
+
+  path_list = list(grid.saved_path.values())
+  path_list += [value[2] for value in grid.tip_ground_table.values()]
+  tube_length = 0
+  for path in path_list:
+    for node1, node2 in zip(path, path[1:]):
+      tube_length += math.dist(node1, node2) * unit
+
+  return {
+    "pushed": grid.total_search_count["pushed"],
+    "expanded": grid.total_search_count["expanded"],
+    "routed_net": routed_net,
+    "failed_net": len(board["net_list"]) - routed_net,
+    "error_num": len(grid.error_message_list),
+    "tube_length": round(tube_length, 3),
+  }
+
+
+# route one board once for time and the search stats, and once more under tracemalloc for memory
+def run_case(board, mode, search_mode="ASTAR", storage="DENSE", measure_memory=True):
+  """Top level function"""
+  p.blockPrint()
+  try:
+    grid, routing_time = route_board(board, mode, search_mode, storage)
+    result = {"time": round(routing_time, 4)}
+    result.update(get_routing_stats(grid, board))
+    if measure_memory:
+      del grid
+      tracemalloc.start()
+      route_board(board, mode, search_mode, storage)
+      result["peak_memory"] = tracemalloc.get_traced_memory()[1]
+      tracemalloc.stop()
+  finally:
+    p.enablePrint()
+  return result
+
+
+# hash of the checked out commit, None outside of a git repository
+def get_commit():
+  """Helper Function"""
+  try:
+    output = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+      cwd=os.path.dirname(os.path.realpath(__file__)))
+  except (OSError, subprocess.CalledProcessError):
+    return None
+  return output.stdout.strip()
+
+
+# run every combination of the arguments
+# return {"meta", "result_list"}
+def run_benchmark(scale_list, mode_list, seed_list, search_mode="ASTAR", storage="DENSE", measure_memory=True, **setting):
+  """Top level function"""
+  report = {
+    "meta": {
+      "commit": get_commit(),
+      "python": platform.python_version(),
+      "numpy": np.__version__,
+      "machine": platform.machine(),
+      "date": time.strftime("%Y-%m-%d %H:%M:%S"),
+    },
+    "result_list": [],
+  }
+  for scale in scale_list:
+    for seed in seed_list:
+      board = synthetic_board.make_board(seed, scale, **setting)
+      for mode in mode_list:
+        result = run_case(board, mode, search_mode, storage, measure_memory)
+        case = {
+          "scale": scale,
+          "seed": seed,
+          "mode": mode,
+          "search_mode": search_mode,
+          "storage": storage,
+          "setting": board["setting"],
+          "dimention": board["dimention"],
+          "net_num": len(board["net_list"]),
+          "connection_num": len(board["connection_list"]),
+          "obstacle_num": len(board["obstacle_list"]),
+        }
+        case.update(result)
+        report["result_list"].append(case)
+        print(f"{scale:>7} seed {seed:<3} {mode:<11} time {result['time']:>8.3f}s  expanded {result['expanded']:>8}"
+          f"  nets {result['routed_net']}/{len(board['net_list'])}  tube {result['tube_length']:.0f}mm"
+          + (f"  memory {result['peak_memory']/2**20:.1f}MB" if measure_memory else ""))
+  return report
+
+
+# print the change of every measurement between two reports, cases are matched by scale, seed, mode and search settings
+def compare_report(old_report, new_report):
+  """Top level function"""
+  def get_case_key(case):
+    return (case["scale"], case["seed"], case["mode"], case["search_mode"], case["storage"])
+
+  old_case_dict = {get_case_key(case): case for case in old_report["result_list"]}
+  print(f"Comparing {old_report['meta']['commit']} -> {new_report['meta']['commit']}")
+  for new_case in new_report["result_list"]:
+    old_case = old_case_dict.get(get_case_key(new_case))
+    if old_case is None:
+      continue
+    change_list = []
+    for key in COMPARE_KEY_LIST:
+      if key not in old_case or key not in new_case:
+        continue
+      old_value, new_value = old_case[key], new_case[key]
+      if old_value == new_value:
+        continue
+      if old_value:
+        change_list.append(f"{key} {old_value} -> {new_value} ({(new_value - old_value) / old_value:+.1%})")
+      else:
+        change_list.append(f"{key} {old_value} -> {new_value}")
+    print(f"{' '.join(map(str, get_case_key(new_case)))}: {', '.join(change_list) if change_list else 'same'}")
+
+
+def main(argv=None):
+  """Command line entry, see python -m benchmarks --help"""
+  parser = argparse.ArgumentParser(prog="python -m benchmarks", description="Routing benchmarks on synthetic boards")
+  parser.add_argument("--scale", nargs="+", default=["small", "medium"], choices=list(synthetic_board.SCALE_DICT))
+  parser.add_argument("--mode", nargs="+", default=["sequential"], choices=MODE_LIST)
+  parser.add_argument("--seed", nargs="+", type=int, default=[0, 1, 2])
+  parser.add_argument("--search-mode", default="ASTAR", choices=["ASTAR", "JPS", "HPA"])
+  parser.add_argument("--storage", default="DENSE", choices=["DENSE", "CHUNKED"])
+  parser.add_argument("--gate-num", type=int)
+  parser.add_argument("--fan-out", type=int)
+  parser.add_argument("--obstacle-density", type=float)
+  parser.add_argument("--unit-dimention", type=int)
+  parser.add_argument("--no-memory", action="store_true", help="skip the tracemalloc run")
+  parser.add_argument("--output", help="json file to write the report to")
+  parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="compare two reports instead of running")
+  args = parser.parse_args(argv)
+
+  if args.compare:
+    with open(args.compare[0]) as file:
+      old_report = json.load(file)
+    with open(args.compare[1]) as file:
+      new_report = json.load(file)
+    compare_report(old_report, new_report)
+    return
+
+  setting = {}
+  for name in ("gate_num", "fan_out", "obstacle_density", "unit_dimention"):
+    if getattr(args, name) is not None:
+      setting[name] = getattr(args, name)
+  report = run_benchmark(args.scale, args.mode, args.seed, args.search_mode, args.storage, not args.no_memory, **setting)
+  if args.output:
+    with open(args.output, "w") as file:
+      json.dump(report, file, indent=2)
+    print(f"Report written to {args.output}")
+
+
+if __name__ == "__main__":
+  main()
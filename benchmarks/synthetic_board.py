@@ -0,0 +1,152 @@
+"""
+Synthetic Board
+Seeded random boards for routing benchmarks, the same seed and settings always give the same board
+  Gates are rows of ports at port_height above the ground, ports point down like the ports of a logic gate
+  Obstacles are boxes standing on the ground, kept away from the columns under the ports
+  Nets connect one port of a gate to fan_out ports of other gates
+Everything is made in real world coordinates (mm) and then snapped to the grid with unit_dimention,
+the same way PipeSystem snaps port tips, so one board can be routed at several unit_dimention
+"""
+
+import math
+import random
+
+
+
+
+# preset boards, any setting can be changed on top of a preset, see make_board
+SCALE_DICT = {
+  "small": {"board_size": (60, 60), "gate_num": 4, "port_per_gate": 3, "fan_out": 2, "obstacle_density": .05, "unit_dimention": 3},
+  "medium": {"board_size": (120, 120), "gate_num": 10, "port_per_gate": 4, "fan_out": 3, "obstacle_density": .1, "unit_dimention": 3},
+  "large": {"board_size": (240, 240), "gate_num": 24, "port_per_gate": 4, "fan_out": 3, "obstacle_density": .15, "unit_dimention": 3},
+}
+
+# settings that are the same for every scale
+PORT_HEIGHT = 20
+PORT_PITCH = 6
+TIP_LENGTH = 4
+OBSTACLE_SIZE = (6, 18)
+OBSTACLE_HEIGHT = (3, 12)
+
+
+
+
+# return {"setting", "dimention", "obstacle_list", "net_list", "connection_list", "dropped_port_num"}
+#   dimention is the grid dimention for Grid
+#   obstacle_list is [grid_coord]
+#   net_list is [[driver_tip, sink_tip, ...]] in grid coords, connection_list is [(driver_tip, sink_tip)]
+def make_board(seed=0, scale="small", **setting):
+  """
+  Top level function
+  Use this to get a board to route
+  settings not given are taken from SCALE_DICT[scale]
+  """
+  setting = dict(SCALE_DICT[scale], **setting)
+  setting["seed"] = seed
+  setting["scale"] = scale
+  rng = random.Random(seed)
+  unit = setting["unit_dimention"]
+  size_x, size_y = setting["board_size"]
+
+  port_list = make_port_list(rng, setting)
+  # port tips snapped to the grid, ports that snap onto an earlier tip are dropped
+  # {port_coord : tip grid coord}
+  tip_dict = {}
+  used_tip = set()
+  for port in port_list:
+    tip = (round(port[0]/unit), round(port[1]/unit), math.floor((port[2]-TIP_LENGTH)/unit))
+    if tip in used_tip or tip[2] < 1:
+      continue
+    used_tip.add(tip)
+    tip_dict[port] = tip
+
+  dimention = (math.ceil(size_x/unit), math.ceil(size_y/unit), math.ceil(PORT_HEIGHT/unit))
+  obstacle_list = make_obstacle_list(rng, setting, dimention, used_tip)
+  net_list = make_net_list(rng, setting, port_list, tip_dict)
+  connection_list = [(net[0], sink) for net in net_list for sink in net[1:]]
+
+  return {
+    "setting": setting,
+    "dimention": dimention,
+    "obstacle_list": obstacle_list,
+    "net_list": net_list,
+    "connection_list": connection_list,
+    "dropped_port_num": len(port_list) - len(tip_dict),
+  }
+
+
+# gates are placed at random spots that keep a margin to each other
+# return [port_coord], ports of one gate are next to each other
+def make_port_list(rng, setting):
+  """Helper Function"""
+  size_x, size_y = setting["board_size"]
+  gate_length = PORT_PITCH * setting["port_per_gate"]
+  gate_list = []
+  for _ in range(setting["gate_num"]):
+    # give up on a gate that doesn't fit after enough tries
+    for _ in range(100):
+      x = rng.uniform(PORT_PITCH, size_x - gate_length - PORT_PITCH)
+      y = rng.uniform(PORT_PITCH, size_y - PORT_PITCH)
+      if all(abs(x - other_x) > gate_length + PORT_PITCH or abs(y - other_y) > 2*PORT_PITCH for other_x, other_y in gate_list):
+        gate_list.append((x, y))
+        break
+
+  port_list = []
+  for x, y in gate_list:
+    for i in range(setting["port_per_gate"]):
+      port_list.append((round(x + i*PORT_PITCH, 2), round(y, 2), PORT_HEIGHT))
+  return port_list
+
+
+# boxes standing on the ground until obstacle_density of the ground is covered
+# columns under port tips and their neighbors stay free, so every tip can reach the ground
+# return [grid_coord]
+def make_obstacle_list(rng, setting, dimention, used_tip):
+  """Helper Function"""
+  unit = setting["unit_dimention"]
+  keep_free = set()
+  for x, y, _ in used_tip:
+    for dx in (-1, 0, 1):
+      for dy in (-1, 0, 1):
+        keep_free.add((x + dx, y + dy))
+
+  ground_num = (dimention[0]+1) * (dimention[1]+1)
+  covered = set()
+  obstacle_set = set()
+  # a box can be fully inside keep_free, so the number of tries is bounded
+  for _ in range(1000):
+    if len(covered) >= setting["obstacle_density"] * ground_num:
+      break
+    width = rng.uniform(*OBSTACLE_SIZE) / unit
+    depth = rng.uniform(*OBSTACLE_SIZE) / unit
+    height = max(1, round(rng.uniform(*OBSTACLE_HEIGHT) / unit))
+    x0 = rng.randint(0, dimention[0])
+    y0 = rng.randint(0, dimention[1])
+    for x in range(x0, min(dimention[0], x0 + round(width)) + 1):
+      for y in range(y0, min(dimention[1], y0 + round(depth)) + 1):
+        if (x, y) in keep_free:
+          continue
+        covered.add((x, y))
+        for z in range(min(height, dimention[2]) + 1):
+          obstacle_set.add((x, y, z))
+  return sorted(obstacle_set)
+
+
+# each net drives fan_out ports from one port, at most one port of the driving gate is used
+# return [[driver_tip, sink_tip, ...]]
+def make_net_list(rng, setting, port_list, tip_dict):
+  """Helper Function"""
+  free_port_list = [port for port in port_list if port in tip_dict]
+  rng.shuffle(free_port_list)
+  net_list = []
+  while len(free_port_list) >= 2:
+    driver = free_port_list.pop()
+    sink_num = rng.randint(1, setting["fan_out"])
+    # sinks on other gates, ports of one gate share y
+    sink_list = [port for port in free_port_list if port[1] != driver[1]][:sink_num]
+    if not sink_list:
+      continue
+    for sink in sink_list:
+      free_port_list.remove(sink)
+    net_list.append([tip_dict[driver]] + [tip_dict[sink] for sink in sink_list])
+  return net_list
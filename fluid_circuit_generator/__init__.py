@@ -5,13 +5,18 @@ Import all the modules
 Have Info of the Addon
 """
 
-import bpy
+try:
+  import bpy
+except ImportError:
+  # routing runs without Blender (parallel routing workers, route_cli.py), only the routing modules are loaded
+  bpy = None
 
 import fluid_circuit_generator.path_finding
 import fluid_circuit_generator.pipe_system
-import fluid_circuit_generator.import_gate
-import fluid_circuit_generator.gate_assembly
-import fluid_circuit_generator.ui_component
+if bpy is not None:
+  import fluid_circuit_generator.import_gate
+  import fluid_circuit_generator.gate_assembly
+  import fluid_circuit_generator.ui_component
 
 
 bl_info = {
@@ -0,0 +1,234 @@
+"""
+Disk Cache
+Content addressed cache on disk, entries are files named by the hash of their key
+  DiskCache: bytes in, bytes out, size bounded, least recently used entries are removed first
+  RoutingCache: routing results of a PipeSystem stored as json
+  OccupancyCache: voxelized obstacles stored as compressed bit arrays
+Nothing in here needs Blender
+"""
+
+import io
+import os
+import json
+import hashlib
+import tempfile
+import numpy as np
+
+
+# bump when the routing changes, old entries then never match again
+ROUTING_CACHE_VERSION = 1
+# bump when the voxelizer changes
+OCCUPANCY_CACHE_VERSION = 1
+
+CACHE_DIR = os.path.join(os.path.dirname(os.path.realpath(__file__)), "Routing_Cache")
+
+
+
+
+# hash of any json serializable key, tuples are written as lists
+def get_key_hash(key):
+  """Helper Function"""
+  key_string = json.dumps(key, sort_keys=True, separators=(",", ":"))
+  return hashlib.sha256(key_string.encode("utf-8")).hexdigest()
+
+
+
+
+class DiskCache:
+  """
+  DiskCache object
+  One file per entry in cache_dir, named <key hash><suffix>
+  The modification time of a file is its last use, a hit touches the file
+  """
+
+  def __init__(self, cache_dir=CACHE_DIR, max_size=64*1024*1024, suffix=".cache"):
+    self.cache_dir = cache_dir
+    # bytes, entries are removed oldest first when the cache grows over this
+    self.max_size = max_size
+    self.suffix = suffix
+
+
+  # return stored bytes, None on a miss
+  def get(self, key_hash):
+    """Top level function"""
+    file_path = self.get_file_path(key_hash)
+    try:
+      with open(file_path, "rb") as file:
+        data = file.read()
+      os.utime(file_path)
+    except OSError:
+      return None
+    return data
+
+  # store bytes, then evict down to max_size
+  # return False if the cache directory can't be written
+  def put(self, key_hash, data):
+    """Top level function"""
+    try:
+      os.makedirs(self.cache_dir, exist_ok=True)
+      # write to a temporary file first, a half written entry is never read
+      file_handle, temp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+      with os.fdopen(file_handle, "wb") as file:
+        file.write(data)
+      os.replace(temp_path, self.get_file_path(key_hash))
+    except OSError as e:
+      print(f"Cache write failed: {e}")
+      return False
+    self.evict()
+    return True
+
+  # remove every entry
+  # return number of entries removed
+  def clear(self):
+    """Top level function"""
+    entry_list = self.get_entry_list()
+    for file_path, _, _ in entry_list:
+      try:
+        os.remove(file_path)
+      except OSError:
+        pass
+    print(f"Cache {self.cache_dir} cleared, {len(entry_list)} entries removed")
+    return len(entry_list)
+
+
+  # remove least recently used entries until the total size fits max_size
+  # the newest entry is always kept
+  def evict(self):
+    """Helper Function"""
+    entry_list = sorted(self.get_entry_list(), key=lambda entry: entry[1])
+    total_size = sum(entry[2] for entry in entry_list)
+    for file_path, _, size in entry_list[:-1]:
+      if total_size <= self.max_size:
+        break
+      try:
+        os.remove(file_path)
+      except OSError:
+        continue
+      total_size -= size
+      print(f"Cache evicted {file_path}")
+
+  # return [(file_path, last use, size)]
+  def get_entry_list(self):
+    """Helper Function"""
+    entry_list = []
+    try:
+      name_list = os.listdir(self.cache_dir)
+    except OSError:
+      return entry_list
+    for name in name_list:
+      if not name.endswith(self.suffix):
+        continue
+      file_path = os.path.join(self.cache_dir, name)
+      try:
+        stat = os.stat(file_path)
+      except OSError:
+        continue
+      entry_list.append((file_path, stat.st_mtime, stat.st_size))
+    return entry_list
+
+  def get_file_path(self, key_hash):
+    """Helper Function"""
+    return os.path.join(self.cache_dir, key_hash + self.suffix)
+
+
+
+
+class RoutingCache:
+  """
+  RoutingCache object
+  Stores connection_dict, junction_dict and port_dict of a PipeSystem after fetch_grid_data
+  The key is everything routing depends on, see GateAssembly.get_routing_key
+  """
+
+  def __init__(self, cache_dir=CACHE_DIR, max_size=64*1024*1024):
+    self.disk_cache = DiskCache(cache_dir, max_size, ".json")
+
+
+  # return {"connection_dict", "junction_dict", "port_dict"}, None on a miss
+  def load(self, key):
+    """Top level function"""
+    key_hash = get_key_hash([ROUTING_CACHE_VERSION, key])
+    data = self.disk_cache.get(key_hash)
+    if data is None:
+      print(f"Routing cache miss {key_hash}")
+      return None
+    try:
+      value = json.loads(data.decode("utf-8"))
+      result = {
+        "connection_dict": {to_coord_tuple(key): to_coord_list(path) for key, path in value["connection_dict"]},
+        "junction_dict": {tuple(coord): to_coord_list(connection) for coord, connection in value["junction_dict"]},
+        "port_dict": {tuple(coord): to_coord_list(port) for coord, port in value["port_dict"]},
+      }
+    except (ValueError, KeyError, TypeError) as e:
+      print(f"Routing cache entry {key_hash} is broken: {e}")
+      return None
+    print(f"Routing cache hit {key_hash}")
+    return result
+
+  # store a routing result, see load
+  def save(self, key, result):
+    """Top level function"""
+    key_hash = get_key_hash([ROUTING_CACHE_VERSION, key])
+    # json has no tuple keys, dicts are stored as [[key, value]]
+    value = {name: [[key, value] for key, value in result[name].items()]
+      for name in ("connection_dict", "junction_dict", "port_dict")}
+    if self.disk_cache.put(key_hash, json.dumps(value).encode("utf-8")):
+      print(f"Routing cache saved {key_hash}")
+
+  def clear(self):
+    """Top level function"""
+    return self.disk_cache.clear()
+
+
+
+class OccupancyCache:
+  """
+  OccupancyCache object
+  Stores the occupancy window of one obstacle object, see voxelizer.get_window_occupancy
+  The key is everything the occupancy depends on, see GateAssembly.get_object_occupancy
+  Entries share the folder of RoutingCache but are evicted on their own
+  """
+
+  def __init__(self, cache_dir=CACHE_DIR, max_size=256*1024*1024):
+    self.disk_cache = DiskCache(cache_dir, max_size, ".npz")
+
+
+  # return (window low corner grid coord, bool array of the window), None on a miss
+  def load(self, key):
+    """Top level function"""
+    key_hash = get_key_hash([OCCUPANCY_CACHE_VERSION, key])
+    data = self.disk_cache.get(key_hash)
+    if data is None:
+      return None
+    try:
+      with np.load(io.BytesIO(data)) as value:
+        low = value["low"]
+        shape = tuple(int(a) for a in value["shape"])
+        occupancy = np.unpackbits(value["bits"], count=int(np.prod(shape))).reshape(shape).astype(bool)
+    except (ValueError, KeyError, OSError) as e:
+      print(f"Occupancy cache entry {key_hash} is broken: {e}")
+      return None
+    return low, occupancy
+
+  # store an occupancy window, 8 nodes per byte and compressed
+  def save(self, key, low, occupancy):
+    """Top level function"""
+    key_hash = get_key_hash([OCCUPANCY_CACHE_VERSION, key])
+    buffer = io.BytesIO()
+    np.savez_compressed(buffer, low=np.asarray(low, dtype=np.int64), shape=np.array(occupancy.shape, dtype=np.int64),
+      bits=np.packbits(occupancy, axis=None))
+    return self.disk_cache.put(key_hash, buffer.getvalue())
+
+  def clear(self):
+    """Top level function"""
+    return self.disk_cache.clear()
+
+
+
+def to_coord_tuple(coord_list):
+  """Helper Function"""
+  return tuple(tuple(coord) for coord in coord_list)
+
+def to_coord_list(coord_list):
+  """Helper Function"""
+  return [tuple(coord) for coord in coord_list]
@@ -8,6 +8,7 @@ Keeps track of gates, connections, and check for duplicates
 import json
 import os
 import sys
+import hashlib
 import importlib.util
 from math import sin, cos, acos, pi
 import numpy as np
@@ -26,6 +27,8 @@ import mathutils
 
 import fluid_circuit_generator.pipe_system as pipe_system
 import fluid_circuit_generator.import_gate as import_gate
+import fluid_circuit_generator.disk_cache as disk_cache
+import fluid_circuit_generator.voxelizer as voxelizer
 
 
 
@@ -39,6 +42,9 @@ class GateAssembly:
   stage_margin = .5
   tip_offset = 5
   unit_dimention = 1
+  # how obstacles are voxelized, "WINDING", "RAY" or "REMESH", see voxelizer.py
+  # "REMESH" is the old check_coord_in_object, only for broken meshes the other two get wrong
+  obstacle_mode = "WINDING"
 
 
   def __init__(self):
@@ -58,6 +64,30 @@ class GateAssembly:
     self.connection_group_list = []
     # list of bpy objects that could potentially be blocking pipe generation
     self.obstacle_list = []
+    # hash of obstacle geometry, part of the routing cache key
+    self.obstacle_hash = None
+    # hash of each obstacle object of this build, every mesh is only evaluated once per build
+    # {object name : object hash}
+    self.object_hash_dict = {}
+    # obstacles are only voxelized when routing is not found in the cache
+    self.obstacle_registered = False
+    # routing results of designs made before, see disk_cache.py
+    self.routing_cache = disk_cache.RoutingCache()
+    # occupancy of obstacle objects voxelized before, see disk_cache.py
+    self.occupancy_cache = disk_cache.OccupancyCache()
+    # occupancy cache is only used when the routing cache is, see make_connections
+    self.use_occupancy_cache = True
+    # key of the current routing, None if the cache is not used
+    self.routing_key = None
+    # routing of the last build, kept for incremental routing, see PipeSystem.connect_port_list_incremental
+    # {"setting", "routed_group_list", "port_dict"}
+    self.routing_session = None
+    # occupancy window of each obstacle object of the last build, see get_object_occupancy
+    # {(object hash, grid_dimention, unit_dimention, obstacle_mode) : (window low corner, bool window array)}
+    self.obstacle_occupancy_dict = {}
+    # world space triangles and their BVH of each obstacle object, reused while the object does not change
+    # {object hash : (triangle array, voxelizer.TriangleBVH)}
+    self.obstacle_bvh_dict = {}
 
     # stores user related error messages
     self.error_message_list = []
@@ -67,6 +97,15 @@ class GateAssembly:
 
 
 
+  # start a new build of the design
+  # keeps the routing session, obstacle occupancy, obstacle BVHs and caches, so only the changes are routed again
+  def reset_design(self):
+    """Call this function before adding gates of a new build"""
+    keep = (self.routing_session, self.obstacle_occupancy_dict, self.obstacle_bvh_dict, self.routing_cache, self.occupancy_cache)
+    self.__init__()
+    self.routing_session, self.obstacle_occupancy_dict, self.obstacle_bvh_dict, self.routing_cache, self.occupancy_cache = keep
+
+
   def add_gate(self, name, stl_path):
     """Add logic gate"""
     new_gate = import_gate.LogicGate(name, stl_path)
@@ -82,11 +121,13 @@ class GateAssembly:
     return port_coord
 
 
-  def prepare_for_connection(self, pipe_dimention=None, unit_dimention=1, tip_length=None, stage_height=1, stage_margin=.5, tip_offset=.1):
+  def prepare_for_connection(self, pipe_dimention=None, unit_dimention=1, tip_length=None, stage_height=1, stage_margin=.5, tip_offset=.1, search_mode=None, obstacle_mode=None):
     """
     Set grid to fit gate ports
     Check if ports are in valid position
     Get all obstacles
+    search_mode is "ASTAR", "JPS" or "HPA", None keeps the current one
+    obstacle_mode is "WINDING", "RAY" or "REMESH", None keeps the current one
     Call this function before making connections
     Don't make connection if this return False
     """
@@ -94,6 +135,8 @@ class GateAssembly:
     self.stage_margin = stage_margin
     self.tip_offset = tip_offset
     self.unit_dimention = unit_dimention
+    if obstacle_mode is not None:
+      self.obstacle_mode = obstacle_mode
 
     max_real_dimention = (0,0,0)
     is_port_valid = True  # within valid dimensions
@@ -107,14 +150,81 @@ class GateAssembly:
 
     max_grid_dimention = tuple(map(lambda x: int(x//unit_dimention)+1, max_real_dimention))
     self.obstacle_list = self.get_obstacle_objects()
-    obstacles_world = self.get_obstacle_coord(self.obstacle_list, max_grid_dimention, unit_dimention, pipe_dimention)
-    obstacles = list(map(lambda coord: (coord[0]//unit_dimention, coord[1]//unit_dimention, coord[2]//unit_dimention), obstacles_world))
-    print("Registering obstacles:\n", obstacles)
-    self.pipe_system.reset_grid(max_grid_dimention, pipe_dimention, unit_dimention, tip_length, obstacles)
+    self.object_hash_dict = {obj.name: self.get_object_hash(obj) for obj in self.obstacle_list}
+    self.obstacle_hash = self.get_obstacle_hash(self.object_hash_dict)
+    # obstacles are added in make_connections, routing found in the cache does not need them
+    self.pipe_system.reset_grid(max_grid_dimention, pipe_dimention, unit_dimention, tip_length, [], search_mode)
+    self.obstacle_registered = False
 
     return is_port_valid
 
 
+  # voxelize obstacles and add them to the grid, only done once after prepare_for_connection
+  # obstacle objects that did not change since the last build are not voxelized again,
+  # the ones voxelized in an earlier session are read from the occupancy cache
+  def register_obstacles(self):
+    """Helper Function"""
+    if self.obstacle_registered:
+      return
+    unit_dimention = self.unit_dimention
+    grid_dimention = self.pipe_system.grid_dimention
+    obstacle_occupancy_dict = {}
+    object_hash_set = set()
+    for obj in self.obstacle_list:
+      object_hash = self.object_hash_dict[obj.name]
+      object_hash_set.add(object_hash)
+      key = (object_hash, grid_dimention, unit_dimention, self.obstacle_mode)
+      if key not in self.obstacle_occupancy_dict:
+        self.obstacle_occupancy_dict[key] = self.get_object_occupancy(obj, grid_dimention, unit_dimention, object_hash)
+      else:
+        print(f"Obstacle {obj.name} did not change, voxelization skipped")
+      obstacle_occupancy_dict[key] = self.obstacle_occupancy_dict[key]
+    # only objects of this build are kept
+    self.obstacle_occupancy_dict = obstacle_occupancy_dict
+    self.obstacle_bvh_dict = {object_hash: value for object_hash, value in self.obstacle_bvh_dict.items() if object_hash in object_hash_set}
+
+    # windows go into the obstacle layer of the grid as whole blocks
+    obstacle_num = 0
+    for low, window_occupancy in obstacle_occupancy_dict.values():
+      if window_occupancy is not None:
+        obstacle_num += self.pipe_system.grid.add_obstacle_occupancy(window_occupancy, low)
+    print(f"Registered {obstacle_num} obstacle nodes")
+    self.obstacle_registered = True
+
+
+  # hash of everything get_obstacle_coord depends on besides the grid settings
+  # much cheaper than get_obstacle_coord, so a cached routing can skip the voxelization
+  # object_hash_dict is {object name : object hash}, see get_object_hash
+  def get_obstacle_hash(self, object_hash_dict):
+    """Helper Function"""
+    obstacle_hash = hashlib.sha256()
+    for name in sorted(object_hash_dict):
+      obstacle_hash.update(object_hash_dict[name].encode("utf-8"))
+    return obstacle_hash.hexdigest()
+
+  # hash of the world space geometry of one obstacle object
+  # vertices and triangles of the mesh with modifiers applied, so it also keys the occupancy cache on disk
+  def get_object_hash(self, obj):
+    """Helper Function"""
+    object_hash = hashlib.sha256()
+    object_hash.update(obj.type.encode("utf-8"))
+    object_hash.update(np.array(obj.matrix_world, dtype=np.float64).tobytes())
+    eval_obj = obj.evaluated_get(bpy.context.evaluated_depsgraph_get())
+    mesh = eval_obj.to_mesh()
+    if mesh is not None:
+      try:
+        mesh.calc_loop_triangles()
+        vertex_array = np.empty(len(mesh.vertices)*3, dtype=np.float32)
+        mesh.vertices.foreach_get("co", vertex_array)
+        triangle_index = np.empty(len(mesh.loop_triangles)*3, dtype=np.int32)
+        mesh.loop_triangles.foreach_get("vertices", triangle_index)
+      finally:
+        eval_obj.to_mesh_clear()
+      object_hash.update(vertex_array.tobytes())
+      object_hash.update(triangle_index.tobytes())
+    return object_hash.hexdigest()
+
+
 
   def get_obstacle_objects(self):
     ingore_names = ["Test Tube", "Test Stage", "Test Tip", "Current Selection"]
@@ -133,21 +243,105 @@ class GateAssembly:
     return coords that are covered by obstacle in world space
     """
     print("IN FUNC Obstacle Object List:\n", obstacle_list)
+    occupancy = self.get_obstacle_occupancy(obstacle_list, max_grid_dimention, unit_dimention)
+    return [tuple(int(a)*unit_dimention for a in coord) for coord in np.argwhere(occupancy)]
 
-    # collision_radius = unit_dimention/2 - pipe_dimention[1] # half unit - outer dimension
-    collision_radius = unit_dimention/2
-    # collision_radius = 2
-    collision_list = []
-    coord_list = []
-    for x in range(max_grid_dimention[0]+1):
-      for y in range(max_grid_dimention[1]+1):
-        for z in range(max_grid_dimention[2]+1):
-          coord = (x*unit_dimention, y*unit_dimention, z*unit_dimention)
-          coord_list.append(coord)
+
+  # occupancy of every grid coord, a coord is taken when inside an obstacle or closer than half a unit to it
+  # each obstacle only voxelizes the window of its bounding box and is merged into one occupancy layer
+  # return bool array indexed [x, y, z] of shape max_grid_dimention+1
+  def get_obstacle_occupancy(self, obstacle_list, max_grid_dimention, unit_dimention):
+    """Helper Function"""
+    occupancy = np.zeros(tuple(d+1 for d in max_grid_dimention), dtype=bool)
     for obj in obstacle_list:
-      this_collision = self.check_coord_in_object(coord_list, obj, collision_radius)
-      collision_list.extend(this_collision)
-    return collision_list
+      low, window_occupancy = self.get_object_occupancy(obj, max_grid_dimention, unit_dimention)
+      if window_occupancy is None:
+        continue
+      high = low + window_occupancy.shape
+      occupancy[low[0]:high[0], low[1]:high[1], low[2]:high[2]] |= window_occupancy
+    return occupancy
+
+
+  # occupancy of the window of the grid one obstacle object can reach, with the current obstacle_mode
+  # the whole object is voxelized and cut to the grid, so the occupancy cache entry fits any grid size
+  # the BVH of an object is kept in obstacle_bvh_dict, so a new unit only voxelizes again
+  # return (window low corner grid coord, bool array of the window), (None, None) when the object is outside the grid
+  def get_object_occupancy(self, obj, max_grid_dimention, unit_dimention, object_hash=None):
+    """Helper Function"""
+    if object_hash is None:
+      object_hash = self.get_object_hash(obj)
+    cache_key = {
+      "object": object_hash,
+      "unit_dimention": unit_dimention,
+      "collision_radius": unit_dimention/2,
+      "obstacle_mode": self.obstacle_mode,
+    }
+    if self.use_occupancy_cache:
+      cached = self.occupancy_cache.load(cache_key)
+      if cached is not None:
+        print(f"Obstacle {obj.name} read from occupancy cache")
+        return voxelizer.crop_window(*cached, max_grid_dimention)
+
+    low, window_occupancy = self.voxelize_object(obj, unit_dimention, object_hash)
+    if self.use_occupancy_cache:
+      if window_occupancy is None:
+        self.occupancy_cache.save(cache_key, np.zeros(3, dtype=np.int64), np.zeros((0, 0, 0), dtype=bool))
+      else:
+        self.occupancy_cache.save(cache_key, low, window_occupancy)
+    return voxelizer.crop_window(low, window_occupancy, max_grid_dimention)
+
+  # occupancy window of a whole object, only cut at 0
+  def voxelize_object(self, obj, unit_dimention, object_hash):
+    """Helper Function"""
+    collision_radius = unit_dimention/2
+    if object_hash in self.obstacle_bvh_dict:
+      triangle_array, bvh = self.obstacle_bvh_dict[object_hash]
+    else:
+      triangle_array, bvh = self.get_object_triangles(obj), None
+
+    if self.obstacle_mode == "REMESH":
+      return self.get_object_occupancy_remesh(obj, triangle_array, None, unit_dimention)
+    if self.obstacle_mode == "WINDING" and bvh is None:
+      bvh = voxelizer.TriangleBVH(triangle_array)
+      self.obstacle_bvh_dict[object_hash] = (triangle_array, bvh)
+    return voxelizer.get_window_occupancy(triangle_array, None, unit_dimention, collision_radius, self.obstacle_mode, bvh)
+
+  # fallback for meshes the voxelizer gets wrong, remesh and check every coord of the object window in Blender
+  def get_object_occupancy_remesh(self, obj, triangle_array, max_grid_dimention, unit_dimention):
+    """Helper Function"""
+    collision_radius = unit_dimention/2
+    window = voxelizer.get_window(triangle_array, max_grid_dimention, unit_dimention, collision_radius)
+    if window is None:
+      return None, None
+    low, high = window
+    shape = tuple(high - low + 1)
+    window_occupancy = np.zeros(shape, dtype=bool)
+    coord_list = [tuple(float(a) for a in coord) for coord in (np.argwhere(np.ones(shape, dtype=bool)) + low) * unit_dimention]
+    for coord in self.check_coord_in_object(coord_list, obj, collision_radius):
+      window_occupancy[tuple(round(a/unit_dimention) - l for a, l in zip(coord, low))] = True
+    return low, window_occupancy
+
+
+  # world space triangles of an object with its modifiers applied, read in one go with foreach_get
+  # return float array (n, 3, 3), empty for objects without geometry
+  def get_object_triangles(self, obj):
+    """Helper Function"""
+    depsgraph = bpy.context.evaluated_depsgraph_get()
+    eval_obj = obj.evaluated_get(depsgraph)
+    mesh = eval_obj.to_mesh()
+    if mesh is None:
+      return np.zeros((0, 3, 3))
+    try:
+      mesh.calc_loop_triangles()
+      vertex_array = np.empty(len(mesh.vertices)*3, dtype=np.float32)
+      mesh.vertices.foreach_get("co", vertex_array)
+      triangle_index = np.empty(len(mesh.loop_triangles)*3, dtype=np.int32)
+      mesh.loop_triangles.foreach_get("vertices", triangle_index)
+    finally:
+      eval_obj.to_mesh_clear()
+    matrix = np.array(eval_obj.matrix_world, dtype=np.float64)
+    vertex_array = vertex_array.reshape(-1, 3).astype(np.float64) @ matrix[:3, :3].T + matrix[:3, 3]
+    return vertex_array[triangle_index.reshape(-1, 3)]
 
 
   def check_coord_in_object(self, coord_list, obj, dist=0):
@@ -260,14 +454,101 @@ class GateAssembly:
       return None
 
 
-  def make_connections(self):
+  def make_connections(self, parallel=False, worker_num=None, negotiated=False, steiner=False, use_cache=True, incremental=True):
     """
     Wraper function
     Make all the connections after adding all of them
+    failed connections are retried by ripping up paths in their way
+    parallel routes independent connection groups in worker processes
+    negotiated routes all connections together with negotiated congestion
+    steiner routes each group in connection_group_list as one tree
+    use_cache takes the routing of the same design from the routing cache, saved by update_connection_dict,
+      and obstacles voxelized before from the occupancy cache
+    incremental keeps the paths of the last build that the changes did not touch, only for one by one routing
     """
     self.pipe_system.to_connect_list = self.to_connect_list[:]
-    for connection in self.to_connect_list:
-      self.pipe_system.connect_two_port(connection[0], connection[1])
+    port_group_list = []
+    if steiner:
+      for group in self.connection_group_list:
+        port_group_list.append([self.get_gate_port_coord(gate_name, port_name) for gate_name, port_name in group])
+
+    self.routing_key = None
+    self.use_occupancy_cache = use_cache
+    if use_cache:
+      self.routing_key = self.get_routing_key(parallel, negotiated, steiner, port_group_list)
+      result = self.routing_cache.load(self.routing_key)
+      if result is not None:
+        self.pipe_system.load_routing_result(result)
+        return
+
+    self.register_obstacles()
+    setting = self.get_routing_setting(parallel, negotiated, steiner)
+    session = self.routing_session
+    if incremental and session is not None and session["setting"] == setting and setting["routing_mode"] == "SEQUENTIAL":
+      self.pipe_system.connect_port_list_incremental(self.to_connect_list, session)
+    elif steiner:
+      self.pipe_system.connect_port_group_list(self.to_connect_list, port_group_list)
+    else:
+      self.pipe_system.connect_port_list(self.to_connect_list, parallel, worker_num, negotiated)
+    self.routing_session = self.pipe_system.get_routing_state()
+    self.routing_session["setting"] = setting
+
+
+  # everything the routing result depends on
+  # port coords, connection order, grid and tip settings, routing mode and obstacle geometry
+  def get_routing_key(self, parallel, negotiated, steiner, port_group_list):
+    """Helper Function"""
+    def to_list(coord):
+      return None if coord is None else [float(a) for a in coord]
+
+    routing_key = self.get_routing_setting(parallel, negotiated, steiner)
+    routing_key.update({
+      "to_connect_list": [[to_list(start), to_list(end)] for start, end in self.to_connect_list],
+      "port_group_list": [[to_list(coord) for coord in group] for group in port_group_list],
+      "grid_dimention": list(self.pipe_system.grid_dimention),
+      "obstacle": self.obstacle_hash,
+      "obstacle_mode": self.obstacle_mode,
+    })
+    return routing_key
+
+  # settings that have to match for paths of one build to be kept in the next
+  def get_routing_setting(self, parallel, negotiated, steiner):
+    """Helper Function"""
+    pipe = self.pipe_system
+    if steiner:
+      routing_mode = "STEINER"
+    elif negotiated:
+      routing_mode = "NEGOTIATED"
+    elif parallel:
+      routing_mode = "PARALLEL"
+    else:
+      routing_mode = "SEQUENTIAL"
+    return {
+      "unit_dimention": pipe.unit_dimention,
+      "tip_length": pipe.tip_length,
+      "search_mode": pipe.search_mode,
+      "bidirectional_ground_path": pipe.bidirectional_ground_path,
+      "rip_up": [pipe.rip_up_max_iteration, pipe.rip_up_max_time],
+      "routing_mode": routing_mode,
+    }
+
+  # save the routing of make_connections, routings with errors are not saved so they are tried again
+  def save_routing_result(self):
+    """Helper Function"""
+    pipe = self.pipe_system
+    if self.routing_key is None or pipe.routing_loaded:
+      return
+    if pipe.error_message_list or pipe.grid.error_message_list:
+      print("Routing has errors, not saved to routing cache")
+      return
+    self.routing_cache.save(self.routing_key, pipe.get_routing_result())
+
+  # remove every saved routing and obstacle occupancy
+  # return number of routings removed
+  def clear_routing_cache(self):
+    """Top level function"""
+    self.occupancy_cache.clear()
+    return self.routing_cache.clear()
 
 
 
@@ -275,6 +556,7 @@ class GateAssembly:
   def update_connection_dict(self):
     """Load connection info from pipe_system and logic_gate into connection_dict with propagation delay"""
     self.pipe_system.finish_up_everything()
+    self.save_routing_result()
     # get connection from pipe_system.connection_graph
     for key,value in self.pipe_system.connection_graph.items():
       connection_list = []
@@ -0,0 +1,136 @@
+"""
+Grid Storage
+Layers holding one value per grid node, addressed by the flat node index of the Grid
+"DENSE" layers are plain numpy arrays
+"CHUNKED" layers only make the blocks of nodes that are written to
+"""
+
+import array
+import numpy as np
+
+# array typecode of each dtype used by the Grid
+TYPECODE = {
+  np.dtype(np.float64): "d",
+  np.dtype(np.int64): "q",
+  np.dtype(np.int32): "i",
+  np.dtype(np.uint32): "I",
+  np.dtype(bool): "b",
+}
+
+
+
+
+class ChunkedLayer:
+  """
+  ChunkedLayer object
+  Stand in for a flat numpy layer of the Grid
+  Nodes are stored in cubes of 2**chunk_bit nodes per axis, a cube is made on its first write
+  Reading a node of a cube not made yet gives the default value
+  """
+
+  chunk_bit = 4
+
+  def __init__(self, shape, dtype, default=0):
+    self.shape = shape
+    self.dtype = np.dtype(dtype)
+    self.typecode = TYPECODE[self.dtype]
+    self.default = default
+    # flat index = x * stride[0] + y * stride[1] + z, same as Grid
+    self.stride = (shape[1] * shape[2], shape[2])
+    self.chunk_side = 1 << self.chunk_bit
+    self.chunk_mask = self.chunk_side - 1
+    self.chunk_length = self.chunk_side ** 3
+    # {(chunk_x, chunk_y, chunk_z) : array of chunk_length values}
+    self.chunk_dict = {}
+
+
+  # chunk key and position inside the chunk of a flat index
+  def locate(self, index):
+    """Helper Function"""
+    x, rest = divmod(index, self.stride[0])
+    y, z = divmod(rest, self.stride[1])
+    bit, mask = self.chunk_bit, self.chunk_mask
+    key = (x >> bit, y >> bit, z >> bit)
+    offset = (((x & mask) << bit | (y & mask)) << bit) | (z & mask)
+    return key, offset
+
+  def __getitem__(self, index):
+    key, offset = self.locate(index)
+    chunk = self.chunk_dict.get(key)
+    if chunk is None:
+      return self.default
+    return chunk[offset]
+
+  def __setitem__(self, index, value):
+    key, offset = self.locate(index)
+    chunk = self.chunk_dict.get(key)
+    if chunk is None:
+      chunk = array.array(self.typecode, [self.default]) * self.chunk_length
+      self.chunk_dict[key] = chunk
+    chunk[offset] = value
+
+  # every node back to value, all chunks are dropped
+  def fill(self, value):
+    """Helper Function"""
+    self.chunk_dict.clear()
+    self.default = value
+
+  def copy(self):
+    """Helper Function"""
+    layer = ChunkedLayer(self.shape, self.dtype, self.default)
+    layer.chunk_dict = {key: array.array(self.typecode, chunk) for key, chunk in self.chunk_dict.items()}
+    return layer
+
+  # dense numpy copy of a box of nodes, box is a tuple of 3 slices
+  def get_box(self, box):
+    """Helper Function"""
+    low = [s.start or 0 for s in box]
+    high = [self.shape[i] if s.stop is None else s.stop for i, s in enumerate(box)]
+    result = np.full(tuple(h - l for l, h in zip(low, high)), self.default, dtype=self.dtype)
+    side = self.chunk_side
+    for key in self.chunk_dict.keys() & set(self.get_chunk_key_list(low, high)):
+      chunk = np.frombuffer(self.chunk_dict[key], dtype=self.dtype).reshape(side, side, side)
+      chunk_low = [k * side for k in key]
+      # overlap of box and chunk
+      overlap_low = [max(l, c) for l, c in zip(low, chunk_low)]
+      overlap_high = [min(h, c + side) for h, c in zip(high, chunk_low)]
+      result_slice = tuple(slice(ol - l, oh - l) for ol, oh, l in zip(overlap_low, overlap_high, low))
+      chunk_slice = tuple(slice(ol - c, oh - c) for ol, oh, c in zip(overlap_low, overlap_high, chunk_low))
+      result[result_slice] = chunk[chunk_slice]
+    return result
+
+  # write a dense numpy array into a box of nodes, box is a tuple of 3 slices
+  # chunks not made yet are only made if the values there are not all default
+  def set_box(self, box, value_array):
+    """Helper Function"""
+    low = [s.start or 0 for s in box]
+    high = [self.shape[i] if s.stop is None else s.stop for i, s in enumerate(box)]
+    value_array = np.asarray(value_array, dtype=self.dtype)
+    side = self.chunk_side
+    for key in self.get_chunk_key_list(low, high):
+      chunk_low = [k * side for k in key]
+      overlap_low = [max(l, c) for l, c in zip(low, chunk_low)]
+      overlap_high = [min(h, c + side) for h, c in zip(high, chunk_low)]
+      value_slice = tuple(slice(ol - l, oh - l) for ol, oh, l in zip(overlap_low, overlap_high, low))
+      chunk_slice = tuple(slice(ol - c, oh - c) for ol, oh, c in zip(overlap_low, overlap_high, chunk_low))
+      value = value_array[value_slice]
+      if key not in self.chunk_dict:
+        if np.all(value == self.default):
+          continue
+        self.chunk_dict[key] = array.array(self.typecode, [self.default]) * self.chunk_length
+      chunk = np.frombuffer(self.chunk_dict[key], dtype=self.dtype).reshape(side, side, side)
+      chunk[chunk_slice] = value
+
+  # keys of all chunks touching a box
+  def get_chunk_key_list(self, low, high):
+    """Helper Function"""
+    bit = self.chunk_bit
+    return [(x, y, z)
+      for x in range(low[0] >> bit, ((high[0] - 1) >> bit) + 1)
+      for y in range(low[1] >> bit, ((high[1] - 1) >> bit) + 1)
+      for z in range(low[2] >> bit, ((high[2] - 1) >> bit) + 1)]
+
+  @property
+  def nbytes(self):
+    """Memory used by the made chunks"""
+    return len(self.chunk_dict) * self.chunk_length * self.dtype.itemsize
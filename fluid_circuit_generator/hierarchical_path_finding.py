@@ -0,0 +1,496 @@
+"""
+Hierarchical Path Finding
+Cluster abstraction layered on a Grid (HPA* style) for large routing volumes
+Search between cluster entrances first, then refine the path inside each cluster
+"""
+
+import math
+import heapq
+import itertools
+import numpy as np
+
+import fluid_circuit_generator.path_finding as p
+
+
+
+
+class ClusterGraph:
+  """
+  ClusterGraph object
+  Created by a Grid in "HPA" search mode, reads the Grid arrays directly
+  The lattice is cut into clusters of cluster_size nodes
+  Each face between two clusters is cut into entrance_size tiles,
+  every tile with a free crossing gets one transition (a node pair across the face)
+  Faces, transitions and the cost between transitions of a cluster are computed when first needed
+  Clusters around nodes that change (paths saved / removed, obstacles, crossover cuts) are dropped
+  and computed again on the next search
+  Costs are the reduced step costs of Grid.bidirectional_path_finding, so they are never negative
+  and the local searches can be Dijkstra
+  """
+
+  def __init__(self, grid, cluster_size=(16,16,8), entrance_size=8):
+    self.grid = grid
+    self.cluster_size = cluster_size
+    self.entrance_size = entrance_size
+    # number of clusters along each axis
+    self.cluster_shape = tuple(-(-n // size) for n, size in zip(grid.shape, cluster_size))
+
+    # transitions on the face between cluster and the next cluster along axis
+    # {(cluster, axis) : [(node_index, twin_index)]}
+    self.face_transition = {}
+    # nodes across a face
+    # {node_index : {twin_index}}
+    self.twin_dict = {}
+    # transitions inside each cluster
+    # {cluster : [node_index]}
+    self.cluster_transition = {}
+    # reduced cost between transitions of a cluster, computed one node at a time
+    # {cluster : {node_index : {target_index : cost}}}
+    self.intra_edge = {}
+    # arrays for the local search of each cluster, see get_cluster_state
+    self.cluster_state = {}
+    # abstract nodes expanded / local searches run, for the last search and summed over all searches
+    self.search_count = {"abstract": 0, "local": 0}
+    self.total_search_count = {"abstract": 0, "local": 0}
+
+
+
+  ###########################################  clusters  ########################################
+
+  def get_cluster(self, index):
+    """Helper Function"""
+    coord = self.grid.get_coord(index)
+    return tuple(c // size for c, size in zip(coord, self.cluster_size))
+
+  # lowest and highest node coord inside a cluster
+  def get_cluster_bound(self, cluster):
+    """Helper Function"""
+    low = tuple(c * size for c, size in zip(cluster, self.cluster_size))
+    high = tuple(min(l + size, n) - 1 for l, size, n in zip(low, self.cluster_size, self.grid.shape))
+    return low, high
+
+  # clusters next to this one across a face
+  def get_face_list(self, cluster):
+    """Helper Function"""
+    face_list = []
+    for axis in range(3):
+      if cluster[axis] + 1 < self.cluster_shape[axis]:
+        face_list.append((cluster, axis))
+      if cluster[axis] > 0:
+        lower_cluster = tuple(c - (i == axis) for i, c in enumerate(cluster))
+        face_list.append((lower_cluster, axis))
+    return face_list
+
+
+  # find transitions across the face between cluster and the next cluster along axis
+  def get_face_transition(self, cluster, axis):
+    """Helper Function"""
+    face = (cluster, axis)
+    if face in self.face_transition:
+      return self.face_transition[face]
+
+    grid = self.grid
+    low, high = self.get_cluster_bound(cluster)
+    border = high[axis]
+    direction = p.DIRECTION_INDEX[tuple(int(i == axis) for i in range(3))]
+
+    # both layers of the face, 3D with the axis of size 2
+    face_box = [slice(l, h+1) for l, h in zip(low, high)]
+    face_box[axis] = slice(border, border+2)
+    face_box = tuple(face_box)
+    side = [slice(None)] * 3
+    side[axis] = 0
+    twin_side = list(side)
+    twin_side[axis] = 1
+    side, twin_side = tuple(side), tuple(twin_side)
+    free = (grid.get_layer_box(grid.occupied, face_box) == 0) & ~grid.get_layer_box(grid.obstacle, face_box)
+    blocked_mask = grid.get_layer_box(grid.blocked_mask, face_box)
+    # 2D over the other two axes
+    crossing = free[side] & free[twin_side] & ((blocked_mask[side] & p.NEIGHBOR_BIT[direction]) == 0)
+
+    other_axis = [i for i in range(3) if i != axis]
+    transition_list = []
+    for tile_u in range(0, crossing.shape[0], self.entrance_size):
+      for tile_v in range(0, crossing.shape[1], self.entrance_size):
+        tile = crossing[tile_u:tile_u+self.entrance_size, tile_v:tile_v+self.entrance_size]
+        if not tile.any():
+          continue
+        # free crossing closest to the middle of the tile
+        u_list, v_list = np.nonzero(tile)
+        center_u, center_v = (tile.shape[0]-1) / 2, (tile.shape[1]-1) / 2
+        best = np.argmin((u_list - center_u)**2 + (v_list - center_v)**2)
+        coord = [0, 0, 0]
+        coord[axis] = border
+        coord[other_axis[0]] = low[other_axis[0]] + tile_u + int(u_list[best])
+        coord[other_axis[1]] = low[other_axis[1]] + tile_v + int(v_list[best])
+        index = grid.get_index(coord)
+        twin_index = index + grid.neighbor_step[direction]
+        transition_list.append((index, twin_index))
+        self.twin_dict.setdefault(index, set()).add(twin_index)
+        self.twin_dict.setdefault(twin_index, set()).add(index)
+
+    self.face_transition[face] = transition_list
+    return transition_list
+
+  # all transitions on the faces of a cluster, on the cluster side
+  def get_cluster_transition(self, cluster):
+    """Helper Function"""
+    if cluster in self.cluster_transition:
+      return self.cluster_transition[cluster]
+    transition_set = set()
+    for face in self.get_face_list(cluster):
+      for index, twin_index in self.get_face_transition(*face):
+        transition_set.add(index if face[0] == cluster else twin_index)
+    self.cluster_transition[cluster] = sorted(transition_set)
+    return self.cluster_transition[cluster]
+
+  # reduced cost from a transition to the other transitions of its cluster
+  # computed for every transition of the cluster the first time one is asked for
+  def get_intra_edge(self, index):
+    """Helper Function"""
+    cluster = self.get_cluster(index)
+    if cluster not in self.intra_edge:
+      transition_list = self.get_cluster_transition(cluster)
+      distance_list = self.cluster_distance(cluster, transition_list, transition_list)
+      self.intra_edge[cluster] = dict(zip(transition_list, distance_list))
+    return self.intra_edge[cluster].get(index, {})
+
+
+
+  ###########################################  invalidation  ########################################
+
+  # drop everything computed around nodes that changed
+  # crossover cuts reach one node around a path, so the box around each node is dropped
+  def mark_dirty(self, coord_list):
+    """Helper Function"""
+    dirty_face = set()
+    dirty_cluster = set()
+    for coord in coord_list:
+      box_low = [max(c-1, 0) for c in coord]
+      box_high = [min(c+1, d) for c, d in zip(coord, self.grid.dimention)]
+      cluster_range = [range(l // size, h // size + 1) for l, h, size in zip(box_low, box_high, self.cluster_size)]
+      for cluster in itertools.product(*cluster_range):
+        dirty_cluster.add(cluster)
+        high = self.get_cluster_bound(cluster)[1]
+        for axis in range(3):
+          if cluster[axis] + 1 < self.cluster_shape[axis] and box_low[axis] <= high[axis] + 1 and box_high[axis] >= high[axis]:
+            dirty_face.add((cluster, axis))
+
+    for face in dirty_face:
+      self.drop_face(face)
+    for cluster in dirty_cluster:
+      self.intra_edge.pop(cluster, None)
+      self.cluster_state.pop(cluster, None)
+
+  # drop a face, its transitions and what was computed from them on both sides
+  def drop_face(self, face):
+    """Helper Function"""
+    if face not in self.face_transition:
+      return
+    for index, twin_index in self.face_transition.pop(face):
+      self.twin_dict[index].discard(twin_index)
+      self.twin_dict[twin_index].discard(index)
+    cluster, axis = face
+    next_cluster = tuple(c + (i == axis) for i, c in enumerate(cluster))
+    for side_cluster in (cluster, next_cluster):
+      self.cluster_transition.pop(side_cluster, None)
+      self.intra_edge.pop(side_cluster, None)
+
+  # start over, used when all crossovers are cut again
+  def mark_all_dirty(self):
+    """Helper Function"""
+    self.face_transition.clear()
+    self.twin_dict.clear()
+    self.cluster_transition.clear()
+    self.intra_edge.clear()
+    self.cluster_state.clear()
+
+
+
+  ###########################################  search  ########################################
+
+  # reduced step cost of from_index -> index, see Grid.bidirectional_path_finding
+  def get_reduced_cost(self, index, from_index):
+    """Helper Function"""
+    from_z = self.grid.get_coord(from_index)[2]
+    to_z = self.grid.get_coord(index)[2]
+    return self.grid.get_from_dis(index, from_index) + (.1 if from_z else 0) - (.1 if to_z else 0)
+
+  # arrays of one cluster for the local search, indexed by local node index
+  # open_mask : directions that stay in the cluster and are not cut by a crossover
+  # free : node is not ocupied and not an obstacle
+  # cost : reduced cost of each direction by local z
+  def get_cluster_state(self, cluster):
+    """Helper Function"""
+    if cluster in self.cluster_state:
+      return self.cluster_state[cluster]
+    grid = self.grid
+    low, high = self.get_cluster_bound(cluster)
+    box_shape = tuple(h - l + 1 for l, h in zip(low, high))
+    box = tuple(slice(l, h+1) for l, h in zip(low, high))
+    free = (grid.get_layer_box(grid.occupied, box) == 0) & ~grid.get_layer_box(grid.obstacle, box)
+    blocked_mask = grid.get_layer_box(grid.blocked_mask, box)
+
+    open_mask = np.zeros(box_shape, dtype=np.uint32)
+    for direction, offset in enumerate(p.NEIGHBOR_OFFSETS):
+      # nodes whose neighbor in this direction is still in the cluster
+      source = tuple(slice(max(-d, 0), n - max(d, 0)) for d, n in zip(offset, box_shape))
+      is_open = (blocked_mask[source] & p.NEIGHBOR_BIT[direction]) == 0
+      open_mask[source] |= np.where(is_open, np.uint32(p.NEIGHBOR_BIT[direction]), np.uint32(0))
+
+    step = tuple(dx*box_shape[1]*box_shape[2] + dy*box_shape[2] + dz for dx, dy, dz in p.NEIGHBOR_OFFSETS)
+    cost = []
+    for direction, (dx, dy, dz) in enumerate(p.NEIGHBOR_OFFSETS):
+      cost_list = []
+      for z in range(low[2], high[2]+1):
+        neighbor_z = z + dz
+        cost_list.append((p.GROUND_STEP_COST[direction] if neighbor_z == 0 else p.STEP_COST[direction]) + (.1 if z else 0) - (.1 if neighbor_z else 0))
+      cost.append(cost_list)
+
+    # (source slice, neighbor slice, forward cost, reverse cost) of each direction for cluster_distance
+    # cost is inf where the step can not be taken, entering the neighbor (forward) or the source (reverse)
+    edge_list = []
+    for direction, offset in enumerate(p.NEIGHBOR_OFFSETS):
+      source = tuple(slice(max(-d, 0), n - max(d, 0)) for d, n in zip(offset, box_shape))
+      neighbor = tuple(slice(max(d, 0), n - max(-d, 0)) for d, n in zip(offset, box_shape))
+      is_open = (open_mask[source] & p.NEIGHBOR_BIT[direction]) != 0
+      step_cost = np.array(cost[direction])[source[2]]
+      forward_cost = np.where(is_open & free[neighbor], step_cost, np.inf)
+      reverse_cost = np.where(is_open & free[source], step_cost, np.inf)
+      edge_list.append(((slice(None),) + source, (slice(None),) + neighbor, forward_cost, reverse_cost))
+
+    state = {
+      "low": low,
+      "box_shape": box_shape,
+      "open_mask": open_mask.reshape(-1).tolist(),
+      "free": free.reshape(-1).tobytes(),
+      "step": step,
+      "cost": cost,
+      "edge_list": edge_list,
+    }
+    self.cluster_state[cluster] = state
+    return state
+
+
+  # global index -> local index in a cluster
+  def to_local(self, index, state):
+    """Helper Function"""
+    low, box_shape = state["low"], state["box_shape"]
+    x, y, z = self.grid.get_coord(index)
+    return ((x-low[0])*box_shape[1] + (y-low[1]))*box_shape[2] + (z-low[2])
+
+  # local index in a cluster -> global index
+  def to_global(self, local_index, state):
+    """Helper Function"""
+    low, box_shape = state["low"], state["box_shape"]
+    rest, z = divmod(local_index, box_shape[2])
+    x, y = divmod(rest, box_shape[1])
+    return self.grid.get_index((x+low[0], y+low[1], z+low[2]))
+
+
+  # reduced cost from every source to every target inside one cluster, all sources at once
+  # numpy relaxation over the 26 directions until nothing changes
+  # reverse gives the cost from each target to the source instead
+  # return [{target_index : cost}] in source order
+  def cluster_distance(self, cluster, source_list, target_list, reverse=False):
+    """Helper Function"""
+    state = self.get_cluster_state(cluster)
+    self.search_count["local"] += 1
+    box_shape = state["box_shape"]
+    distance = np.full((len(source_list),) + box_shape, np.inf)
+    for i, index in enumerate(source_list):
+      distance[i].reshape(-1)[self.to_local(index, state)] = 0
+
+    while True:
+      last_distance = distance.copy()
+      for source, neighbor, forward_cost, reverse_cost in state["edge_list"]:
+        if reverse:
+          # cost to the search source through the neighbor
+          np.minimum(distance[source], distance[neighbor] + reverse_cost, out=distance[source])
+        else:
+          np.minimum(distance[neighbor], distance[source] + forward_cost, out=distance[neighbor])
+      if np.array_equal(last_distance, distance):
+        break
+
+    flat_distance = distance.reshape(len(source_list), -1)
+    target_local = [(index, self.to_local(index, state)) for index in target_list]
+    result = []
+    for i, source_index in enumerate(source_list):
+      row = flat_distance[i]
+      result.append({index: float(row[local]) for index, local in target_local if index != source_index and row[local] < np.inf})
+    return result
+
+
+  # A star inside one cluster between two nodes, reduced costs
+  # to_index can be stepped on even if in use (released end node)
+  # return [node_index] from from_index to to_index, or [] if not connected inside the cluster
+  def find_local_path(self, from_index, to_index, cluster):
+    """Helper Function"""
+    grid = self.grid
+    state = self.get_cluster_state(cluster)
+    open_mask, free, step, cost = state["open_mask"], state["free"], state["step"], state["cost"]
+    low, box_shape = state["low"], state["box_shape"]
+    self.search_count["local"] += 1
+
+    source = self.to_local(from_index, state)
+    target = self.to_local(to_index, state)
+    target_x, target_y, target_z = grid.get_coord(to_index)
+    depth = box_shape[2]
+    width = box_shape[1] * depth
+
+    cost_dict = {source: 0}
+    parent_dict = {source: -1}
+    closed_set = set()
+    search_queue = [(0, 0, source)]
+    while search_queue:
+      this_node = heapq.heappop(search_queue)[2]
+      if this_node == target:
+        break
+      if this_node in closed_set:
+        continue
+      closed_set.add(this_node)
+
+      this_cost = cost_dict[this_node]
+      z = this_node % depth
+      mask = open_mask[this_node]
+      while mask:
+        bit = mask & -mask
+        mask ^= bit
+        direction = bit.bit_length() - 1
+        neighbor = this_node + step[direction]
+        if neighbor in closed_set:
+          continue
+        if not free[neighbor] and neighbor != target:
+          continue
+        new_cost = this_cost + cost[direction][z]
+        if new_cost < cost_dict.get(neighbor, math.inf):
+          cost_dict[neighbor] = new_cost
+          parent_dict[neighbor] = this_node
+          # consistent bound: .9 * max(horizontal chebyshev distance, height still to climb)
+          neighbor_x = low[0] + neighbor // width
+          neighbor_y = low[1] + neighbor % width // depth
+          neighbor_z = low[2] + neighbor % depth
+          h = .9*max(abs(neighbor_x-target_x), abs(neighbor_y-target_y), target_z-neighbor_z)
+          heapq.heappush(search_queue, (new_cost + h, neighbor, neighbor))
+
+    if target not in parent_dict:
+      return []
+    path_index_list = [to_index]
+    this_node = parent_dict[target]
+    while this_node != -1:
+      path_index_list.insert(0, self.to_global(this_node, state))
+      this_node = parent_dict[this_node]
+    return path_index_list
+
+
+  # start and end close by, the cluster graph does not help
+  def is_near(self, start_coord, end_coord):
+    """Helper Function"""
+    start_cluster = self.get_cluster(self.grid.get_index(start_coord))
+    end_cluster = self.get_cluster(self.grid.get_index(end_coord))
+    return max(abs(a - b) for a, b in zip(start_cluster, end_cluster)) <= 1
+
+  # A star over transitions, start and end are added for this search only
+  # same H + 0.2*G priority as Grid.path_finding, G is the reduced cost
+  # return the refined path, or [] without registering an error
+  def path_finding(self, start_coord, end_coord):
+    """Hierarchical path finding"""
+    grid = self.grid
+    print(f"Looking for hierarchical path from {start_coord} to {end_coord}")
+    start_index = grid.get_index(start_coord)
+    end_index = grid.get_index(end_coord)
+    if grid.node_in_use(start_index) or grid.node_in_use(end_index):
+      return []
+    self.search_count = {"abstract": 0, "local": 0}
+
+    start_cluster = self.get_cluster(start_index)
+    end_cluster = self.get_cluster(end_index)
+    start_target_list = list(self.get_cluster_transition(start_cluster))
+    if start_cluster == end_cluster:
+      start_target_list.append(end_index)
+    start_edge = self.cluster_distance(start_cluster, [start_index], start_target_list)[0]
+    # cost from each transition of the end cluster to the end
+    end_edge = self.cluster_distance(end_cluster, [end_index], self.get_cluster_transition(end_cluster), reverse=True)[0]
+
+    g_dict = {start_index: 0}
+    parent_dict = {start_index: -1}
+    closed_set = set()
+    search_queue = [(1, 0, start_index)]
+    node_count = 0
+    while search_queue:
+      this_index = heapq.heappop(search_queue)[2]
+      if this_index == end_index:
+        break
+      if this_index in closed_set:
+        continue
+      closed_set.add(this_index)
+      self.search_count["abstract"] += 1
+
+      if this_index == start_index:
+        edge_list = list(start_edge.items())
+      else:
+        edge_list = list(self.get_intra_edge(this_index).items())
+        if this_index in end_edge:
+          edge_list.append((end_index, end_edge[this_index]))
+      edge_list += [(twin_index, self.get_reduced_cost(twin_index, this_index)) for twin_index in self.twin_dict.get(this_index, ())]
+
+      for next_index, cost in edge_list:
+        if next_index in closed_set:
+          continue
+        new_g = g_dict[this_index] + cost
+        if new_g < g_dict.get(next_index, math.inf):
+          g_dict[next_index] = new_g
+          parent_dict[next_index] = this_index
+          node_count += 1
+          heapq.heappush(search_queue, (1*grid.calculate_H(next_index, end_index) + 0.2*new_g, node_count, next_index))
+
+    for key in self.search_count:
+      self.total_search_count[key] += self.search_count[key]
+    grid.record_search_count(node_count, self.search_count["abstract"])
+    if end_index not in parent_dict:
+      print(f"No hierarchical path found for {start_coord} - {end_coord}")
+      return []
+
+    abstract_path = [end_index]
+    while parent_dict[abstract_path[0]] != -1:
+      abstract_path.insert(0, parent_dict[abstract_path[0]])
+    print(f"Abstract path of {len(abstract_path)} nodes, {self.search_count['abstract']} expanded, {self.search_count['local']} local searches")
+    path_node_list = self.refine_path(abstract_path)
+    if not path_node_list:
+      return []
+
+    grid.save_path((path_node_list[0], path_node_list[-1]), path_node_list)
+    grid.reset_grid()
+    print(f"Path: {path_node_list}")
+    return path_node_list
+
+
+  # fill in the nodes between abstract nodes
+  # steps across a face are single moves, others are searched inside their cluster
+  # loops are cut out if the path comes back to a node
+  def refine_path(self, abstract_path):
+    """Helper Function"""
+    grid = self.grid
+    path_index_list = [abstract_path[0]]
+    for from_index, to_index in zip(abstract_path, abstract_path[1:]):
+      if to_index in self.twin_dict.get(from_index, ()) and self.get_cluster(from_index) != self.get_cluster(to_index):
+        path_index_list.append(to_index)
+        continue
+      segment = self.find_local_path(from_index, to_index, self.get_cluster(from_index))
+      if not segment:
+        print(f"Error: Can not refine path from {grid.get_coord(from_index)} to {grid.get_coord(to_index)}")
+        return []
+      path_index_list += segment[1:]
+
+    # cut loops
+    position_dict = {}
+    loop_free_list = []
+    for index in path_index_list:
+      if index in position_dict:
+        del loop_free_list[position_dict[index]+1:]
+        position_dict = {node: i for i, node in enumerate(loop_free_list)}
+        continue
+      position_dict[index] = len(loop_free_list)
+      loop_free_list.append(index)
+
+    return [grid.get_coord(index) for index in loop_free_list]
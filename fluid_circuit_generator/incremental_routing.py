@@ -0,0 +1,102 @@
+"""
+Incremental Routing
+Route a design again after a small edit, keeping the paths of everything the edit did not touch
+  Snapshot: after routing, the grid is split into routed groups, nodes connected through tip paths, ground paths and junctions
+  Keep: on the grid of the next build, a routed group is taken back if the new design has a group with exactly its tips
+    and none of its nodes or steps collide with obstacles or groups taken before, so paths through a moved obstacle are dropped
+  Everything not kept is routed again as usual, see PipeSystem.connect_port_list_incremental
+Nothing in here needs Blender
+"""
+
+import fluid_circuit_generator.parallel_routing as parallel_routing
+
+
+
+
+# split everything saved on grid into routed groups
+# return [routed group], routed group is
+#   {"tip_set", "saved_path", "tip_ground_table", "saved_junction", "warning_message_list"}
+#   same as a routed group of parallel_routing, so it can be merged the same way
+def get_routed_group_list(grid):
+  """
+  Top level function
+  Use this after routing to keep the result for the next build
+  """
+  parent = {}
+
+  def find(node):
+    root = node
+    while parent[root] != root:
+      root = parent[root]
+    while parent[node] != root:
+      parent[node], node = root, parent[node]
+    return root
+
+  def union(node1, node2):
+    parent.setdefault(node1, node1)
+    parent.setdefault(node2, node2)
+    parent[find(node1)] = find(node2)
+
+  for tip_node, (ground_node, _, _) in grid.tip_ground_table.items():
+    union(tip_node, ground_node)
+  for start_node, end_node in grid.saved_path:
+    union(start_node, end_node)
+
+  # {root node : routed group}
+  group_dict = {}
+  def get_group(node):
+    root = find(node)
+    if root not in group_dict:
+      group_dict[root] = {"tip_set": set(), "saved_path": {}, "tip_ground_table": {}, "saved_junction": {}, "warning_message_list": []}
+    return group_dict[root]
+
+  for tip_node, (ground_node, is_start, path) in grid.tip_ground_table.items():
+    group = get_group(tip_node)
+    group["tip_set"].add(tip_node)
+    group["tip_ground_table"][tip_node] = [ground_node, is_start, list(path)]
+  for path_key, path in grid.saved_path.items():
+    get_group(path_key[0])["saved_path"][path_key] = list(path)
+  for junction_node, connection in grid.saved_junction.items():
+    if junction_node in parent:
+      get_group(junction_node)["saved_junction"][junction_node] = list(connection)
+
+  print(f"Routing kept as {len(group_dict)} routed groups")
+  return list(group_dict.values())
+
+
+# take back routed groups for groups of the new design
+# group_list is [[(start_node, end_node)]], only groups whose tips are all placed
+# return [group] of groups that were not kept and need routing
+def keep_routed_group_list(grid, group_list, routed_group_list):
+  """
+  Top level function
+  Use this on a grid with obstacles but no paths yet
+  """
+  # {tip set : routed group}
+  routed_group_dict = {frozenset(routed_group["tip_set"]): routed_group for routed_group in routed_group_list}
+  to_route_list = []
+  for group in group_list:
+    tip_set = frozenset(grid.get_node(node) for connection in group for node in connection)
+    routed_group = routed_group_dict.get(tip_set)
+    if routed_group is None:
+      to_route_list.append(group)
+      continue
+    # grid may have shrunk since the last build
+    if not in_grid(grid, routed_group):
+      print(f"Routed group of tips {sorted(tip_set)} is out of the grid, routing again")
+      to_route_list.append(group)
+      continue
+    if not parallel_routing.can_merge(grid, routed_group):
+      print(f"Routed group of tips {sorted(tip_set)} is blocked, routing again")
+      to_route_list.append(group)
+      continue
+    parallel_routing.merge_group(grid, routed_group)
+  print(f"Kept {len(group_list) - len(to_route_list)} of {len(group_list)} groups")
+  return to_route_list
+
+# every node of a routed group is inside grid
+def in_grid(grid, routed_group):
+  """Helper Function"""
+  path_list = list(routed_group["saved_path"].values())
+  path_list += [value[2] for value in routed_group["tip_ground_table"].values()]
+  return all(grid.check_valid_coord(node) for path in path_list for node in path)
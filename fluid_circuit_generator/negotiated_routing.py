@@ -0,0 +1,288 @@
+"""
+Negotiated Routing
+PathFinder style routing, nets negotiate for shared nodes before anything is saved
+  Plan: every connection is routed tip to tip through a relaxed search
+    nodes used by other groups are allowed, but cost more the more groups use them (present congestion)
+    nodes that stayed contested in earlier rounds keep getting more expensive (history)
+    rounds repeat until no node is used by two groups
+  Commit: connections are routed for real with Grid.connect_two_node, so tips, ground paths and junctions work as usual
+    history and the plans of groups not saved yet are added as node cost of the A star search
+    groups that still fail are moved to the front and the commit is done again
+Connections sharing a tip node form one group, nodes shared inside a group are free (they become junctions)
+"""
+
+import math
+import heapq
+import time
+
+import fluid_circuit_generator.path_finding as p
+import fluid_circuit_generator.parallel_routing as parallel_routing
+
+
+
+
+# connect a list of (start_coord, end_coord) on grid with negotiated routing
+# return stats of NegotiatedRouter.route
+def route_negotiated(grid, connection_list, max_iteration=30, max_commit=4):
+  """
+  Top level function
+  Use this to connect many pairs of grid coordinates with negotiated routing
+  """
+  router = NegotiatedRouter(grid, connection_list)
+  router.max_iteration = max_iteration
+  router.max_commit = max_commit
+  return router.route()
+
+
+
+
+class NegotiatedRouter:
+  """
+  NegotiatedRouter object
+  Holds the plans and the congestion costs of one negotiated routing run
+  Plans only live in here, the Grid is only changed by the commit
+  """
+
+  # cost added to a node for every other group using it, grows every round
+  present_factor = .5
+  present_growth = 1.6
+  # cost added to a node every round it is used by more than one group
+  history_factor = 1
+  # node cost of a planned node of a group that is not saved yet, in the commit
+  reserve_cost = 4
+
+  def __init__(self, grid, connection_list):
+    self.grid = grid
+    self.connection_list = [(grid.get_node(start), grid.get_node(end)) for start, end in connection_list]
+    self.group_list = parallel_routing.get_connection_group(self.connection_list)
+    self.max_iteration = 30
+    self.max_commit = 4
+    # tip node : group id, tips of other groups can never be used
+    self.tip_group = {}
+    for group_id, group in enumerate(self.group_list):
+      for connection in group:
+        for node in connection:
+          self.tip_group[self.grid.get_index(node)] = group_id
+    # planned path of each connection, node indices
+    # {(group_id, connection_id) : [node_index]}
+    self.plan = {}
+    # number of plans of each group using a node
+    # {group_id : {node_index : count}}
+    self.group_use = {group_id: {} for group_id in range(len(self.group_list))}
+    # number of groups using a node
+    # {node_index : count}
+    self.use_count = {}
+    # {node_index : history cost}
+    self.history = {}
+    self.present = self.present_factor
+
+
+  # negotiate, then commit
+  # return {"iteration", "overuse", "commit", "failed", "time"}
+  def route(self):
+    """Top level function"""
+    start_time = time.perf_counter()
+    grid = self.grid
+    stats = {"iteration": 0, "overuse": 0, "commit": 0, "failed": 0, "time": 0}
+    # commit clears the grid before every try, paths saved before would be lost
+    if grid.saved_path or grid.tip_ground_table:
+      grid.register_warning_message("WARNING: Grid already has paths, connections are routed one by one")
+      parallel_routing.route_group_list(grid, self.group_list)
+      stats["time"] = time.perf_counter() - start_time
+      return stats
+
+    stats["iteration"], stats["overuse"] = self.negotiate()
+    stats["commit"], stats["failed"] = self.commit()
+    stats["time"] = time.perf_counter() - start_time
+    print(f"Negotiated routing done: {stats}")
+    return stats
+
+
+  ###########################################  plan  ########################################
+
+  # rip up and replan every connection until no node is shared between groups
+  # return (rounds done, number of shared nodes left)
+  def negotiate(self):
+    """Helper Function"""
+    overuse_list = []
+    for iteration in range(1, self.max_iteration+1):
+      for group_id, group in enumerate(self.group_list):
+        for connection_id, (start_node, end_node) in enumerate(group):
+          key = (group_id, connection_id)
+          if key in self.plan:
+            self.use_plan(group_id, self.plan.pop(key), -1)
+          path = self.plan_path(group_id, start_node, end_node)
+          if path:
+            self.plan[key] = path
+            self.use_plan(group_id, path, 1)
+
+      overuse_list = [index for index, count in self.use_count.items() if count > 1]
+      print(f"Negotiation round {iteration}: {len(overuse_list)} shared nodes")
+      if not overuse_list:
+        return iteration, 0
+      for index in overuse_list:
+        self.history[index] = self.history.get(index, 0) + self.history_factor
+      self.present *= self.present_growth
+    return self.max_iteration, len(overuse_list)
+
+  # add (count = 1) or remove (count = -1) a plan from the use counts
+  def use_plan(self, group_id, path, count):
+    """Helper Function"""
+    group_use = self.group_use[group_id]
+    for index in path:
+      before = group_use.get(index, 0)
+      after = before + count
+      if after:
+        group_use[index] = after
+      else:
+        del group_use[index]
+      # group starts or stops using the node
+      if not before or not after:
+        self.use_count[index] = self.use_count.get(index, 0) + count
+        if not self.use_count[index]:
+          del self.use_count[index]
+
+  # congestion cost of stepping onto a node for a group
+  def get_congestion_cost(self, group_id, index):
+    """Helper Function"""
+    other_use = self.use_count.get(index, 0) - (index in self.group_use[group_id])
+    return (1 + self.history.get(index, 0)) * (1 + self.present * other_use) - 1
+
+  # A star from tip to tip, nodes of other groups cost more instead of being blocked
+  # obstacles, saved paths, cut edges and tips of other groups are still blocked
+  # uses the reduced cost and the heuristic of bidirectional_path_finding, so the plan is the cheapest path
+  # return [node_index], [] if there is none
+  def plan_path(self, group_id, start_node, end_node):
+    """Helper Function"""
+    grid = self.grid
+    start_index = grid.get_index(start_node)
+    end_index = grid.get_index(end_node)
+    end_x, end_y, end_z = end_node
+    x_mask, y_mask, z_mask = grid.axis_valid_mask
+    g_dict = {start_index: 0}
+    parent = {start_index: -1}
+    closed = set()
+    # (key, push order, node_index)
+    search_queue = [(0, 0, start_index)]
+    node_count = 0
+
+    while search_queue:
+      this_index = heapq.heappop(search_queue)[2]
+      if this_index == end_index:
+        break
+      if this_index in closed:
+        continue
+      closed.add(this_index)
+
+      x, y, z = grid.get_coord(this_index)
+      open_mask = x_mask[x] & y_mask[y] & z_mask[z] & ~int(grid.blocked_mask[this_index])
+      this_g = g_dict[this_index]
+      this_potential = .1 if z else 0
+      for direction in range(p.NEIGHBOR_NUM):
+        if not open_mask & p.NEIGHBOR_BIT[direction]:
+          continue
+        neighbor_index = this_index + grid.neighbor_step[direction]
+        if neighbor_index in closed:
+          continue
+        if grid.occupied[neighbor_index] or grid.obstacle[neighbor_index]:
+          continue
+        if self.tip_group.get(neighbor_index, group_id) != group_id:
+          continue
+
+        dx, dy, dz = p.NEIGHBOR_OFFSETS[direction]
+        neighbor_z = z + dz
+        cost = p.GROUND_STEP_COST[direction] if neighbor_z == 0 else p.STEP_COST[direction]
+        new_g = this_g + cost + this_potential - (.1 if neighbor_z else 0)
+        new_g += self.get_congestion_cost(group_id, neighbor_index)
+        if new_g >= g_dict.get(neighbor_index, math.inf):
+          continue
+        g_dict[neighbor_index] = new_g
+        parent[neighbor_index] = this_index
+        h = .9*max(abs(x+dx-end_x), abs(y+dy-end_y), end_z-neighbor_z)
+        node_count += 1
+        heapq.heappush(search_queue, (new_g + h, node_count, neighbor_index))
+
+    grid.record_search_count(node_count, len(closed))
+    if end_index not in parent:
+      print(f"No plan found for {start_node} - {end_node}")
+      return []
+    path = []
+    this_index = end_index
+    while this_index != -1:
+      path.insert(0, this_index)
+      this_index = parent[this_index]
+    return path
+
+
+  ###########################################  commit  ########################################
+
+  # route every group for real, planned nodes of groups not saved yet cost reserve_cost
+  # groups with errors are moved to the front and everything is routed again
+  # the order with the fewest failed groups is kept
+  # return (commits done, number of failed groups)
+  def commit(self):
+    """Helper Function"""
+    grid = self.grid
+    error_num = len(grid.error_message_list)
+    warning_num = len(grid.warning_message_list)
+    # node_cost is only read by path_finding, the other searches would ignore it
+    search_setting = (grid.search_mode, grid.bidirectional_ground_path)
+    grid.search_mode, grid.bidirectional_ground_path = "ASTAR", False
+    order = list(range(len(self.group_list)))
+    best_order, best_failed = order, None
+    try:
+      for attempt in range(1, self.max_commit+1):
+        failed = self.commit_order(order, error_num, warning_num)
+        print(f"Commit {attempt}: {len(failed)} groups failed")
+        if best_failed is None or len(failed) < len(best_failed):
+          best_order, best_failed = order, failed
+        if not failed:
+          return attempt, 0
+        # failed groups go first next time, keeping their order
+        order = failed + [group_id for group_id in order if group_id not in failed]
+      if best_order is not order:
+        self.commit_order(best_order, error_num, warning_num)
+      return self.max_commit, len(best_failed)
+    finally:
+      grid.search_mode, grid.bidirectional_ground_path = search_setting
+      grid.node_cost = None
+
+  # clear the grid and route the groups in order
+  # return [group_id] of groups that registered an error
+  def commit_order(self, order, error_num, warning_num):
+    """Helper Function"""
+    grid = self.grid
+    grid.clear_paths()
+    del grid.error_message_list[error_num:]
+    del grid.warning_message_list[warning_num:]
+
+    # {node_index : number of groups not saved yet planning it}
+    reserved = {}
+    for group_id in order:
+      for index in self.group_use[group_id]:
+        reserved[index] = reserved.get(index, 0) + 1
+    grid.node_cost = {}
+    for index in reserved.keys() | self.history.keys():
+      self.update_node_cost(index, reserved)
+
+    failed = []
+    for group_id in order:
+      # own plan is free for this group
+      for index in self.group_use[group_id]:
+        reserved[index] -= 1
+        self.update_node_cost(index, reserved)
+      group_error_num = len(grid.error_message_list)
+      for start_node, end_node in self.group_list[group_id]:
+        grid.connect_two_node(start_node, end_node)
+      if len(grid.error_message_list) > group_error_num:
+        failed.append(group_id)
+    return failed
+
+  # node cost used by path_finding in the commit
+  def update_node_cost(self, index, reserved):
+    """Helper Function"""
+    cost = self.history.get(index, 0) + self.reserve_cost * reserved.get(index, 0)
+    if cost:
+      self.grid.node_cost[index] = cost
+    else:
+      self.grid.node_cost.pop(index, None)
@@ -0,0 +1,260 @@
+"""
+Parallel Routing
+Route independent groups of connections in worker processes
+Connections sharing a tip node form one group, groups are split into batches, one batch per worker
+Every worker routes its batch on its own copy of the grid, the main grid then takes the results
+group by group, groups that collide with what is already taken are routed again one by one
+Nothing in here needs Blender, workers only load path_finding
+"""
+
+import time
+import multiprocessing
+import concurrent.futures
+import numpy as np
+
+import fluid_circuit_generator.path_finding as p
+
+
+
+
+# connect a list of (start_coord, end_coord) on grid
+# same result as calling grid.connect_two_node on every connection when no group collides
+# return {"worker_num", "group_num", "merged", "rerouted", "time"}
+def route_parallel(grid, connection_list, worker_num=None):
+  """
+  Top level function
+  Use this to connect many pairs of grid coordinates with worker processes
+  """
+  start_time = time.perf_counter()
+  connection_list = [(grid.get_node(start), grid.get_node(end)) for start, end in connection_list]
+  group_list = get_connection_group(connection_list)
+  if worker_num is None:
+    worker_num = multiprocessing.cpu_count()
+  worker_num = max(1, min(worker_num, len(group_list)))
+  stats = {"worker_num": worker_num, "group_num": len(group_list), "merged": 0, "rerouted": 0, "time": 0}
+  print(f"Parallel routing {len(connection_list)} connections in {len(group_list)} groups with {worker_num} workers")
+
+  # workers start from an empty grid, paths already saved would be missing
+  if grid.saved_path or grid.tip_ground_table:
+    grid.register_warning_message("WARNING: Grid already has paths, connections are routed one by one")
+    worker_num = 1
+  if worker_num == 1:
+    route_group_list(grid, group_list)
+    stats["rerouted"] = len(group_list)
+    stats["time"] = time.perf_counter() - start_time
+    return stats
+
+  batch_list = get_batch(group_list, worker_num)
+  task_list = [make_task(grid, group_list, batch_list, i) for i in range(len(batch_list))]
+  try:
+    context = multiprocessing.get_context("spawn")
+    with concurrent.futures.ProcessPoolExecutor(max_workers=worker_num, mp_context=context) as executor:
+      result_list = list(executor.map(route_batch, task_list))
+  except Exception as e:
+    grid.register_warning_message(f"WARNING: Parallel routing failed ({e}), connections are routed one by one")
+    route_group_list(grid, group_list)
+    stats["rerouted"] = len(group_list)
+    stats["time"] = time.perf_counter() - start_time
+    return stats
+
+  # {group_id : routed group}
+  routed_group_dict = {}
+  for result in result_list:
+    routed_group_dict.update(result["group_dict"])
+    for key in grid.total_search_count:
+      grid.total_search_count[key] += result["search_count"][key]
+
+  # take the groups in their original order, so the result does not depend on the batches
+  to_reroute_list = []
+  for group_id, group in enumerate(group_list):
+    routed_group = routed_group_dict[group_id]
+    if routed_group["error_message_list"] or not can_merge(grid, routed_group):
+      to_reroute_list.append(group)
+      continue
+    merge_group(grid, routed_group)
+    stats["merged"] += 1
+
+  if to_reroute_list:
+    print(f"Rerouting {len(to_reroute_list)} groups one by one")
+  route_group_list(grid, to_reroute_list)
+  stats["rerouted"] = len(to_reroute_list)
+  stats["time"] = time.perf_counter() - start_time
+  print(f"Parallel routing done: {stats}")
+  return stats
+
+
+# connections sharing a tip node end up in one group (union find over tip nodes)
+# return [[(start_node, end_node)]], groups and connections in their original order
+def get_connection_group(connection_list):
+  """Helper Function"""
+  parent = {}
+
+  def find(node):
+    root = node
+    while parent[root] != root:
+      root = parent[root]
+    while parent[node] != root:
+      parent[node], node = root, parent[node]
+    return root
+
+  for start_node, end_node in connection_list:
+    parent.setdefault(start_node, start_node)
+    parent.setdefault(end_node, end_node)
+    parent[find(start_node)] = find(end_node)
+
+  # {root node : group index}
+  group_index = {}
+  group_list = []
+  for connection in connection_list:
+    root = find(connection[0])
+    if root not in group_index:
+      group_index[root] = len(group_list)
+      group_list.append([])
+    group_list[group_index[root]].append(connection)
+  return group_list
+
+
+# split groups into batches with about the same work, largest group first to the lightest batch
+# work of a group is the summed manhattan length of its connections
+# return [[group_id]], group ids of each batch in their original order
+def get_batch(group_list, batch_num):
+  """Helper Function"""
+  def get_work(group):
+    return sum(sum(abs(a - b) for a, b in zip(start, end)) for start, end in group)
+
+  batch_list = [[] for _ in range(batch_num)]
+  batch_work = [0] * batch_num
+  for group_id in sorted(range(len(group_list)), key=lambda i: get_work(group_list[i]), reverse=True):
+    lightest = batch_work.index(min(batch_work))
+    batch_list[lightest].append(group_id)
+    batch_work[lightest] += get_work(group_list[group_id])
+  return [sorted(batch) for batch in batch_list if batch]
+
+
+# everything a worker needs to build its own grid, only plain data so it can be pickled
+def make_task(grid, group_list, batch_list, batch_id):
+  """Helper Function"""
+  batch = batch_list[batch_id]
+  # tip nodes of other batches, so a batch does not route through them
+  other_tip_list = []
+  for i, other_batch in enumerate(batch_list):
+    if i == batch_id:
+      continue
+    for group_id in other_batch:
+      for connection in group_list[group_id]:
+        other_tip_list.extend(connection)
+  return {
+    "dimention": grid.dimention,
+    "search_mode": grid.search_mode,
+    "bidirectional_ground_path": grid.bidirectional_ground_path,
+    "bidirectional_weight": grid.bidirectional_weight,
+    "storage": grid.storage,
+    "obstacle_box_list": get_obstacle_box_list(grid),
+    "other_tip_list": other_tip_list,
+    "group_dict": {group_id: group_list[group_id] for group_id in batch},
+  }
+
+# obstacles of grid as [(low, occupancy)] boxes for Grid.add_obstacle_occupancy
+# one box per made chunk of a CHUNKED grid, the bounding box of all obstacles of a DENSE grid
+def get_obstacle_box_list(grid):
+  """Helper Function"""
+  if grid.storage == "CHUNKED":
+    side = grid.obstacle.chunk_side
+    box_list = [tuple(slice(k * side, min((k + 1) * side, size)) for k, size in zip(key, grid.shape)) for key in grid.obstacle.chunk_dict]
+  else:
+    obstacle = grid.get_layer_box(grid.obstacle)
+    if not obstacle.any():
+      return []
+    box = []
+    for axis in range(3):
+      axis_any = np.flatnonzero(obstacle.any(axis=tuple(a for a in range(3) if a != axis)))
+      box.append(slice(int(axis_any[0]), int(axis_any[-1]) + 1))
+    box_list = [tuple(box)]
+  box_obstacle_list = []
+  for box in box_list:
+    occupancy = grid.get_layer_box(grid.obstacle, box)
+    if occupancy.any():
+      box_obstacle_list.append((tuple(s.start for s in box), occupancy.copy()))
+  return box_obstacle_list
+
+# worker process: route every group of a batch on a fresh grid
+# return {"group_dict": {group_id : routed group}, "search_count"}
+# routed group is {"saved_path", "tip_ground_table", "saved_junction", "error_message_list", "warning_message_list"}
+def route_batch(task):
+  """Helper Function"""
+  p.blockPrint()
+  try:
+    grid = p.Grid(task["dimention"], task["search_mode"], task["bidirectional_ground_path"], task["storage"])
+    grid.bidirectional_weight = task["bidirectional_weight"]
+    for low, occupancy in task["obstacle_box_list"]:
+      grid.add_obstacle_occupancy(occupancy, low)
+    for coord in task["other_tip_list"]:
+      grid.make_obstacle(coord)
+
+    group_dict = {}
+    for group_id, group in task["group_dict"].items():
+      saved_path = dict(grid.saved_path)
+      tip_ground_table = dict(grid.tip_ground_table)
+      saved_junction = dict(grid.saved_junction)
+      error_num = len(grid.error_message_list)
+      warning_num = len(grid.warning_message_list)
+      for start_node, end_node in group:
+        grid.connect_two_node(start_node, end_node)
+      # everything new belongs to this group, groups never touch each other's paths
+      group_dict[group_id] = {
+        "saved_path": {key: value for key, value in grid.saved_path.items() if saved_path.get(key) is not value},
+        "tip_ground_table": {key: value for key, value in grid.tip_ground_table.items() if key not in tip_ground_table},
+        "saved_junction": {key: value for key, value in grid.saved_junction.items() if saved_junction.get(key) is not value},
+        "error_message_list": grid.error_message_list[error_num:],
+        "warning_message_list": grid.warning_message_list[warning_num:],
+      }
+    return {"group_dict": group_dict, "search_count": grid.total_search_count}
+  finally:
+    p.enablePrint()
+
+
+# a routed group can be taken if none of its nodes are used
+# and none of its steps or crossovers collide with saved paths of the grid
+def can_merge(grid, routed_group):
+  """Helper Function"""
+  path_list = list(routed_group["saved_path"].values())
+  path_list += [value[2] for value in routed_group["tip_ground_table"].values()]
+  for path in path_list:
+    for i, node in enumerate(path):
+      index = grid.get_index(node)
+      if grid.occupied[index] or grid.obstacle[index]:
+        return False
+      if i == len(path) - 1:
+        break
+      offset = tuple(b - a for a, b in zip(node, path[i+1]))
+      if grid.blocked_mask[index] & p.NEIGHBOR_BIT[p.DIRECTION_INDEX[offset]]:
+        return False
+  # a crossover edge must not be a step of a saved path
+  for path in routed_group["saved_path"].values():
+    for coord1, coord2 in grid.get_crossover_edges(path):
+      owner1 = grid.path_owner.get(coord1)
+      owner2 = grid.path_owner.get(coord2)
+      if not owner1 or not owner2:
+        continue
+      for path_key, position in owner1.items():
+        if path_key in owner2 and abs(owner2[path_key] - position) == 1:
+          return False
+  return True
+
+# save all paths and junctions of a routed group into grid
+def merge_group(grid, routed_group):
+  """Helper Function"""
+  for tip_node, (ground_node, is_start, path) in routed_group["tip_ground_table"].items():
+    grid.save_tip_ground_path(tip_node, ground_node, is_start, path)
+  for path_key, path in routed_group["saved_path"].items():
+    grid.save_path(path_key, path)
+  grid.saved_junction.update(routed_group["saved_junction"])
+  for warning_message in routed_group["warning_message_list"]:
+    grid.register_warning_message(warning_message)
+
+# route groups one by one on grid
+def route_group_list(grid, group_list):
+  """Helper Function"""
+  for group in group_list:
+    for start_node, end_node in group:
+      grid.connect_two_node(start_node, end_node)
@@ -1,4 +1,3 @@
-
 """
 Path Finding Class
 A star path finding within an imaginary grid
@@ -8,203 +7,67 @@ Also handles merging paths
 import sys
 import os
 import math
-from queue import PriorityQueue
-import bpy
+import heapq
+import time
+import numpy as np
+try:
+  import bpy
+except ImportError:
+  # only test_path_finding needs Blender, routing also runs in worker processes without it
+  bpy = None
+
+import fluid_circuit_generator.grid_storage as grid_storage
 
 ################################################################################################
-########################################  Node Class  ##########################################
+####################################  Neighbor Table  ##########################################
 ################################################################################################
 
-
-class Node:
-  """
-  Node Object makes up the imaginary grid
-  """
-
-  def __init__(self, coord, limit_coord):
-    # First check if coordinate is within limit
-    if not self.check_valid_coord(coord, limit_coord):
-      print(f"Error: Node {coord} is out of limit {limit_coord}")
-      print("Error: Node not Created")
-      # del self
-      return
-
-    self.coord = coord
-    self.limit_coord = limit_coord  # boundary of grid
-    self.neighbors = []             # stores valid connections
-    self.all_neighbors = []         # all neighbors within limit of grid
-    self.blocked_neighbors = []     # neighbors blocked by other connection
-
-    # F = G + H
-    self.F = float("inf")
-    self.G = float("inf")
-    self.H = float("inf")
-
-    self.last_visited = None
-    self.visited = False
-
-    self.make_neighbors()
-    self.update_neighbors()
-    # print(f"Node {self.coord} Neighbors: {self.neighbors}")
-
-
-
-  def make_neighbors(self):
-    """Add neighbors to Node"""
-    primitive_list = []
-    # down
-    primitive_list.append((self.coord[0], self.coord[1], self.coord[2]-1))
-    # down straight
-    primitive_list.append((self.coord[0]+1, self.coord[1], self.coord[2]-1))
-    primitive_list.append((self.coord[0], self.coord[1]+1, self.coord[2]-1))
-    primitive_list.append((self.coord[0]-1, self.coord[1], self.coord[2]-1))
-    primitive_list.append((self.coord[0], self.coord[1]-1, self.coord[2]-1))
-    # down cross
-    primitive_list.append((self.coord[0]+1, self.coord[1]+1, self.coord[2]-1))
-    primitive_list.append((self.coord[0]-1, self.coord[1]+1, self.coord[2]-1))
-    primitive_list.append((self.coord[0]-1, self.coord[1]-1, self.coord[2]-1))
-    primitive_list.append((self.coord[0]+1, self.coord[1]-1, self.coord[2]-1))
-    # straight
-    primitive_list.append((self.coord[0]+1, self.coord[1], self.coord[2]))
-    primitive_list.append((self.coord[0], self.coord[1]+1, self.coord[2]))
-    primitive_list.append((self.coord[0]-1, self.coord[1], self.coord[2]))
-    primitive_list.append((self.coord[0], self.coord[1]-1, self.coord[2]))
-    # cross
-    primitive_list.append((self.coord[0]+1, self.coord[1]+1, self.coord[2]))
-    primitive_list.append((self.coord[0]-1, self.coord[1]+1, self.coord[2]))
-    primitive_list.append((self.coord[0]-1, self.coord[1]-1, self.coord[2]))
-    primitive_list.append((self.coord[0]+1, self.coord[1]-1, self.coord[2]))
-    # up
-    primitive_list.append((self.coord[0], self.coord[1], self.coord[2]+1))
-    # up straight
-    primitive_list.append((self.coord[0]+1, self.coord[1], self.coord[2]+1))
-    primitive_list.append((self.coord[0], self.coord[1]+1, self.coord[2]+1))
-    primitive_list.append((self.coord[0]-1, self.coord[1], self.coord[2]+1))
-    primitive_list.append((self.coord[0], self.coord[1]-1, self.coord[2]+1))
-    # up cross
-    primitive_list.append((self.coord[0]+1, self.coord[1]+1, self.coord[2]+1))
-    primitive_list.append((self.coord[0]-1, self.coord[1]+1, self.coord[2]+1))
-    primitive_list.append((self.coord[0]-1, self.coord[1]-1, self.coord[2]+1))
-    primitive_list.append((self.coord[0]+1, self.coord[1]-1, self.coord[2]+1))
-
-    # filter with grid limit
-    filtered_list = []
-    for coord in primitive_list:
-      if self.check_valid_coord(coord, self.limit_coord):
-        filtered_list.append(coord)
-
-    self.all_neighbors = filtered_list
-
-
-
-  # return if G is updated
-  def update_FGHL(self, from_node, dest_node):
-    """Helper to update F G H L values"""
-    self.H = self.calculate_H(dest_node)
-    # print(f"Calculated H {self.coord} -> {dest_node.coord}, dest_h = {self.H}")
-    updated = self.update_G(from_node)
-    self.calculate_F()
-    # print(f"Updated All F G H L")
-    return updated
-
-  # F = G (lenght already traveled) + H (lenght excepted)
-  def calculate_F(self):
-    """Helper Function"""
-    self.F = self.G + self.H
-    # print(f"Calculated F from G + H: {self.F}")
-    return self.F
-
-  # max will make it go cross first, then straight (gather same direction segment)
-  # plus some real distance so it head toward the target
-  def calculate_H(self, dest_node):
-    """Helper Function"""
-    x1,y1,z1 = self.coord
-    x2,y2,z2 = dest_node.coord
-    dest_h = max(abs(x1-x2), abs(y1-y2), abs(z1-z2)) + 0.4*(self.square_root(self.coord, dest_node.coord))
-    # dest_h = max(abs(x1-x2), abs(y1-y2), abs(z1-z2)) + 0.1*(self.square_root(self.coord, dest_node.coord))
-    return dest_h
-
-  # return if G is updated (decreased)
-  def update_G(self, from_node):
-    """Helper Function"""
-    dis = self.get_from_dis(from_node)
-    new_g = from_node.G + dis
-    # print(f"Calculated G from Node {from_node.coord} to {self.coord}, new_g = {new_g}")
-    if new_g < self.G:
-      self.update_last_visited(from_node)
-      # print(f"Update G: {self.G} -> {new_g}")
-      self.G = new_g
-      return True
-    # print(f"G Not updated")
-    return False
-
-  def update_last_visited(self, from_node):
-    """Helper Function"""
-    # print(f"Update last_visited: {self.last_visited} -> {from_node.coord}")
-    self.last_visited = from_node
-    return
-
-  def update_neighbors(self):
-    """Helper Function"""
-    self.neighbors = []
-    for coord in self.all_neighbors:
-      if self.blocked_neighbors.count(coord) == 0:
-        self.neighbors.append(coord)
-    return
-
-  # reward for heading down and staying on the bottom
-  def get_from_dis(self, from_node):
-    """Helper Function"""
-    # 1 -> 2, from -> this
-    x1,y1,z1 = from_node.coord
-    x2,y2,z2 = self.coord
-
-    dis = self.square_root(from_node.coord, self.coord)
-    if (z1 - z2) == 1: # heading down
-      dis = self.square_root((x1,y1,z1), (x2,y2,z1))
-    if z2 == 0:
-      dis -= .1
-    return dis
-
-  # add node to blocked_neighbors list
-  def add_block_neighbors(self, neighbor):
-    """Helper Function"""
-    if self.all_neighbors.count(neighbor.coord) == 0:
-      print(f"Error: {neighbor.coord} is not in neighbors list of Node {self.coord}")
-      return None
-    if self.blocked_neighbors.count(neighbor.coord) == 0:
-      self.blocked_neighbors.append(neighbor.coord)
-      self.update_neighbors()
-    # print(f"Added {neighbor.coord} to Node {self.coord} blocked neighbor list")
-    return
-
-
-  # check if coord is in valid range
-  def check_valid_coord(self, coord, limit_coord):
-    """Helper Function"""
-    valid = True
-    for i in range(len(coord)):
-      valid &= (coord[i] <= limit_coord[i] and coord[i] >= 0)
-    return valid
-
-  # helper for calculating distance between two nodes
-  def square_root(self, coord_a, coord_b):
-    """Helper Function"""
-    a_x, a_y, a_z = coord_a
-    b_x, b_y, b_z = coord_b
-    dis = math.sqrt((a_x - b_x) ** 2 + (a_y - b_y) ** 2 + (a_z - b_z) ** 2)
-    return dis
-
-  # reset node for next path finding
-  def reset_node(self):
-    """Reset the node after each path finding"""
-    self.F = float("inf")
-    self.G = float("inf")
-    self.H = float("inf")
-    self.last_visited = None
-    self.visited = False
-    self.blocked_neighbors = []
-    self.update_neighbors()
+# offset of all 26 neighbors of a node
+# order matters, A star visits neighbors in this order
+NEIGHBOR_OFFSETS = (
+  # down
+  (0, 0, -1),
+  # down straight
+  (1, 0, -1), (0, 1, -1), (-1, 0, -1), (0, -1, -1),
+  # down cross
+  (1, 1, -1), (-1, 1, -1), (-1, -1, -1), (1, -1, -1),
+  # straight
+  (1, 0, 0), (0, 1, 0), (-1, 0, 0), (0, -1, 0),
+  # cross
+  (1, 1, 0), (-1, 1, 0), (-1, -1, 0), (1, -1, 0),
+  # up
+  (0, 0, 1),
+  # up straight
+  (1, 0, 1), (0, 1, 1), (-1, 0, 1), (0, -1, 1),
+  # up cross
+  (1, 1, 1), (-1, 1, 1), (-1, -1, 1), (1, -1, 1),
+)
+NEIGHBOR_NUM = len(NEIGHBOR_OFFSETS)
+# {offset : direction index}
+DIRECTION_INDEX = {offset : i for i, offset in enumerate(NEIGHBOR_OFFSETS)}
+# direction index pointing back
+OPPOSITE_DIRECTION = tuple(DIRECTION_INDEX[(-dx, -dy, -dz)] for dx, dy, dz in NEIGHBOR_OFFSETS)
+# bit of each direction in a node's blocked mask
+NEIGHBOR_BIT = tuple(1 << i for i in range(NEIGHBOR_NUM))
+ALL_DIRECTION_MASK = (1 << NEIGHBOR_NUM) - 1
+
+# step cost of each direction
+# heading down only costs the horizontal distance (reward for going down)
+STEP_COST = tuple(math.sqrt(dx**2 + dy**2 + (0 if dz == -1 else dz**2)) for dx, dy, dz in NEIGHBOR_OFFSETS)
+# step cost when landing on the bottom layer (reward for staying on the bottom)
+GROUND_STEP_COST = tuple(cost - .1 for cost in STEP_COST)
+
+# directions that leave the grid when standing on the low / high border of an axis
+def make_border_mask(axis, side):
+  """Helper Function"""
+  mask = 0
+  for direction, offset in enumerate(NEIGHBOR_OFFSETS):
+    if offset[axis] == side:
+      mask |= NEIGHBOR_BIT[direction]
+  return mask
+
+LOW_BORDER_MASK = tuple(make_border_mask(axis, -1) for axis in range(3))
+HIGH_BORDER_MASK = tuple(make_border_mask(axis, 1) for axis in range(3))
 
 
 ############################################################################################
@@ -214,21 +77,48 @@ class Node:
 class Grid:
   """
   Grid Class
-  The Grid is graph with nodes(Node object) and coonections(Node neighbors)
+  The Grid is graph with nodes and coonections(neighbors of node)
+  Nodes are stored as flat index into arrays instead of objects
+  A node is referred to by its coord outside of the Grid
   Impliment A star path finding on this graph
   """
 
 
-  def __init__(self, dimention):
+  def __init__(self, dimention, search_mode="ASTAR", bidirectional_ground_path=False, storage="DENSE"):
     # blockPrint()
 
     self.dimention = dimention
-    self.node_grid = []
-    self.node_grid = self.make_grid()
+    # "DENSE" allocates every node up front, "CHUNKED" only the blocks that get written to
+    self.storage = storage
+    # "ASTAR" expands node by node, "JPS" jumps along free runs (see jump_point_search)
+    # "HPA" searches between clusters first (see hierarchical_path_finding.py)
+    self.search_mode = search_mode
+    # cluster graph of "HPA" mode, made on first use
+    self.hierarchy = None
+    # search ground-ground paths from both ends (see bidirectional_path_finding)
+    self.bidirectional_ground_path = bidirectional_ground_path
+    # heuristic weight of the bidirectional search, 1 finds the cheapest path
+    self.bidirectional_weight = 1
+    # heuristic weight of the multi source search used for junction, bridge and tree paths
+    self.tree_weight = 3
+    # extra cost of stepping onto a node, only used by path_finding (A star)
+    # set by negotiated routing (see negotiated_routing.py), None for no extra cost
+    # {node_index : cost}
+    self.node_cost = None
+    # number of nodes along each axis, dimention is inclusive
+    self.shape = (dimention[0]+1, dimention[1]+1, dimention[2]+1)
+    # flat index = x * stride[0] + y * stride[1] + z
+    self.stride = (self.shape[1] * self.shape[2], self.shape[2], 1)
+    self.node_num = self.shape[0] * self.shape[1] * self.shape[2]
+    # flat index offset of each neighbor direction
+    self.neighbor_step = tuple(dx * self.stride[0] + dy * self.stride[1] + dz for dx, dy, dz in NEIGHBOR_OFFSETS)
+    # directions that stay inside the grid, one table per axis indexed by the coord on that axis
+    # valid directions of a node = x_mask[x] & y_mask[y] & z_mask[z]
+    self.axis_valid_mask = tuple(self.make_axis_valid_mask(axis) for axis in range(3))
+    # square roots of every squared distance inside the grid, heuristic works on integer deltas
+    self.sqrt_table = [math.sqrt(i) for i in range(sum(d**2 for d in dimention) + 1)]
+    self.make_grid()
 
-    # store all the nodes that are ocupied by obstacles
-    # [node_list]
-    self.obsticales = []
     # store all the ground paths
     # only ground path can merge together
     # {(start_node, end_node) : [path_node_list]}
@@ -239,6 +129,13 @@ class Grid:
     # store all the tip_ground path
     # {tip_node : [ground_node, is_start, [path_node_list]]}
     self.tip_ground_table = {}
+    # indexes of saved_path and tip_ground_table, only changed by the save / remove helpers
+    # {node : {path_key : position of node in the path}}
+    self.path_owner = {}
+    # {end_node : [path_key]}
+    self.path_end = {}
+    # {ground_node : tip_node}
+    self.ground_tip = {}
     # store all the connections
     # generated after all path are processed
     # {(start_node, end_node) : [path_node_list]}
@@ -247,262 +144,959 @@ class Grid:
     self.error_message_list = []
     # stores user related warning messages
     self.warning_message_list = []
+    # nodes pushed into / expanded from the open set
+    # for the last A star search and summed over all searches
+    self.search_count = {"pushed": 0, "expanded": 0}
+    self.total_search_count = {"pushed": 0, "expanded": 0}
 
 
 
-  # make a grid of nodes
+  # make arrays that hold the state of every node
   def make_grid(self):
-    """Construct the imaginary as a list of list of list of nodes"""
-    X_list = []
-    for x in range(self.dimention[0]+1):
-      Y_list = []
-      for y in range(self.dimention[1]+1):
-        Z_list = []
-        for z in range(self.dimention[2]+1):
-          Z_list.append(Node((x,y,z), self.dimention))
-        Y_list.append(Z_list)
-      X_list.append(Y_list)
-    return X_list
+    """Construct the imaginary grid as flat arrays indexed by node"""
+    # F = G + H
+    self.F = self.make_layer(np.float64, np.inf)
+    self.G = self.make_layer(np.float64, np.inf)
+    self.H = self.make_layer(np.float64, np.inf)
+    # index of the node we came from, -1 for none
+    self.last_visited = self.make_layer(np.int64, -1)
+    # search values of a node are only valid if its stamp equals search_generation
+    # a reset starts a new generation instead of clearing every node
+    self.search_generation = 1
+    self.search_stamp = self.make_layer(np.uint32, 0)
+    # node is fully processed in the search of this generation
+    self.closed_stamp = self.make_layer(np.uint32, 0)
+
+    # persistent layers, only change when a path is saved / removed
+    # number of saved paths (ground and tip_ground) going through the node
+    self.occupied = self.make_layer(np.int32, 0)
+    # nodes ocupied by obstacles
+    self.obstacle = self.make_layer(bool, False)
+    # ocupied nodes opened up for the next search, cleared on reset
+    # {node_index}
+    self.released = set()
+    # neighbors blocked by other connection, one bit per direction
+    self.blocked_mask = self.make_layer(np.uint32, 0)
+    # number of saved paths cutting each blocked connection
+    # {(node_index, direction) : count}
+    self.blocked_edge_count = {}
+    # connections cut by each saved path
+    # {(start_node, end_node) : [(node_index, direction)]}
+    self.crossover_log = {}
+
+
+  # one value per node, see grid_storage.py
+  def make_layer(self, dtype, default):
+    """Helper Function"""
+    if self.storage == "CHUNKED":
+      return grid_storage.ChunkedLayer(self.shape, dtype, default)
+    return np.full(self.node_num, default, dtype=dtype)
+
+  # dense numpy array of a layer over a box of nodes (tuple of 3 slices), the whole grid if None
+  def get_layer_box(self, layer, box=None):
+    """Helper Function"""
+    if box is None:
+      box = (slice(None), slice(None), slice(None))
+    if isinstance(layer, np.ndarray):
+      return layer.reshape(self.shape)[box]
+    return layer.get_box(box)
+
+  # bytes held by all node layers
+  def get_memory_usage(self):
+    """Helper Function"""
+    layer_list = [self.F, self.G, self.H, self.last_visited, self.search_stamp, self.closed_stamp, self.occupied, self.obstacle, self.blocked_mask]
+    return sum(layer.nbytes for layer in layer_list)
+
+
+  ###########################################  node helpers  ########################################
+
+  def get_index(self, coord):
+    """Helper Function"""
+    x, y, z = coord
+    return int(x) * self.stride[0] + int(y) * self.stride[1] + int(z)
+
+  def get_coord(self, index):
+    """Helper Function"""
+    x, rest = divmod(index, self.stride[0])
+    y, z = divmod(rest, self.stride[1])
+    return (x, y, z)
+
+  def get_node(self, coord):
+    """Helper Function"""
+    return tuple(map(int, coord))
+
+  # check if coord is in valid range
+  def check_valid_coord(self, coord):
+    """Helper Function"""
+    valid = True
+    for i in range(len(coord)):
+      valid &= (coord[i] <= self.dimention[i] and coord[i] >= 0)
+    return valid
+
+  # valid directions for every coord along one axis
+  def make_axis_valid_mask(self, axis):
+    """Helper Function"""
+    mask_list = []
+    for i in range(self.shape[axis]):
+      mask = ALL_DIRECTION_MASK
+      if i == 0:
+        mask &= ~LOW_BORDER_MASK[axis]
+      if i == self.dimention[axis]:
+        mask &= ~HIGH_BORDER_MASK[axis]
+      mask_list.append(mask)
+    return tuple(mask_list)
+
+  # directions within limit of grid and not blocked by other connection
+  def get_open_mask(self, index):
+    """Helper Function"""
+    x, y, z = self.get_coord(index)
+    x_mask, y_mask, z_mask = self.axis_valid_mask
+    return x_mask[x] & y_mask[y] & z_mask[z] & ~int(self.blocked_mask[index])
+
+  # neighbors within limit of grid and not blocked by other connection
+  def get_neighbors(self, index):
+    """Helper Function"""
+    open_mask = self.get_open_mask(index)
+    return [index + self.neighbor_step[direction] for direction in range(NEIGHBOR_NUM) if open_mask & NEIGHBOR_BIT[direction]]
+
+  # max will make it go cross first, then straight (gather same direction segment)
+  # plus some real distance so it head toward the target
+  def calculate_H(self, index, dest_index):
+    """Helper Function"""
+    x1,y1,z1 = self.get_coord(index)
+    x2,y2,z2 = self.get_coord(dest_index)
+    return self.calculate_H_delta(x1-x2, y1-y2, z1-z2)
+
+  # same as calculate_H, on integer deltas
+  def calculate_H_delta(self, dx, dy, dz):
+    """Helper Function"""
+    dx, dy, dz = abs(dx), abs(dy), abs(dz)
+    return max(dx, dy, dz) + 0.4*self.sqrt_table[dx*dx + dy*dy + dz*dz]
+
+  # reward for heading down and staying on the bottom
+  def get_from_dis(self, index, from_index):
+    """Helper Function"""
+    # 1 -> 2, from -> this
+    x1,y1,z1 = self.get_coord(from_index)
+    x2,y2,z2 = self.get_coord(index)
+    direction = DIRECTION_INDEX[(x2-x1, y2-y1, z2-z1)]
+    if z2 == 0:
+      return GROUND_STEP_COST[direction]
+    return STEP_COST[direction]
 
 
   ###########################################  path finding  ########################################
 
   # A* path finding
+  # open set is a binary heap, stale entries are skipped when popped (lazy deletion)
+  # a node is pushed again only when its G value decreased
   def path_finding(self, start_coord, end_coord):
     """A Star path finding"""
+    if self.search_mode == "JPS":
+      path = self.jump_point_search(start_coord, end_coord)
+      if path:
+        return path
+      print("Jump point search failed, fall back to A star")
+    if self.search_mode == "HPA" and not self.get_hierarchy().is_near(start_coord, end_coord):
+      path = self.get_hierarchy().path_finding(start_coord, end_coord)
+      if path:
+        return path
+      print("Hierarchical search failed, fall back to A star")
     print(f"Looking for path from {start_coord} to {end_coord}")
-    start_node = self.node_grid[start_coord[0]][start_coord[1]][start_coord[2]]
-    end_node = self.node_grid[end_coord[0]][end_coord[1]][end_coord[2]]
+    start_index = self.get_index(start_coord)
+    end_index = self.get_index(end_coord)
 
-    if start_node.visited:
-      print(f"Error: Start Node {start_node.coord} is already in use")
+    if self.node_in_use(start_index):
+      print(f"Error: Start Node {self.get_coord(start_index)} is already in use")
       return []
-    if end_node.visited:
-      print(f"Error: End Node {end_node.coord} is already in use")
+    if self.node_in_use(end_index):
+      print(f"Error: End Node {self.get_coord(end_index)} is already in use")
       return []
 
-    search_queue = PriorityQueue()
-    # list that keep track of the nodes in the queue
-    # update at the same time
-    search_list = []
-
-    search_queue.put((1, 0, start_node))
-    search_list.append(start_node)
-
-    start_node.G = 0
+    # (priority, push order, node_index)
+    search_queue = [(1, 0, start_index)]
+
+    generation = self.search_generation
+    end_x, end_y, end_z = self.get_coord(end_index)
+    x_mask, y_mask, z_mask = self.axis_valid_mask
+    neighbor_step = self.neighbor_step
+    node_cost = self.node_cost
+    self.search_stamp[start_index] = generation
+    self.G[start_index] = 0
+    self.last_visited[start_index] = -1
     node_count = 0
     processed_node_count = 0
 
-    while not search_queue.empty():
-      this_node = search_queue.get()[2]
-      # print(f"\nWorking on Node {this_node.coord}")
+    while search_queue:
+      this_index = heapq.heappop(search_queue)[2]
 
-      if this_node is end_node:
+      if this_index == end_index:
         print("Path Found")
-        path = self.record_path(start_node, end_node)
+        self.record_search_count(node_count, processed_node_count)
+        path = self.record_path(start_index, end_index)
         print(f"Searched {node_count} Nodes")
         print(f"Fully Processed {processed_node_count} Nodes")
-        self.cut_all_crossover()
         return path
 
-
-      for coord in this_node.neighbors:
-        x,y,z = coord
-        neighbor_node = self.node_grid[x][y][z]
-        if not neighbor_node.visited:
-          # calculate F,G,H value of neighbor and put in heap
-          updated = neighbor_node.update_FGHL(this_node, end_node)
-          # check if is in heap or updated G value
-          if updated or search_list.count(neighbor_node) == 0:
-            node_count += 1
-            search_queue.put((1*neighbor_node.H + 0.2*neighbor_node.G, node_count, neighbor_node))
-            search_list.append(neighbor_node)
-            # print(f"Added Node {neighbor_node.coord}, F = {neighbor_node.F}, node_count = {node_count}")
-
-      this_node.visited = True
+      # already processed with a smaller G, stale entry
+      if self.closed_stamp[this_index] == generation:
+        continue
+
+      # relax neighbors with the direction tables
+      x, y, z = self.get_coord(this_index)
+      open_mask = x_mask[x] & y_mask[y] & z_mask[z] & ~int(self.blocked_mask[this_index])
+      this_g = float(self.G[this_index])
+      for direction in range(NEIGHBOR_NUM):
+        if not open_mask & NEIGHBOR_BIT[direction]:
+          continue
+        neighbor_index = this_index + neighbor_step[direction]
+        if self.closed_stamp[neighbor_index] == generation:
+          continue
+        if (self.occupied[neighbor_index] or self.obstacle[neighbor_index]) and neighbor_index not in self.released:
+          continue
+
+        dx, dy, dz = NEIGHBOR_OFFSETS[direction]
+        neighbor_z = z + dz
+        new_g = this_g + (GROUND_STEP_COST[direction] if neighbor_z == 0 else STEP_COST[direction])
+        if node_cost is not None:
+          new_g += node_cost.get(neighbor_index, 0)
+        if self.search_stamp[neighbor_index] != generation:
+          # first touch in this search, values are left from an earlier one
+          self.search_stamp[neighbor_index] = generation
+        elif new_g >= self.G[neighbor_index]:
+          continue
+
+        # put in heap since G decreased
+        h = self.calculate_H_delta(x+dx-end_x, y+dy-end_y, neighbor_z-end_z)
+        self.last_visited[neighbor_index] = this_index
+        self.G[neighbor_index] = new_g
+        self.H[neighbor_index] = h
+        # F = G (lenght already traveled) + H (lenght excepted)
+        self.F[neighbor_index] = new_g + h
+        node_count += 1
+        heapq.heappush(search_queue, (1*h + 0.2*new_g, node_count, neighbor_index))
+
+      self.closed_stamp[this_index] = generation
       processed_node_count += 1
-      # print(f"Processed Node {this_node.coord}")
 
+    self.record_search_count(node_count, processed_node_count)
     self.register_error_message(f"ERROR: No path found for {start_coord} - {end_coord}")
     return []
 
 
+  def record_search_count(self, pushed, expanded):
+    """Helper Function"""
+    self.search_count = {"pushed": pushed, "expanded": expanded}
+    self.total_search_count["pushed"] += pushed
+    self.total_search_count["expanded"] += expanded
+
+
   # get the path by tracing backwards from end
-  def record_path(self, start_node, end_node):
+  def record_path(self, start_index, end_index):
     """Collect the path after path finding"""
-    # print(f"Recording Path from {start_node.coord} to {end_node.coord}")
-    this_node = end_node
+    this_index = end_index
     path_node_list = []
 
-    while this_node is not start_node:
-      path_node_list.insert(0, this_node)
-      this_node = this_node.last_visited
-    path_node_list.insert(0, start_node)
+    while this_index != start_index:
+      path_node_list.insert(0, self.get_coord(this_index))
+      this_index = int(self.last_visited[this_index])
+    path_node_list.insert(0, self.get_coord(start_index))
+
+    self.save_path((path_node_list[0], path_node_list[-1]), path_node_list)
+    self.reset_grid()
+
+    print(f"Path: {path_node_list}")
+    return path_node_list
+
+
+  # cluster graph used by "HPA" mode
+  def get_hierarchy(self):
+    """Helper Function"""
+    if self.hierarchy is None:
+      # imported here, hierarchical_path_finding imports this module
+      import fluid_circuit_generator.hierarchical_path_finding as hierarchical_path_finding
+      self.hierarchy = hierarchical_path_finding.ClusterGraph(self)
+    return self.hierarchy
+
+
+  #####################################  jump point search  ########################################
+
+  # A* that only stops at jump points, cells in between are skipped
+  # from a jump point, each of the 26 directions is followed until
+  #   the goal, a cell next to an occupied / obstacle node or a cut crossover,
+  #   a cell on the bottom layer reached by moving down,
+  #   or a cell where a moving axis lines up with the goal, alone or diagonally with another axis
+  # the run is given up if it hits a used node, a cut edge or the border
+  # step costs and the H + 0.2*G priority are the same as path_finding
+  # the path is interpolated between jump points when recorded
+  # path cost can differ from path_finding:
+  #   runs are only straight lines, so ties between equally good cells are broken differently,
+  #   and the H + 0.2*G priority is not exact either way
+  # return [] without registering an error if nothing is found, path_finding then falls back to A*
+  def jump_point_search(self, start_coord, end_coord):
+    """Jump Point Search"""
+    print(f"Jump point search from {start_coord} to {end_coord}")
+    start_index = self.get_index(start_coord)
+    end_index = self.get_index(end_coord)
+
+    if self.node_in_use(start_index) or self.node_in_use(end_index):
+      return []
+
+    near_feature = self.get_near_feature_mask()
+    # (priority, push order, node_index)
+    search_queue = [(1, 0, start_index)]
+
+    generation = self.search_generation
+    end_coord = self.get_coord(end_index)
+    x_mask, y_mask, z_mask = self.axis_valid_mask
+    self.search_stamp[start_index] = generation
+    self.G[start_index] = 0
+    self.last_visited[start_index] = -1
+    node_count = 0
+    processed_node_count = 0
+
+    while search_queue:
+      this_index = heapq.heappop(search_queue)[2]
+
+      if this_index == end_index:
+        print("Path Found")
+        self.record_search_count(node_count, processed_node_count)
+        path = self.record_jump_path(start_index, end_index)
+        print(f"Searched {node_count} Jump Points")
+        print(f"Fully Processed {processed_node_count} Jump Points")
+        return path
+
+      if self.closed_stamp[this_index] == generation:
+        continue
+
+      x, y, z = self.get_coord(this_index)
+      open_mask = x_mask[x] & y_mask[y] & z_mask[z] & ~int(self.blocked_mask[this_index])
+      this_g = float(self.G[this_index])
+      for direction in range(NEIGHBOR_NUM):
+        if not open_mask & NEIGHBOR_BIT[direction]:
+          continue
+        neighbor_index = this_index + self.neighbor_step[direction]
+        if (self.occupied[neighbor_index] or self.obstacle[neighbor_index]) and neighbor_index not in self.released:
+          continue
+        jump = self.jump(this_index, (x, y, z), direction, end_index, end_coord, near_feature)
+        if jump is None:
+          continue
+        jump_index, (jump_x, jump_y, jump_z), jump_cost = jump
+        if self.closed_stamp[jump_index] == generation:
+          continue
+
+        new_g = this_g + jump_cost
+        if self.search_stamp[jump_index] != generation:
+          self.search_stamp[jump_index] = generation
+        elif new_g >= self.G[jump_index]:
+          continue
+
+        h = self.calculate_H_delta(jump_x-end_coord[0], jump_y-end_coord[1], jump_z-end_coord[2])
+        self.last_visited[jump_index] = this_index
+        self.G[jump_index] = new_g
+        self.H[jump_index] = h
+        self.F[jump_index] = new_g + h
+        node_count += 1
+        heapq.heappush(search_queue, (1*h + 0.2*new_g, node_count, jump_index))
+
+      self.closed_stamp[this_index] = generation
+      processed_node_count += 1
+
+    self.record_search_count(node_count, processed_node_count)
+    print(f"No jump point path found for {start_coord} - {end_coord}")
+    return []
+
+
+  # follow one direction from a node until a jump point
+  # the first step is checked by the caller
+  # a cell that is not near_feature has only free neighbors and no cut edges,
+  # so the run only has to watch the border after that
+  # return (jump_index, jump_coord, cost of the run) or None
+  def jump(self, index, coord, direction, end_index, end_coord, near_feature):
+    """Helper Function"""
+    x, y, z = coord
+    dx, dy, dz = NEIGHBOR_OFFSETS[direction]
+    step = self.neighbor_step[direction]
+    end_x, end_y, end_z = end_coord
+    # steps before the run leaves the grid
+    max_step = min(dimention - c if d > 0 else c for c, d, dimention in zip(coord, (dx, dy, dz), self.dimention) if d)
+    cost = 0
+
+    for i in range(max_step):
+      index += step
+      x, y, z = x+dx, y+dy, z+dz
+      cost += GROUND_STEP_COST[direction] if z == 0 else STEP_COST[direction]
+
+      if index == end_index or near_feature[index]:
+        return (index, (x, y, z), cost)
+      # landed on the bottom, steps cost less from here on
+      if dz and z == 0:
+        return (index, (x, y, z), cost)
+      # lines up with the goal on one axis, or on a diagonal of two axes
+      rest_x, rest_y, rest_z = abs(x-end_x), abs(y-end_y), abs(z-end_z)
+      if (dx and rest_x == 0) or (dy and rest_y == 0) or (dz and rest_z == 0):
+        return (index, (x, y, z), cost)
+      if ((dx or dy) and rest_x == rest_y) or ((dx or dz) and rest_x == rest_z) or ((dy or dz) and rest_y == rest_z):
+        return (index, (x, y, z), cost)
+    return None
+
+
+  # nodes next to a used node or touching a cut crossover, one byte per node
+  # released nodes count as free
+  def get_near_feature_mask(self):
+    """Helper Function"""
+    used = (self.get_layer_box(self.occupied) > 0) | self.get_layer_box(self.obstacle)
+    for index in self.released:
+      used[self.get_coord(index)] = False
+
+    near = np.zeros(self.shape, dtype=bool)
+    for dx, dy, dz in NEIGHBOR_OFFSETS:
+      # near[c] |= used[c + offset] for every c with c + offset inside the grid
+      target = tuple(slice(max(-d, 0), n - max(d, 0)) for d, n in zip((dx, dy, dz), self.shape))
+      source = tuple(slice(max(d, 0), n - max(-d, 0)) for d, n in zip((dx, dy, dz), self.shape))
+      near[target] |= used[source]
+
+    near |= self.get_layer_box(self.blocked_mask) != 0
+    near = near.reshape(-1)
+    # bytes index faster than a numpy array in the jump loop
+    return near.tobytes()
+
+
+  # trace jump points backwards from end, fill in the straight runs between them
+  def record_jump_path(self, start_index, end_index):
+    """Collect the path after jump point search"""
+    jump_list = [end_index]
+    while jump_list[-1] != start_index:
+      jump_list.append(int(self.last_visited[jump_list[-1]]))
+    jump_list.reverse()
+
+    path_node_list = [self.get_coord(start_index)]
+    for from_index, to_index in zip(jump_list, jump_list[1:]):
+      x1, y1, z1 = self.get_coord(from_index)
+      x2, y2, z2 = self.get_coord(to_index)
+      run_length = max(abs(x2-x1), abs(y2-y1), abs(z2-z1))
+      dx, dy, dz = (x2-x1)//run_length, (y2-y1)//run_length, (z2-z1)//run_length
+      for i in range(1, run_length+1):
+        path_node_list.append((x1 + i*dx, y1 + i*dy, z1 + i*dz))
+
+    self.save_path((path_node_list[0], path_node_list[-1]), path_node_list)
+    self.reset_grid()
+
+    print(f"Path: {path_node_list}")
+    return path_node_list
+
+
+  # total step cost of a path, same costs as path finding
+  def get_path_cost(self, path):
+    """Helper Function"""
+    cost = 0
+    for from_coord, to_coord in zip(path, path[1:]):
+      cost += self.get_from_dis(self.get_index(to_coord), self.get_index(from_coord))
+    return cost
+
+
+  ##################################  bidirectional search  ######################################
+
+  # A* from both ends at once, meets in the middle
+  # step costs from get_from_dis can be negative (landing straight down on the bottom costs -.1),
+  # so every step is searched with a reduced cost:
+  #   reduced cost = cost + potential(from) - potential(to), potential = .1 above the bottom layer
+  # this is never negative and shifts every start-end path by the same amount, so the best path stays the same
+  # heuristic is .9 * max(horizontal chebyshev distance, height still to climb)
+  #   every step that brings either down by one costs at least .9, so it is consistent
+  #   the backward search uses the same bound towards the start with the climb reversed
+  # search stops once the smaller key of either open set reaches the best meeting cost found
+  # weight > 1 multiplies the heuristic, fewer expansions for a possibly longer path
+  # the path found is the cheapest one, not the one path_finding (H + 0.2*G) would pick
+  # search state of each direction is kept in dicts, the Grid arrays are not touched
+  def bidirectional_path_finding(self, start_coord, end_coord, weight=1):
+    """Bidirectional A Star path finding"""
+    print(f"Looking for path from {start_coord} to {end_coord} from both ends")
+    start_index = self.get_index(start_coord)
+    end_index = self.get_index(end_coord)
+
+    if self.node_in_use(start_index):
+      print(f"Error: Start Node {self.get_coord(start_index)} is already in use")
+      return []
+    if self.node_in_use(end_index):
+      print(f"Error: End Node {self.get_coord(end_index)} is already in use")
+      return []
+
+    start_x, start_y, start_z = self.get_coord(start_index)
+    end_x, end_y, end_z = self.get_coord(end_index)
+    x_mask, y_mask, z_mask = self.axis_valid_mask
+    # [forward, backward]
+    g_list = [{start_index: 0}, {end_index: 0}]
+    parent_list = [{start_index: -1}, {end_index: -1}]
+    closed_list = [set(), set()]
+    # (key, push order, node_index)
+    queue_list = [[(0, 0, start_index)], [(0, 0, end_index)]]
+    expanded_list = [0, 0]
+    node_count = 0
+    best_cost = math.inf
+    meet_index = start_index if start_index == end_index else -1
+
+    while queue_list[0] and queue_list[1]:
+      # no path through either frontier can beat the best meeting found
+      if max(queue_list[0][0][0], queue_list[1][0][0]) >= best_cost:
+        break
+      # expand the smaller frontier
+      side = 0 if len(queue_list[0]) <= len(queue_list[1]) else 1
+      this_index = heapq.heappop(queue_list[side])[2]
+      if this_index in closed_list[side]:
+        continue
+      closed_list[side].add(this_index)
+      expanded_list[side] += 1
+
+      g_this_side = g_list[side]
+      g_other_side = g_list[1-side]
+      x, y, z = self.get_coord(this_index)
+      open_mask = x_mask[x] & y_mask[y] & z_mask[z] & ~int(self.blocked_mask[this_index])
+      this_g = g_this_side[this_index]
+      this_potential = .1 if z else 0
+      for direction in range(NEIGHBOR_NUM):
+        if not open_mask & NEIGHBOR_BIT[direction]:
+          continue
+        neighbor_index = this_index + self.neighbor_step[direction]
+        if neighbor_index in closed_list[side]:
+          continue
+        if (self.occupied[neighbor_index] or self.obstacle[neighbor_index]) and neighbor_index not in self.released:
+          continue
+
+        dx, dy, dz = NEIGHBOR_OFFSETS[direction]
+        neighbor_x, neighbor_y, neighbor_z = x+dx, y+dy, z+dz
+        neighbor_potential = .1 if neighbor_z else 0
+        if side == 0:
+          # this -> neighbor
+          cost = GROUND_STEP_COST[direction] if neighbor_z == 0 else STEP_COST[direction]
+          new_g = this_g + (cost + this_potential - neighbor_potential)
+        else:
+          # neighbor -> this
+          reverse = OPPOSITE_DIRECTION[direction]
+          cost = GROUND_STEP_COST[reverse] if z == 0 else STEP_COST[reverse]
+          new_g = this_g + (cost + neighbor_potential - this_potential)
+        if new_g >= g_this_side.get(neighbor_index, math.inf):
+          continue
+        g_this_side[neighbor_index] = new_g
+        parent_list[side][neighbor_index] = this_index
+
+        if neighbor_index in g_other_side and new_g + g_other_side[neighbor_index] < best_cost:
+          best_cost = new_g + g_other_side[neighbor_index]
+          meet_index = neighbor_index
+
+        if side == 0:
+          h = .9*max(abs(neighbor_x-end_x), abs(neighbor_y-end_y), end_z-neighbor_z)
+        else:
+          h = .9*max(abs(neighbor_x-start_x), abs(neighbor_y-start_y), neighbor_z-start_z)
+        node_count += 1
+        heapq.heappush(queue_list[side], (new_g + weight*h, node_count, neighbor_index))
+
+    expanded = expanded_list[0] + expanded_list[1]
+    self.record_search_count(node_count, expanded)
+    if meet_index == -1:
+      self.register_error_message(f"ERROR: No path found for {start_coord} - {end_coord}")
+      return []
 
-    self.saved_path[(start_node, end_node)] = path_node_list
+    print("Path Found")
+    print(f"Searched {node_count} Nodes")
+    print(f"Fully Processed {expanded} Nodes ({expanded_list[0]} forward, {expanded_list[1]} backward)")
+    # start -> meet, then meet -> end
+    path_node_list = []
+    this_index = meet_index
+    while this_index != -1:
+      path_node_list.insert(0, self.get_coord(this_index))
+      this_index = parent_list[0][this_index]
+    this_index = parent_list[1][meet_index]
+    while this_index != -1:
+      path_node_list.append(self.get_coord(this_index))
+      this_index = parent_list[1][this_index]
+
+    self.save_path((path_node_list[0], path_node_list[-1]), path_node_list)
     self.reset_grid()
 
-    print(f"Path: {list(map(lambda a: a.coord, path_node_list))}")
+    print(f"Path: {path_node_list}")
     return path_node_list
 
 
+  # A star from any node of start_list to whichever node of end_list is reached first
+  # start and end nodes may be in use, no other node in use is passed
+  # reduced cost as bidirectional_path_finding, the heuristic is taken to the bounding box of end_list
+  #   .9 * max(horizontal chebyshev distance to the box, height still to climb to the box bottom)
+  # weight > 1 multiplies the heuristic, fewer expansions for a possibly longer path
+  # start_cost / end_cost {coord : cost} are added when leaving a start node / reaching an end node
+  # search state is kept in dicts, the Grid arrays are not touched
+  # path is saved under (path[0], path[-1]), reset_grid at the end
+  def multi_path_finding(self, start_list, end_list, weight=1, start_cost=None, end_cost=None):
+    """Multi source multi target A Star path finding"""
+    print(f"Looking for path from {len(start_list)} start nodes to {len(end_list)} end nodes")
+    # {node_index : cost}
+    end_index_cost = {self.get_index(coord): end_cost.get(coord, 0) if end_cost else 0 for coord in end_list}
+    low_x, low_y, low_z = [min(coord[i] for coord in end_list) for i in range(3)]
+    high_x, high_y = [max(coord[i] for coord in end_list) for i in range(2)]
+    x_mask, y_mask, z_mask = self.axis_valid_mask
+
+    g_dict = {}
+    parent = {}
+    closed = set()
+    # (key, push order, node_index)
+    search_queue = []
+    for node_count, coord in enumerate(start_list):
+      index = self.get_index(coord)
+      g_dict[index] = start_cost.get(coord, 0) if start_cost else 0
+      parent[index] = -1
+      search_queue.append((g_dict[index], node_count, index))
+    heapq.heapify(search_queue)
+    node_count = len(search_queue)
+    end_index = -1
+
+    while search_queue:
+      this_index = heapq.heappop(search_queue)[2]
+      if this_index in end_index_cost:
+        end_index = this_index
+        break
+      if this_index in closed:
+        continue
+      closed.add(this_index)
+
+      x, y, z = self.get_coord(this_index)
+      open_mask = x_mask[x] & y_mask[y] & z_mask[z] & ~int(self.blocked_mask[this_index])
+      this_g = g_dict[this_index]
+      this_potential = .1 if z else 0
+      for direction in range(NEIGHBOR_NUM):
+        if not open_mask & NEIGHBOR_BIT[direction]:
+          continue
+        neighbor_index = this_index + self.neighbor_step[direction]
+        if neighbor_index in closed:
+          continue
+        if (self.occupied[neighbor_index] or self.obstacle[neighbor_index]) and neighbor_index not in end_index_cost:
+          continue
+
+        dx, dy, dz = NEIGHBOR_OFFSETS[direction]
+        neighbor_x, neighbor_y, neighbor_z = x+dx, y+dy, z+dz
+        cost = GROUND_STEP_COST[direction] if neighbor_z == 0 else STEP_COST[direction]
+        new_g = this_g + cost + this_potential - (.1 if neighbor_z else 0) + end_index_cost.get(neighbor_index, 0)
+        if new_g >= g_dict.get(neighbor_index, math.inf):
+          continue
+        g_dict[neighbor_index] = new_g
+        parent[neighbor_index] = this_index
+        h = .9*max(low_x-neighbor_x, neighbor_x-high_x, low_y-neighbor_y, neighbor_y-high_y, low_z-neighbor_z, 0)
+        node_count += 1
+        heapq.heappush(search_queue, (new_g + weight*h, node_count, neighbor_index))
+
+    self.record_search_count(node_count, len(closed))
+    if end_index == -1:
+      self.register_error_message(f"ERROR: No path found from {start_list} to {end_list}")
+      self.reset_grid()
+      return []
+
+    print("Path Found")
+    print(f"Searched {node_count} Nodes")
+    print(f"Fully Processed {len(closed)} Nodes")
+    path_node_list = []
+    this_index = end_index
+    while this_index != -1:
+      path_node_list.insert(0, self.get_coord(this_index))
+      this_index = parent[this_index]
+
+    self.save_path((path_node_list[0], path_node_list[-1]), path_node_list)
+    self.reset_grid()
+    print(f"Path: {path_node_list}")
+    return path_node_list
+
+
+  # path finding used for ground-ground paths
+  def find_ground_path(self, start_coord, end_coord):
+    """Helper Function"""
+    if self.bidirectional_ground_path:
+      return self.bidirectional_path_finding(start_coord, end_coord, self.bidirectional_weight)
+    return self.path_finding(start_coord, end_coord)
+
+
   #########################################  clean up  ############################################
 
   # reset grid for next path finding
+  # only starts a new search generation, saved paths and obstacles stay in the persistent layers
   def reset_grid(self):
-    for x in range(len(self.node_grid)):
-      for y in range(len(self.node_grid[x])):
-        for z in range(len(self.node_grid[x][y])):
-          self.node_grid[x][y][z].reset_node()
+    self.search_generation += 1
+    self.released.clear()
+    print("Grid Reset")
 
-    for key,value in self.saved_path.items():
-      this_saved_path = value
-      for node in this_saved_path:
-        node.visited = True
 
-    for key,value in self.tip_ground_table.items():
-      this_saved_path = value[2]
-      for node in this_saved_path:
-        node.visited = True
-    
-    print("Registered node as obstacle:")
-    for node in self.obsticales:
-      node.visited = True
-      print(node.coord)
-    self.cut_all_crossover()
-    print("Grid Reset")
+  # remove all paths, junctions and tip_ground paths, obstacles stay
+  def clear_paths(self):
+    """Helper Function"""
+    self.saved_path.clear()
+    self.saved_junction.clear()
+    self.tip_ground_table.clear()
+    self.path_owner.clear()
+    self.path_end.clear()
+    self.ground_tip.clear()
+    self.connection_dict.clear()
+    self.occupied.fill(0)
+    self.blocked_mask.fill(0)
+    self.blocked_edge_count.clear()
+    self.crossover_log.clear()
+    if self.hierarchy is not None:
+      self.hierarchy.mark_all_dirty()
+    self.reset_grid()
 
 
+  # add a ground path to saved_path, mark its nodes as ocupied and cut its crossovers
+  def save_path(self, path_key, path):
+    """Helper Function"""
+    if path_key in self.saved_path:
+      self.remove_saved_path(path_key)
+    self.saved_path[path_key] = path
+    for i, node in enumerate(path):
+      self.path_owner.setdefault(node, {})[path_key] = i
+    for node in path_key:
+      self.path_end.setdefault(node, []).append(path_key)
+    self.occupy_path(path, 1)
+    self.cut_path_crossover(path_key, path)
+
+  # remove a ground path from saved_path, free its nodes and restore its crossovers
+  def remove_saved_path(self, path_key):
+    """Helper Function"""
+    path = self.saved_path.pop(path_key)
+    for node in path:
+      owner = self.path_owner[node]
+      owner.pop(path_key, None)
+      if not owner:
+        del self.path_owner[node]
+    for node in path_key:
+      key_list = self.path_end[node]
+      key_list.remove(path_key)
+      if not key_list:
+        del self.path_end[node]
+    self.occupy_path(path, -1)
+    self.restore_path_crossover(path_key)
+    return path
+
+  # add a tip_ground path to tip_ground_table and mark its nodes as ocupied
+  def save_tip_ground_path(self, tip_node, ground_node, is_start, path):
+    """Helper Function"""
+    self.tip_ground_table[tip_node] = [ground_node, is_start, path]
+    self.ground_tip[ground_node] = tip_node
+    self.occupy_path(path, 1)
 
-  # cut all the crossing/ half crossing connections
-  def cut_all_crossover(self):
-    """Prevent path from intersecting with each other"""
-    for key, value in self.saved_path.items():
-      this_saved_path = value
-      node_coord_list = []
-      for node in key:
-        node_coord_list.append(node.coord)
-      for i, this_node in enumerate(this_saved_path):
-        if i == len(this_saved_path) - 1:
-          # print(f"All cross are trimmed for path {node_coord_list}")
-          break
-        next_node = this_saved_path[i+1]
-
-        x1, y1, z1 = this_node.coord
-        x2, y2, z2 = next_node.coord
-
-        dx = x1 - x2
-        dy = y1 - y2
-        dz = z1 - z2
-        difference = abs(dx) + abs(dy) + abs(dz)
-
-        # staright
-        if difference == 1:
-          pass
-        # 2D cross
-        if difference == 2:
-          # print(f"Flat cross detected at {this_node.coord} - {next_node.coord}")
-          x0 = min(x1, x2)
-          y0 = min(y1, y2)
-          z0 = min(z1, z2)
-          # y-z plane
-          if not dx:
-            self.unlink_nodes((x1,y1,z2), (x1,y2,z1))
-            if x0 != self.dimention[0]:
-              self.unlink_nodes((x0, y0, z0), (x0+1, y0+1, z0+1))
-              self.unlink_nodes((x0+1, y0, z0), (x0, y0+1, z0+1))
-              self.unlink_nodes((x0, y0+1, z0), (x0+1, y0, z0+1))
-              self.unlink_nodes((x0+1, y0+1, z0), (x0, y0, z0+1))
-            if x0 != 0:
-              self.unlink_nodes((x0-1, y0, z0), (x0, y0+1, z0+1))
-              self.unlink_nodes((x0, y0, z0), (x0-1, y0+1, z0+1))
-              self.unlink_nodes((x0-1, y0+1, z0), (x0, y0, z0+1))
-              self.unlink_nodes((x0, y0+1, z0), (x0-1, y0, z0+1))
-          # x-z plane
-          if not dy:
-            self.unlink_nodes((x1,y1,z2), (x2,y1,z1))
-            if y0 != self.dimention[1]:
-              self.unlink_nodes((x0, y0, z0), (x0+1, y0+1, z0+1))
-              self.unlink_nodes((x0+1, y0, z0), (x0, y0+1, z0+1))
-              self.unlink_nodes((x0, y0+1, z0), (x0+1, y0, z0+1))
-              self.unlink_nodes((x0+1, y0+1, z0), (x0, y0, z0+1))
-            if y0 != 0:
-              self.unlink_nodes((x0, y0-1, z0), (x0+1, y0, z0+1))
-              self.unlink_nodes((x0+1, y0-1, z0), (x0, y0, z0+1))
-              self.unlink_nodes((x0, y0, z0), (x0+1, y0-1, z0+1))
-              self.unlink_nodes((x0+1, y0, z0), (x0, y0-1, z0+1))
-          # x-y plane
-          if not dz:
-            self.unlink_nodes((x1,y2,z1), (x2,y1,z1))
-            if z0 != self.dimention[2]:
-              self.unlink_nodes((x0, y0, z0), (x0+1, y0+1, z0+1))
-              self.unlink_nodes((x0+1, y0, z0), (x0, y0+1, z0+1))
-              self.unlink_nodes((x0, y0+1, z0), (x0+1, y0, z0+1))
-              self.unlink_nodes((x0+1, y0+1, z0), (x0, y0, z0+1))
-            if z0 != 0:
-              self.unlink_nodes((x0, y0, z0-1), (x0+1, y0+1, z0))
-              self.unlink_nodes((x0+1, y0, z0-1), (x0, y0+1, z0))
-              self.unlink_nodes((x0, y0+1, z0-1), (x0+1, y0, z0))
-              self.unlink_nodes((x0+1, y0+1, z0-1), (x0, y0, z0))
-        # 3D cross
-        if difference == 3:
-          # print(f"3D cross detected at {this_node.coord} - {next_node.coord}")
-          x0 = min(x1, x2)
-          y0 = min(y1, y2)
-          z0 = min(z1, z2)
-          # cross through center
-          self.unlink_nodes((x0, y0, z0), (x0+1, y0+1, z0+1))
-          self.unlink_nodes((x0+1, y0, z0), (x0, y0+1, z0+1))
-          self.unlink_nodes((x0, y0+1, z0), (x0+1, y0, z0+1))
-          self.unlink_nodes((x0+1, y0+1, z0), (x0, y0, z0+1))
-          # half cross, but dis = 0.4
-          # self.unlink_nodes((x0, y0, z0), (x0, y0+1, z0+1))
-          # self.unlink_nodes((x0, y0, z0), (x0+1, y0, z0+1))
-          # self.unlink_nodes((x0, y0, z0), (x0+1, y0+1, z0))
-          # self.unlink_nodes((x0+1, y0, z0), (x0, y0, z0+1))
-          # self.unlink_nodes((x0+1, y0, z0), (x0+1, y0+1, z0+1))
-          # self.unlink_nodes((x0+1, y0, z0), (x0, y0+1, z0))
-          # self.unlink_nodes((x0, y0+1, z0), (x0, y0, z0+1))
-          # self.unlink_nodes((x0, y0+1, z0), (x0+1, y0+1, z0+1))
-          # self.unlink_nodes((x0, y0+1, z0), (x0+1, y0, z0))
-          # self.unlink_nodes((x0+1, y0+1, z0), (x0+1, y0, z0+1))
-          # self.unlink_nodes((x0+1, y0+1, z0), (x0, y0+1, z0+1))
-          # self.unlink_nodes((x0+1, y0+1, z0), (x0, y0, z0))
-
-          self.unlink_nodes((x0, y0, z0), (x0+1, y0+1, z0))
-          self.unlink_nodes((x0+1, y0, z0), (x0, y0+1, z0))
-          self.unlink_nodes((x0, y0, z0), (x0+1, y0, z0+1))
-          self.unlink_nodes((x0, y0, z0+1), (x0+1, y0, z0))
-          self.unlink_nodes((x0+1, y0, z0), (x0+1, y0+1, z0+1))
-          self.unlink_nodes((x0+1, y0, z0+1), (x0+1, y0+1, z0))
-          self.unlink_nodes((x0+1, y0+1, z0), (x0, y0+1, z0+1))
-          self.unlink_nodes((x0+1, y0+1, z0+1), (x0, y0+1, z0))
-          self.unlink_nodes((x0, y0+1, z0), (x0, y0, z0+1))
-          self.unlink_nodes((x0, y0+1, z0+1), (x0, y0, z0))
-          self.unlink_nodes((x0, y0, z0+1), (x0+1, y0+1, z0+1))
-          self.unlink_nodes((x0+1, y0, z0+1), (x0, y0+1, z0+1))
+  # remove a tip_ground path from tip_ground_table and free its nodes
+  # return [ground_node, is_start, path]
+  def remove_tip_ground_path(self, tip_node):
+    """Helper Function"""
+    value = self.tip_ground_table.pop(tip_node)
+    if self.ground_tip.get(value[0]) == tip_node:
+      del self.ground_tip[value[0]]
+    self.occupy_path(value[2], -1)
+    return value
 
+  def occupy_path(self, path, count):
+    """Helper Function"""
+    for node in path:
+      self.occupied[self.get_index(node)] += count
+    if self.hierarchy is not None:
+      self.hierarchy.mark_dirty(path)
 
+  # node is ocupied by a path or an obstacle, or processed in the current search
+  def node_in_use(self, index):
+    """Helper Function"""
+    if self.closed_stamp[index] == self.search_generation:
+      return True
+    if index in self.released:
+      return False
+    return bool(self.occupied[index] or self.obstacle[index])
 
 
+
+  # cut the crossing/ half crossing connections of a newly saved path
+  # the cut edges are logged so removing the path only restores its own edges
+  def cut_path_crossover(self, path_key, path):
+    """Prevent path from intersecting with each other"""
+    edge_list = []
+    for coord1, coord2 in self.get_crossover_edges(path):
+      edge = self.unlink_nodes(coord1, coord2)
+      if edge is not None:
+        edge_list.append(edge)
+    self.crossover_log[path_key] = edge_list
+
+  # give back the connections cut by a removed path
+  def restore_path_crossover(self, path_key):
+    """Helper Function"""
+    for edge in self.crossover_log.pop(path_key, []):
+      self.link_nodes(edge)
+
+  # recompute the cut connections of all saved paths from scratch
+  def cut_all_crossover(self):
+    """Prevent path from intersecting with each other"""
+    self.blocked_mask.fill(0)
+    self.blocked_edge_count.clear()
+    self.crossover_log.clear()
+    for key, value in self.saved_path.items():
+      self.cut_path_crossover(key, value)
+    if self.hierarchy is not None:
+      self.hierarchy.mark_all_dirty()
     print("All Cross Over Trimed")
     return
 
+  # incremental cuts should match cutting everything again
+  # the saved paths are cut again into fresh layers, the live cuts are left as they are
+  def check_crossover_cut(self):
+    """Compare incremental crossover cuts with a full recomputation"""
+    live_cut = (self.blocked_mask, self.blocked_edge_count, self.crossover_log)
+    self.blocked_mask = self.make_layer(np.uint32, 0)
+    self.blocked_edge_count = {}
+    self.crossover_log = {}
+    try:
+      for key, value in self.saved_path.items():
+        self.cut_path_crossover(key, value)
+      full_mask, full_edge_count = self.blocked_mask, self.blocked_edge_count
+    finally:
+      self.blocked_mask, self.blocked_edge_count, self.crossover_log = live_cut
+    is_same = np.array_equal(self.get_layer_box(self.blocked_mask), self.get_layer_box(full_mask)) and self.blocked_edge_count == full_edge_count
+    if not is_same:
+      self.register_error_message("ERROR: Incremental crossover cut differs from full recomputation")
+    return is_same
+
+  # pairs of nodes whose connection cross a segment of the path
+  def get_crossover_edges(self, path):
+    """Helper Function"""
+    edge_list = []
+    for i, this_node in enumerate(path):
+      if i == len(path) - 1:
+        break
+      next_node = path[i+1]
+
+      x1, y1, z1 = this_node
+      x2, y2, z2 = next_node
+
+      dx = x1 - x2
+      dy = y1 - y2
+      dz = z1 - z2
+      difference = abs(dx) + abs(dy) + abs(dz)
+
+      # staright
+      if difference == 1:
+        pass
+      # 2D cross
+      if difference == 2:
+        # print(f"Flat cross detected at {this_node.coord} - {next_node.coord}")
+        x0 = min(x1, x2)
+        y0 = min(y1, y2)
+        z0 = min(z1, z2)
+        # y-z plane
+        if not dx:
+          edge_list.append(((x1,y1,z2), (x1,y2,z1)))
+          if x0 != self.dimention[0]:
+            edge_list.append(((x0, y0, z0), (x0+1, y0+1, z0+1)))
+            edge_list.append(((x0+1, y0, z0), (x0, y0+1, z0+1)))
+            edge_list.append(((x0, y0+1, z0), (x0+1, y0, z0+1)))
+            edge_list.append(((x0+1, y0+1, z0), (x0, y0, z0+1)))
+          if x0 != 0:
+            edge_list.append(((x0-1, y0, z0), (x0, y0+1, z0+1)))
+            edge_list.append(((x0, y0, z0), (x0-1, y0+1, z0+1)))
+            edge_list.append(((x0-1, y0+1, z0), (x0, y0, z0+1)))
+            edge_list.append(((x0, y0+1, z0), (x0-1, y0, z0+1)))
+        # x-z plane
+        if not dy:
+          edge_list.append(((x1,y1,z2), (x2,y1,z1)))
+          if y0 != self.dimention[1]:
+            edge_list.append(((x0, y0, z0), (x0+1, y0+1, z0+1)))
+            edge_list.append(((x0+1, y0, z0), (x0, y0+1, z0+1)))
+            edge_list.append(((x0, y0+1, z0), (x0+1, y0, z0+1)))
+            edge_list.append(((x0+1, y0+1, z0), (x0, y0, z0+1)))
+          if y0 != 0:
+            edge_list.append(((x0, y0-1, z0), (x0+1, y0, z0+1)))
+            edge_list.append(((x0+1, y0-1, z0), (x0, y0, z0+1)))
+            edge_list.append(((x0, y0, z0), (x0+1, y0-1, z0+1)))
+            edge_list.append(((x0+1, y0, z0), (x0, y0-1, z0+1)))
+        # x-y plane
+        if not dz:
+          edge_list.append(((x1,y2,z1), (x2,y1,z1)))
+          if z0 != self.dimention[2]:
+            edge_list.append(((x0, y0, z0), (x0+1, y0+1, z0+1)))
+            edge_list.append(((x0+1, y0, z0), (x0, y0+1, z0+1)))
+            edge_list.append(((x0, y0+1, z0), (x0+1, y0, z0+1)))
+            edge_list.append(((x0+1, y0+1, z0), (x0, y0, z0+1)))
+          if z0 != 0:
+            edge_list.append(((x0, y0, z0-1), (x0+1, y0+1, z0)))
+            edge_list.append(((x0+1, y0, z0-1), (x0, y0+1, z0)))
+            edge_list.append(((x0, y0+1, z0-1), (x0+1, y0, z0)))
+            edge_list.append(((x0+1, y0+1, z0-1), (x0, y0, z0)))
+      # 3D cross
+      if difference == 3:
+        # print(f"3D cross detected at {this_node.coord} - {next_node.coord}")
+        x0 = min(x1, x2)
+        y0 = min(y1, y2)
+        z0 = min(z1, z2)
+        # cross through center
+        edge_list.append(((x0, y0, z0), (x0+1, y0+1, z0+1)))
+        edge_list.append(((x0+1, y0, z0), (x0, y0+1, z0+1)))
+        edge_list.append(((x0, y0+1, z0), (x0+1, y0, z0+1)))
+        edge_list.append(((x0+1, y0+1, z0), (x0, y0, z0+1)))
+        # half cross, but dis = 0.4
+        # edge_list.append(((x0, y0, z0), (x0, y0+1, z0+1)))
+        # edge_list.append(((x0, y0, z0), (x0+1, y0, z0+1)))
+        # edge_list.append(((x0, y0, z0), (x0+1, y0+1, z0)))
+        # edge_list.append(((x0+1, y0, z0), (x0, y0, z0+1)))
+        # edge_list.append(((x0+1, y0, z0), (x0+1, y0+1, z0+1)))
+        # edge_list.append(((x0+1, y0, z0), (x0, y0+1, z0)))
+        # edge_list.append(((x0, y0+1, z0), (x0, y0, z0+1)))
+        # edge_list.append(((x0, y0+1, z0), (x0+1, y0+1, z0+1)))
+        # edge_list.append(((x0, y0+1, z0), (x0+1, y0, z0)))
+        # edge_list.append(((x0+1, y0+1, z0), (x0+1, y0, z0+1)))
+        # edge_list.append(((x0+1, y0+1, z0), (x0, y0+1, z0+1)))
+        # edge_list.append(((x0+1, y0+1, z0), (x0, y0, z0)))
+
+        edge_list.append(((x0, y0, z0), (x0+1, y0+1, z0)))
+        edge_list.append(((x0+1, y0, z0), (x0, y0+1, z0)))
+        edge_list.append(((x0, y0, z0), (x0+1, y0, z0+1)))
+        edge_list.append(((x0, y0, z0+1), (x0+1, y0, z0)))
+        edge_list.append(((x0+1, y0, z0), (x0+1, y0+1, z0+1)))
+        edge_list.append(((x0+1, y0, z0+1), (x0+1, y0+1, z0)))
+        edge_list.append(((x0+1, y0+1, z0), (x0, y0+1, z0+1)))
+        edge_list.append(((x0+1, y0+1, z0+1), (x0, y0+1, z0)))
+        edge_list.append(((x0, y0+1, z0), (x0, y0, z0+1)))
+        edge_list.append(((x0, y0+1, z0+1), (x0, y0, z0)))
+        edge_list.append(((x0, y0, z0+1), (x0+1, y0+1, z0+1)))
+        edge_list.append(((x0+1, y0, z0+1), (x0, y0+1, z0+1)))
+
+    return edge_list
+
   # helper for cutting connections between two nodes
+  # return the edge as (node_index, direction) with the smaller index first
   def unlink_nodes(self, coord1, coord2):
     """Helper Function"""
-    x1, y1, z1 = coord1
-    x2, y2, z2 = coord2
-
-    node1 = self.node_grid[x1][y1][z1]
-    node2 = self.node_grid[x2][y2][z2]
-
-    node1.add_block_neighbors(node2)
-    node2.add_block_neighbors(node1)
-    # print(f"Unlinked Node {node1.coord} and {node2.coord}")
-    return
+    offset = tuple(map(lambda a,b: b-a, coord1, coord2))
+    if not (self.check_valid_coord(coord1) and self.check_valid_coord(coord2)) or offset not in DIRECTION_INDEX:
+      print(f"Error: {coord2} is not in neighbors list of Node {coord1}")
+      return None
+    index = self.get_index(coord1)
+    direction = DIRECTION_INDEX[offset]
+    if self.neighbor_step[direction] < 0:
+      index += self.neighbor_step[direction]
+      direction = OPPOSITE_DIRECTION[direction]
+    edge = (index, direction)
+    # same edge can be cut by more than one path
+    count = self.blocked_edge_count.get(edge, 0)
+    if count == 0:
+      self.blocked_mask[index] |= NEIGHBOR_BIT[direction]
+      self.blocked_mask[index + self.neighbor_step[direction]] |= NEIGHBOR_BIT[OPPOSITE_DIRECTION[direction]]
+    self.blocked_edge_count[edge] = count + 1
+    return edge
+
+  # helper for restoring a connection cut by unlink_nodes
+  def link_nodes(self, edge):
+    """Helper Function"""
+    index, direction = edge
+    count = self.blocked_edge_count[edge] - 1
+    if count:
+      self.blocked_edge_count[edge] = count
+      return
+    del self.blocked_edge_count[edge]
+    self.blocked_mask[index] &= ~NEIGHBOR_BIT[direction] & 0xFFFFFFFF
+    self.blocked_mask[index + self.neighbor_step[direction]] &= ~NEIGHBOR_BIT[OPPOSITE_DIRECTION[direction]] & 0xFFFFFFFF
 
 
+  #####################################  junction  ############################################
   #####################################  junction  ############################################
 
   # kind of jump table to determin what to do
@@ -513,54 +1107,48 @@ class Grid:
     """
     print("\n")
     print(f"Adding a new path from {start_coord} to {end_coord}")
-    start_node = self.node_grid[start_coord[0]][start_coord[1]][start_coord[2]]
-    end_node = self.node_grid[end_coord[0]][end_coord[1]][end_coord[2]]
-    # get all the existing connection points in saved_path
-    past_end_node_list = []
-    for key in self.saved_path:
-      past_end_node_list.append(key[0])
-      past_end_node_list.append(key[1])
-
-    start_node_in_list = bool(past_end_node_list.count(start_node))
-    end_node_in_list = bool(past_end_node_list.count(end_node))
+    start_node = self.get_node(start_coord)
+    end_node = self.get_node(end_coord)
+    # existing connection points in saved_path
+    start_node_in_list = start_node in self.path_end
+    end_node_in_list = end_node in self.path_end
 
     # both new, find path
     if not (start_node_in_list or end_node_in_list):
-      print(f"Both Node {start_node.coord}, {end_node.coord} are new, create new path")
-      return self.path_finding(start_node.coord, end_node.coord)
+      print(f"Both Node {start_node}, {end_node} are new, create new path")
+      return self.find_ground_path(start_node, end_node)
 
     # start is existing path, flip and create junction
     if start_node_in_list and not end_node_in_list:
-      print(f"Node {start_node.coord} is end for other tubing, create junction")
+      print(f"Node {start_node} is end for other tubing, create junction")
       # if start is to_join(fliped), also flip is_start and path
-      for key,value in self.tip_ground_table.items():
-        if end_node in value:
+      if end_node in self.ground_tip:
+        value = self.tip_ground_table[self.ground_tip[end_node]]
+        if value[0] == end_node:
           value[1] = True
           ground_end_path = value[2]
           fliped_end_ground_path = []
           for node in ground_end_path:
             fliped_end_ground_path.insert(0,node)
           value[2] = fliped_end_ground_path
-      return self.create_junction_path(end_node.coord, start_node.coord)
+      return self.create_junction_path(end_node, start_node)
 
     # end is existing path, create junction
     if end_node_in_list and not start_node_in_list:
-      print(f"Node {end_node.coord} is end for other tubing, create junction")
-      return self.create_junction_path(start_node.coord, end_node.coord)
+      print(f"Node {end_node} is end for other tubing, create junction")
+      return self.create_junction_path(start_node, end_node)
 
     # both are existing path, create bridge
     if start_node_in_list and end_node_in_list:
-      duplicate = False
-      for end_point_tuple in self.saved_path:
-        duplicate |= (start_node in end_point_tuple) and (end_node in end_point_tuple)
+      duplicate = any(end_node in key for key in self.path_end[start_node])
 
       if duplicate:
-        self.register_warning_message(f"WARNING: Path from {start_node.coord} to {end_node.coord} already exists")
+        self.register_warning_message(f"WARNING: Path from {start_node} to {end_node} already exists")
         print("Nothing Added")
         return []
 
-      print(f"Both Node {start_node.coord}, {end_node.coord} are end for other tubing, bridge two tubes")
-      return self.create_bridge_path(start_node.coord, end_node.coord)
+      print(f"Both Node {start_node}, {end_node} are end for other tubing, bridge two tubes")
+      return self.create_bridge_path(start_node, end_node)
 
 
 
@@ -570,54 +1158,34 @@ class Grid:
   def create_junction_path(self, start_coord, end_coord):
     """Create a branch of from exsiting path"""
     print(f"Looking for joinction path from {start_coord}(new) to {end_coord}")
-    start_node = self.node_grid[start_coord[0]][start_coord[1]][start_coord[2]]
-    end_node = self.node_grid[end_coord[0]][end_coord[1]][end_coord[2]]
+    start_node = self.get_node(start_coord)
+    end_node = self.get_node(end_coord)
 
-    past_end_node_list = []
-    for key in self.saved_path:
-      past_end_node_list.append(key[0])
-      past_end_node_list.append(key[1])
-
-    if past_end_node_list.count(end_node) == 0:
-      print(f"Error: End coord {end_node.coord} is not a existing path end")
+    if end_node not in self.path_end:
+      print(f"Error: End coord {end_node} is not a existing path end")
       return []
 
-    if start_node.visited:
-      print(f"Error: Start Node {start_node.coord} is already in use")
+    if self.is_visited(start_node):
+      print(f"Error: Start Node {start_node} is already in use")
       return []
 
-    to_join_path_start_node = None
-    to_join_path_end_node = None
-    path_to_join = []
     # find the path to join in saved_path
-    for key, value in self.saved_path.items():
-      if end_node in key:
-        to_join_path_start_node, to_join_path_end_node = key
-        path_to_join = value
-    if len(path_to_join) < 3:
-      self.register_error_message(f"ERROR: Path {list(map(lambda a: a.coord, path_to_join))} is too short to be joined by {start_coord}-{end_coord}")
-      return []
+    to_join_path_start_node, to_join_path_end_node = self.path_end[end_node][-1]
+    path_to_join = self.saved_path[(to_join_path_start_node, to_join_path_end_node)]
 
-    # find point of junction
-    distance = float("inf")
-    junction_node = None
-    for i,node in enumerate(path_to_join[1:-1]):
-      dest_x, dest_y, dest_z = node.coord
-      this_x, this_y, this_z = start_node.coord
-      dis = math.sqrt((dest_x - this_x)**2 + (dest_y - this_y)**2 + (dest_z - this_z)**2) + .5*abs(len(path_to_join)/2 - i)
-      if dis < distance:
-        distance = dis
-        junction_node = node
-    print(f"Node {junction_node.coord} has the shortest distance")
-
-    junction_node.visited = False
-    new_juction_path = self.path_finding(start_node.coord, junction_node.coord)
-
-    # this is not going to happen because we create new junction every path
-    if junction_node in self.saved_junction:
-      print(f"Node {junction_node.coord} is already a junction")
-      self.saved_junction[junction_node].append(new_juction_path[-2])
-      return new_juction_path
+    # every free node inside the tree of path_to_join can be the junction, the search stops at the first one reached
+    branch_node_cost = self.get_branch_node_cost(self.get_tree_key_list((to_join_path_start_node, to_join_path_end_node)))
+    if not branch_node_cost:
+      self.register_error_message(f"ERROR: Path {path_to_join} is too short to be joined by {start_coord}-{end_coord}")
+      return []
+    new_juction_path = self.multi_path_finding([start_node], list(branch_node_cost), self.tree_weight, end_cost=branch_node_cost)
+    # error is already registered by the search
+    if not new_juction_path:
+      self.reset_grid()
+      return []
+    junction_node = new_juction_path[-1]
+    print(f"Node {junction_node} is reached first")
+    to_join_path_start_node, to_join_path_end_node = self.find_path_key(junction_node)
 
     connection_nodes = self.split_path((to_join_path_start_node, to_join_path_end_node), junction_node)
     start_junction_connect_node = connection_nodes[0]
@@ -626,8 +1194,8 @@ class Grid:
 
     self.saved_junction[junction_node] = \
       [start_junction_connect_node, junction_end_connect_node, new_jusction_connect_node]
-    print(f"Junction Added: {junction_node.coord}")
-    print(f"Connection points: {[start_junction_connect_node.coord, junction_end_connect_node.coord, new_jusction_connect_node.coord]}")
+    print(f"Junction Added: {junction_node}")
+    print(f"Connection points: {[start_junction_connect_node, junction_end_connect_node, new_jusction_connect_node]}")
     self.reset_grid()
     return new_juction_path
 
@@ -637,66 +1205,52 @@ class Grid:
   def create_bridge_path(self, start_coord, end_coord):
     """Create bridge between two existing path"""
     print(f"Looking for bridging between path: {start_coord}(one path) to {end_coord}(another path)")
-    start_node = self.node_grid[start_coord[0]][start_coord[1]][start_coord[2]]
-    end_node = self.node_grid[end_coord[0]][end_coord[1]][end_coord[2]]
+    start_node = self.get_node(start_coord)
+    end_node = self.get_node(end_coord)
 
     # get the paths to bridge
-    past_end_node_list = []
-    for key in self.saved_path:
-      past_end_node_list.append(key[0])
-      past_end_node_list.append(key[1])
-    if past_end_node_list.count(start_node) == 0:
-      print(f"Error: End coord {start_node.coord} is not a existing path end")
+    if start_node not in self.path_end:
+      print(f"Error: End coord {start_node} is not a existing path end")
       return []
-    if past_end_node_list.count(end_node) == 0:
-      print(f"Error: End coord {end_node.coord} is not a existing path end")
+    if end_node not in self.path_end:
+      print(f"Error: End coord {end_node} is not a existing path end")
       return []
 
-    start_bridge_path = None
-    end_bridge_path = None
-    start_bridge_key = None
-    end_bridge_key = None
-    for key,value in self.saved_path.items():
-      if start_node in key:
-        start_bridge_path = value
-        start_bridge_key = key
-      if end_node in key:
-        end_bridge_path = value
-        end_bridge_key = key
+    start_bridge_key = self.path_end[start_node][-1]
+    end_bridge_key = self.path_end[end_node][-1]
+    start_bridge_path = self.saved_path[start_bridge_key]
+    end_bridge_path = self.saved_path[end_bridge_key]
     if start_bridge_path is end_bridge_path:
-      self.register_warning_message(f"WARNING: Path from {start_node.coord} to {end_node.coord} already exists")
+      self.register_warning_message(f"WARNING: Path from {start_node} to {end_node} already exists")
       print("Nothing Added")
       return []
 
-    print(f"Start Node {start_node.coord} -> Path {list(map(lambda a: a.coord, start_bridge_path))}")
-    print(f"End Node {end_node.coord} -> Path {list(map(lambda a: a.coord, end_bridge_path))}")
-    if len(start_bridge_path) < 3:
-        self.register_error_message(f"ERROR: Path {list(map(lambda a: a.coord, start_bridge_path))} is too short to be bridged by {start_coord}-{end_coord}")
-        return []
-    if len(end_bridge_path) < 3:
-        self.register_error_message(f"ERROR: Path {list(map(lambda a: a.coord, end_bridge_path))} is too short to be bridged by {start_coord}-{end_coord}")
-        return []
+    print(f"Start Node {start_node} -> Path {start_bridge_path}")
+    print(f"End Node {end_node} -> Path {end_bridge_path}")
 
-    # find nodes to connect for bridge
-    distance = float("inf")
-    start_bridge_node = None
-    end_bridge_node = None
-    for i,from_node in enumerate(start_bridge_path[1:-1]):
-      for dest_node in end_bridge_path[1:-1]:
-        f_x,f_y,f_z = from_node.coord
-        d_x,d_y,d_z = dest_node.coord
-        dis = math.sqrt((f_x - d_x)**2 + (f_y - d_y)**2 + (f_z - d_z)**2) + .5*abs(len(start_bridge_path)/2 - i)
-
-        if dis < distance:
-          distance = dis
-          start_bridge_node = from_node
-          end_bridge_node = dest_node
-    print(f"Node {start_bridge_node.coord} to Node {end_bridge_node.coord} has the shortest distance")
-
-    # find path and split path
-    start_bridge_node.visited = False
-    end_bridge_node.visited = False
-    new_bridge_path = self.path_finding(start_bridge_node.coord, end_bridge_node.coord)
+    # search from every free node inside one tree to every free node inside the other
+    start_tree_key_list = self.get_tree_key_list(start_bridge_key)
+    if end_bridge_key in start_tree_key_list:
+      self.register_warning_message(f"WARNING: {start_node} and {end_node} are already connected")
+      print("Nothing Added")
+      return []
+    start_node_cost = self.get_branch_node_cost(start_tree_key_list)
+    end_node_cost = self.get_branch_node_cost(self.get_tree_key_list(end_bridge_key))
+    if not start_node_cost:
+      self.register_error_message(f"ERROR: Path {start_bridge_path} is too short to be bridged by {start_coord}-{end_coord}")
+      return []
+    if not end_node_cost:
+      self.register_error_message(f"ERROR: Path {end_bridge_path} is too short to be bridged by {start_coord}-{end_coord}")
+      return []
+    new_bridge_path = self.multi_path_finding(list(start_node_cost), list(end_node_cost), self.tree_weight, start_node_cost, end_node_cost)
+    if not new_bridge_path:
+      self.reset_grid()
+      return []
+    start_bridge_node = new_bridge_path[0]
+    end_bridge_node = new_bridge_path[-1]
+    print(f"Node {start_bridge_node} to Node {end_bridge_node} is reached first")
+    start_bridge_key = self.find_path_key(start_bridge_node)
+    end_bridge_key = self.find_path_key(end_bridge_node)
     new_start_bridge_connection_node = new_bridge_path[1]
     new_end_bridge_connection_node = new_bridge_path[-2]
 
@@ -706,39 +1260,70 @@ class Grid:
     end_bridge_connection_nodes.append(new_end_bridge_connection_node)
 
     self.saved_junction[start_bridge_node] = start_bridge_connection_nodes
-    print(f"Junction Added: {start_bridge_node.coord}")
-    print(f"Connection points: {list(map(lambda a: a.coord, start_bridge_connection_nodes))}")
+    print(f"Junction Added: {start_bridge_node}")
+    print(f"Connection points: {start_bridge_connection_nodes}")
     self.saved_junction[end_bridge_node] = end_bridge_connection_nodes
-    print(f"Junction Added: {end_bridge_node.coord}")
-    print(f"Connection points: {list(map(lambda a: a.coord, end_bridge_connection_nodes))}")
+    print(f"Junction Added: {end_bridge_node}")
+    print(f"Connection points: {end_bridge_connection_nodes}")
     self.reset_grid()
     return new_bridge_path
 
 
 
+  # keys of all saved paths joined to path_key through shared end nodes (junctions), path_key included
+  def get_tree_key_list(self, path_key):
+    """Helper Function"""
+    tree_key_list = [path_key]
+    node_list = list(path_key)
+    while node_list:
+      node = node_list.pop()
+      for key in self.path_end.get(node, []):
+        if key not in tree_key_list:
+          tree_key_list.append(key)
+          node_list.extend(key)
+    return tree_key_list
+
+  # nodes a new path can branch from: inside a path and not a junction already
+  # each comes with the bias towards the middle of its path used for picking junctions
+  # return {node : bias}
+  def get_branch_node_cost(self, key_list):
+    """Helper Function"""
+    branch_node_cost = {}
+    for key in key_list:
+      path = self.saved_path[key]
+      for i, node in enumerate(path[1:-1]):
+        if node not in self.saved_junction:
+          branch_node_cost[node] = .5*abs(len(path)/2 - i)
+    return branch_node_cost
+
+  # key of the saved path that has node inside it
+  def find_path_key(self, node):
+    """Helper Function"""
+    for key, position in self.path_owner.get(node, {}).items():
+      if 0 < position < len(self.saved_path[key]) - 1:
+        return key
+    return None
+
+
   # when a junction is created, split a path into two
   # store two new path in saved_path and remove original one
   # junction only generate on ground_ground path which is in save_path
   def split_path(self, path_key, split_node):
     """Helper Function"""
-    print(f"Spliting path between {list(map(lambda a: a.coord, path_key))} with Node {split_node.coord}")
+    print(f"Spliting path between {path_key} with Node {split_node}")
     start_node = path_key[0]
     end_node = path_key[1]
-    path_to_split = None
-    for key,value in self.saved_path.items():
-      if key == path_key:
-        if split_node not in value:
-          print(f"Error: Split Node {split_node.coord} is not in path {list(map(lambda a: a.coord, key))}")
-          return []
-        path_to_split = value
-
-    index = path_to_split.index(split_node)
+    if path_key not in self.path_owner.get(split_node, {}):
+      print(f"Error: Split Node {split_node} is not in path {path_key}")
+      return []
+    path_to_split = self.saved_path[path_key]
+    index = self.path_owner[split_node][path_key]
     new_path_start_split = path_to_split[0:index+1]
     new_path_split_end = path_to_split[index:len(path_to_split)+1]
 
-    self.saved_path[(start_node, split_node)] = new_path_start_split
-    self.saved_path[(split_node, end_node)] = new_path_split_end
-    self.delete_path(start_node.coord, end_node.coord, True)
+    self.save_path((start_node, split_node), new_path_start_split)
+    self.save_path((split_node, end_node), new_path_split_end)
+    self.delete_path(start_node, end_node, True)
     start_connection_node = path_to_split[index-1]
     end_connection_node = path_to_split[index+1]
     return [start_connection_node, end_connection_node]
@@ -749,31 +1334,30 @@ class Grid:
   # only used when spliting path for deleting the orginal path
   def delete_path(self, start_coord, end_coord, keep_junction = False):
     """Helper Function"""
-    start_node = self.node_grid[start_coord[0]][start_coord[1]][start_coord[2]]
-    end_node = self.node_grid[end_coord[0]][end_coord[1]][end_coord[2]]
+    start_node = self.get_node(start_coord)
+    end_node = self.get_node(end_coord)
     key_to_delete = None
     path_to_delete = None
-    for key,value in self.saved_path.items():
-      if start_node in key and end_node in key:
+    for key in self.path_end.get(start_node, []):
+      if end_node in key:
         key_to_delete = key
-        path_to_delete = value
+        path_to_delete = self.saved_path[key]
 
     if key_to_delete is None:
-      print(f"Error: Path {start_node.coord}-{end_node.coord} don't exist in saved_path")
+      print(f"Error: Path {start_node}-{end_node} don't exist in saved_path")
       return
 
-    print(f"Deleted path from {key_to_delete[0].coord} to {key_to_delete[1].coord}")
-    print(f"Path: {list(map(lambda a: a.coord, path_to_delete))}")
-    self.saved_path.pop(key_to_delete)
+    print(f"Deleted path from {key_to_delete[0]} to {key_to_delete[1]}")
+    print(f"Path: {path_to_delete}")
+    self.remove_saved_path(key_to_delete)
 
     if not keep_junction:
-      for key,value in self.saved_junction.items():
-        if start_node is key:
-          print(f"Start Node {start_node.coord} is a junction")
-          self.delete_junction_connection(start_node, path_to_delete[1])
-        if end_node is key:
-          print(f"Start Node {end_node.coord} is a junction")
-          self.delete_junction_connection(end_node, path_to_delete[-2])
+      if start_node in self.saved_junction:
+        print(f"Start Node {start_node} is a junction")
+        self.delete_junction_connection(start_node, path_to_delete[1])
+      if end_node in self.saved_junction:
+        print(f"Start Node {end_node} is a junction")
+        self.delete_junction_connection(end_node, path_to_delete[-2])
 
     self.reset_grid()
     return
@@ -781,16 +1365,16 @@ class Grid:
 
   def delete_junction_connection(self, junction_node, connection_node):
     """Helper Function"""
-    print(f"Deleting junction {junction_node.coord} connection {connection_node.coord}")
+    print(f"Deleting junction {junction_node} connection {connection_node}")
     for key, value in self.saved_junction.items():
-      if key is junction_node:
+      if key == junction_node:
         if connection_node in value:
           print("Junction and Connection found")
           value.remove(connection_node)
           if len(value) < 2:
             print("Error: Junction have less than 2 connections")
             return
-        print(f"Error: Connection Not Exist in connection list: {list(map(lambda a: a.coord, value))}")
+        print(f"Error: Connection Not Exist in connection list: {value}")
         return
     print("Error: Junction Not Exist")
 
@@ -806,18 +1390,20 @@ class Grid:
   # temporary data from path_finding are removed immediately and grid reset
   # tip_ground_table stores tip_ground path
   # saved_junction stores the junction info generated
+  # return True if no error is registered while connecting
   def connect_two_node(self, start_coord, end_coord):
     """
     Wrapper function used for connecting two grid coordinates
     Use this for creating connections / find paths
     """
+    error_num = len(self.error_message_list)
     self.reset_grid()
     print(f"\nConnecting Node {start_coord} and Node {end_coord} with default path")
-    start_node = self.node_grid[start_coord[0]][start_coord[1]][start_coord[2]]
-    end_node = self.node_grid[end_coord[0]][end_coord[1]][end_coord[2]]
+    start_node = self.get_node(start_coord)
+    end_node = self.get_node(end_coord)
 
-    direction_sign_x = (end_node.coord[0] - start_node.coord[0]) > 0
-    direction_sign_y = (end_node.coord[1] - start_node.coord[1]) > 0
+    direction_sign_x = (end_node[0] - start_node[0]) > 0
+    direction_sign_y = (end_node[1] - start_node[1]) > 0
     dir_x = 2*direction_sign_x - 1
     dir_y = 2*direction_sign_y - 1
 
@@ -827,86 +1413,202 @@ class Grid:
     end_ground_node_is_new = False
     # if already in table, use that, else create one
     if start_node in self.tip_ground_table:
-      print(f"Start Node {start_node.coord} is already in tip_ground_table")
+      print(f"Start Node {start_node} is already in tip_ground_table")
       start_ground_node = self.tip_ground_table[start_node][0]
     else:
       start_ground_node = self.find_ground_node(start_node, dir_x, dir_y)
-      start_ground_path = self.path_finding(start_node.coord, start_ground_node.coord)
-      self.saved_path.pop((start_node, start_ground_node))
+      start_ground_path = self.path_finding(start_node, start_ground_node)
+      # error is already registered by path_finding
+      if not start_ground_path:
+        self.reset_grid()
+        return False
+      self.remove_saved_path((start_node, start_ground_node))
       self.reset_grid()
-      print(f"Start-Ground path from {start_node.coord} to {start_ground_node.coord} is: {list(map(lambda a: a.coord, start_ground_path))}")
-      self.tip_ground_table[start_node] = [start_ground_node, True, start_ground_path]
+      print(f"Start-Ground path from {start_node} to {start_ground_node} is: {start_ground_path}")
+      self.save_tip_ground_path(start_node, start_ground_node, True, start_ground_path)
       start_ground_node_is_new = True
 
     if end_node in self.tip_ground_table:
       end_ground_node = self.tip_ground_table[end_node][0]
-      print(f"End Node {end_node.coord} is already in tip_ground_table")
+      print(f"End Node {end_node} is already in tip_ground_table")
     else:
       end_ground_node = self.find_ground_node(end_node, -dir_x, -dir_y)
-      ground_end_path_inverse = self.path_finding(end_node.coord, end_ground_node.coord)
-      self.saved_path.pop((end_node, end_ground_node))
+      ground_end_path_inverse = self.path_finding(end_node, end_ground_node)
+      if not ground_end_path_inverse:
+        self.reset_grid()
+        return False
+      self.remove_saved_path((end_node, end_ground_node))
       self.reset_grid()
       ground_end_path = []
       for node in ground_end_path_inverse:
         ground_end_path.insert(0, node)
-      print(f"Ground_End path from {end_ground_node.coord} to {end_node.coord} is: {list(map(lambda a: a.coord, ground_end_path))}")
-      self.tip_ground_table[end_node] = [end_ground_node, False, ground_end_path]
+      print(f"Ground_End path from {end_ground_node} to {end_node} is: {ground_end_path}")
+      self.save_tip_ground_path(end_node, end_ground_node, False, ground_end_path)
       end_ground_node_is_new = True
 
     # if new, mark not visited
     # if old, mark visited to avoid collision
     if start_ground_node_is_new:
-      start_ground_node.visited = False
+      self.set_visited(start_ground_node, False)
     if end_ground_node_is_new:
-      end_ground_node.visited = False
+      self.set_visited(end_ground_node, False)
     # this handles all the conditions of new path, merge path, or bridge path
-    ground_ground_path = self.add_path(start_ground_node.coord, end_ground_node.coord)
+    ground_ground_path = self.add_path(start_ground_node, end_ground_node)
 
-    print(f"Ground-Ground path from {start_ground_node.coord} to {end_ground_node.coord} is: {list(map(lambda a: a.coord, ground_ground_path))}")
+    print(f"Ground-Ground path from {start_ground_node} to {end_ground_node} is: {ground_ground_path}")
+    return len(self.error_message_list) == error_num
 
 
 
+  # connect a group of grid coordinates as one tree (rectilinear Steiner tree grown Prim style)
+  # every tip gets its tip_ground path first, then the tree starts from the first ground node
+  # each step searches from all ground nodes not connected yet to every node the tree can branch from,
+  # the ground node reached first joins the tree through a junction on the tree node it reached
+  # saved_path, saved_junction and tip_ground_table end up the same as with connect_two_node
+  # return True if no error is registered while connecting
+  def connect_node_group(self, coord_list):
+    """
+    Wrapper function used for connecting a group of grid coordinates
+    Use this for creating multi-port connections
+    """
+    error_num = len(self.error_message_list)
+    tip_list = list(dict.fromkeys(self.get_node(coord) for coord in coord_list))
+    print(f"\nConnecting Node group {tip_list} as a tree")
+    if len(tip_list) < 2:
+      return True
+    # tips already routed have paths the tree does not know about
+    if any(tip_node in self.tip_ground_table for tip_node in tip_list):
+      print("Some tips are already connected, connect one by one")
+      for tip_node in tip_list[1:]:
+        self.connect_two_node(tip_list[0], tip_node)
+      return len(self.error_message_list) == error_num
+
+    # tip_ground paths head towards the middle of the group
+    center_x = sum(node[0] for node in tip_list) / len(tip_list)
+    center_y = sum(node[1] for node in tip_list) / len(tip_list)
+    ground_list = []
+    for i, tip_node in enumerate(tip_list):
+      self.reset_grid()
+      dir_x = 1 if center_x > tip_node[0] else -1
+      dir_y = 1 if center_y > tip_node[1] else -1
+      ground_node = self.find_ground_node(tip_node, dir_x, dir_y)
+      tip_ground_path = self.path_finding(tip_node, ground_node)
+      if not tip_ground_path:
+        self.reset_grid()
+        return False
+      self.remove_saved_path((tip_node, ground_node))
+      self.reset_grid()
+      # tree paths are saved from the joining ground node to the tree
+      # so only the first ground node is at the end of its path
+      if i == 0:
+        tip_ground_path = tip_ground_path[::-1]
+      self.save_tip_ground_path(tip_node, ground_node, i != 0, tip_ground_path)
+      ground_list.append(ground_node)
+
+    root_node = ground_list[0]
+    to_join_list = ground_list[1:]
+    # keys of the saved paths of this tree
+    tree_key_list = []
+    while to_join_list:
+      if tree_key_list:
+        branch_list = [node for key in tree_key_list for node in self.saved_path[key][1:-1] if node not in self.saved_junction]
+      else:
+        branch_list = [root_node]
+      if not branch_list:
+        self.register_error_message(f"ERROR: Tree {tree_key_list} is too short to be joined by {to_join_list}")
+        return False
+      new_path = self.multi_path_finding(to_join_list, branch_list, self.tree_weight)
+      if not new_path:
+        return False
+      join_node, branch_node = new_path[0], new_path[-1]
+      to_join_list.remove(join_node)
+      print(f"Ground Node {join_node} joins the tree at Node {branch_node}")
+      if tree_key_list:
+        tree_key = self.find_path_key(branch_node)
+        connection_nodes = self.split_path(tree_key, branch_node)
+        tree_key_list.remove(tree_key)
+        tree_key_list += [(tree_key[0], branch_node), (branch_node, tree_key[1])]
+        self.saved_junction[branch_node] = connection_nodes + [new_path[-2]]
+        print(f"Junction Added: {branch_node}")
+        print(f"Connection points: {self.saved_junction[branch_node]}")
+      tree_key_list.append((join_node, branch_node))
+    return len(self.error_message_list) == error_num
+
+
   def is_visited(self, coord):
     """Helper Function"""
-    try:
-      node = self.node_grid[coord[0]][coord[1]][coord[2]]
-    except IndexError:
+    if not self.check_valid_coord(coord):
       print(f"Error: Node {coord} is out of bound")
       return True
-    return node.visited
+    return self.node_in_use(self.get_index(coord))
+
+  # mark a used node free (or back in use) until the next reset
+  def set_visited(self, coord, visited):
+    """Helper Function"""
+    index = self.get_index(coord)
+    if visited:
+      self.released.discard(index)
+      return
+    self.released.add(index)
+    if self.closed_stamp[index] == self.search_generation:
+      self.closed_stamp[index] = 0
 
 
 
   def make_obstacle(self, coord):
     """Helper Function"""
-    try:
-      node = self.node_grid[coord[0]][coord[1]][coord[2]]
-      self.obsticales.append(node)
-      # node.visited = True
-    except IndexError:
+    if not self.check_valid_coord(coord):
       print(f"Error: Node {coord} is out of bound")
       return False
+    self.obstacle[self.get_index(coord)] = True
+    if self.hierarchy is not None:
+      self.hierarchy.mark_dirty([coord])
     return True
 
+  # add many obstacles at once from a bool occupancy array indexed [x, y, z]
+  # low is the grid coord of occupancy[0, 0, 0], parts outside of the grid are ignored
+  # return number of new obstacle nodes
+  def add_obstacle_occupancy(self, occupancy, low=(0,0,0)):
+    """Helper Function"""
+    occupancy = np.asarray(occupancy, dtype=bool)
+    low = [int(a) for a in low]
+    # cut off what is below 0 or above the grid
+    occupancy = occupancy[tuple(slice(max(-l, 0), max(grid_size - l, 0)) for l, grid_size in zip(low, self.shape))]
+    low = [max(l, 0) for l in low]
+    if occupancy.size == 0:
+      return 0
+    box = tuple(slice(l, l + size) for l, size in zip(low, occupancy.shape))
+    old = self.get_layer_box(self.obstacle, box)
+    new = occupancy & ~old
+    if not new.any():
+      return 0
+    if isinstance(self.obstacle, np.ndarray):
+      self.obstacle.reshape(self.shape)[box] |= occupancy
+    else:
+      self.obstacle.set_box(box, old | occupancy)
+    if self.hierarchy is not None:
+      self.hierarchy.mark_dirty([tuple(int(a) for a in coord) for coord in np.argwhere(new) + low])
+    return int(new.sum())
+
 
   # given a node, return the ground node
   def find_ground_node(self, node, dir_x, dir_y):
     """Find the coorisponding ground node for a given coordinate"""
-    print(f"Looking for ground node for Node {node.coord} with dir_x = {dir_x}, dir_y = {dir_y}")
-    ground_node = self.node_grid[node.coord[0]][node.coord[1]][0]
-    while ground_node.visited:
-      if self.is_visited((ground_node.coord[0]+dir_x, ground_node.coord[1], ground_node.coord[2])):
-        if self.is_visited((ground_node.coord[0]+dir_x, ground_node.coord[1]+dir_y, ground_node.coord[2])):
-          if self.is_visited((ground_node.coord[0], ground_node.coord[1]+dir_y, ground_node.coord[2])):
-            ground_node = self.node_grid[ground_node.coord[0]][ground_node.coord[1]][ground_node.coord[2]+1]
+    print(f"Looking for ground node for Node {node} with dir_x = {dir_x}, dir_y = {dir_y}")
+    ground_node = (node[0], node[1], 0)
+    while self.is_visited(ground_node):
+      if self.is_visited((ground_node[0]+dir_x, ground_node[1], ground_node[2])):
+        if self.is_visited((ground_node[0]+dir_x, ground_node[1]+dir_y, ground_node[2])):
+          if self.is_visited((ground_node[0], ground_node[1]+dir_y, ground_node[2])):
+            ground_node = (ground_node[0], ground_node[1], ground_node[2]+1)
             continue
-          ground_node = self.node_grid[ground_node.coord[0]][ground_node.coord[1]+dir_y][ground_node.coord[2]]
+          ground_node = (ground_node[0], ground_node[1]+dir_y, ground_node[2])
           break
-        ground_node = self.node_grid[ground_node.coord[0]+dir_x][ground_node.coord[1]+dir_y][ground_node.coord[2]]
+        ground_node = (ground_node[0]+dir_x, ground_node[1]+dir_y, ground_node[2])
         break
-      ground_node = self.node_grid[ground_node.coord[0]+dir_x][ground_node.coord[1]][ground_node.coord[2]]
+      ground_node = (ground_node[0]+dir_x, ground_node[1], ground_node[2])
       break
-    print(f"Found ground Node {ground_node.coord} for Node {node.coord}")
+    print(f"Found ground Node {ground_node} for Node {node}")
     return ground_node
 
   # a collection of all connections, combine path like start_ground and ground_ground
@@ -914,6 +1616,8 @@ class Grid:
     """Collect the connections after finding a path"""
     self.connection_dict.clear()
     self.connection_dict.update(self.saved_path)
+    # {end_node : connection_key}, end nodes of connection_dict
+    connection_end = {node: key for key in self.connection_dict for node in key}
 
     for key,value in self.tip_ground_table.items():
       tip_node = key
@@ -922,50 +1626,50 @@ class Grid:
       tip_ground_path = value[2]
       whole_path = []
 
-      for path_key, path_value in self.saved_path.items():
-
-        if ground_node in path_key:
-
-          if path_key not in self.connection_dict:  # one to one path, no junction, so already removed by the other end
-            print(f"Path starting at Node {tip_node.coord} have no merge/junction")
-            for connection_key, connection_value in self.connection_dict.items():
-              if ground_node in connection_key:
-                ground_path = connection_value
-                self.connection_dict.pop(connection_key)
-                if is_start:
-                  whole_path.extend(tip_ground_path)
-                  whole_path.extend(ground_path[1:])
-                  print(f"Retreved whole path: {tip_node.coord}-{ground_path[-1].coord}, path: {list(map(lambda a: a.coord, whole_path))}")
-                  self.connection_dict[(tip_node, ground_path[-1])] = whole_path
-                  break
-                else:
-                  whole_path.extend(ground_path)
-                  whole_path.extend(tip_ground_path[1:])
-                  print(f"Retreved whole path: {ground_path[-1].coord}-{tip_node.coord}, path: {list(map(lambda a: a.coord, whole_path))}")
-                  self.connection_dict[(ground_path[0], tip_node)] = whole_path
-                  break
-
-            if len(ground_path) == 0:
-              self.register_error_message(f"ERROR: Can't find ground path of path_key {list(map(lambda a: a.coord, path_key))}")
-          else:
-            self.connection_dict.pop(path_key)
-
-            ground_path = path_value
+      for path_key in self.path_end.get(ground_node, []):
+        path_value = self.saved_path[path_key]
 
+        if path_key not in self.connection_dict:  # one to one path, no junction, so already removed by the other end
+          print(f"Path starting at Node {tip_node} have no merge/junction")
+          ground_path = []
+          connection_key = connection_end.get(ground_node)
+          if connection_key is not None:
+            ground_path = self.connection_dict.pop(connection_key)
             if is_start:
               whole_path.extend(tip_ground_path)
               whole_path.extend(ground_path[1:])
-              print(f"Retreved whole path: {tip_node.coord}-{ground_path[-1].coord}, path: {list(map(lambda a: a.coord, whole_path))}")
-              self.connection_dict[(tip_node, ground_path[-1])] = whole_path
-              break
+              print(f"Retreved whole path: {tip_node}-{ground_path[-1]}, path: {whole_path}")
+              new_key = (tip_node, ground_path[-1])
             else:
               whole_path.extend(ground_path)
               whole_path.extend(tip_ground_path[1:])
-              print(f"Retreved whole path: {ground_path[-1].coord}-{tip_node.coord}, path: {list(map(lambda a: a.coord, whole_path))}")
-              self.connection_dict[(ground_path[0], tip_node)] = whole_path
-              break
+              print(f"Retreved whole path: {ground_path[-1]}-{tip_node}, path: {whole_path}")
+              new_key = (ground_path[0], tip_node)
+            self.connection_dict[new_key] = whole_path
+            self.update_connection_end(connection_end, connection_key, new_key)
+
+          if len(ground_path) == 0:
+            self.register_error_message(f"ERROR: Can't find ground path of path_key {path_key}")
+        else:
+          self.connection_dict.pop(path_key)
+
+          ground_path = path_value
+
+          if is_start:
+            whole_path.extend(tip_ground_path)
+            whole_path.extend(ground_path[1:])
+            print(f"Retreved whole path: {tip_node}-{ground_path[-1]}, path: {whole_path}")
+            new_key = (tip_node, ground_path[-1])
+          else:
+            whole_path.extend(ground_path)
+            whole_path.extend(tip_ground_path[1:])
+            print(f"Retreved whole path: {ground_path[-1]}-{tip_node}, path: {whole_path}")
+            new_key = (ground_path[0], tip_node)
+          self.connection_dict[new_key] = whole_path
+          self.update_connection_end(connection_end, path_key, new_key)
+          break
       if len(whole_path) == 0:
-        print(f"Error: Can't retreve whole path for tip Node {tip_node.coord}")
+        print(f"Error: Can't retreve whole path for tip Node {tip_node}")
 
     path_num = len(self.saved_path)
     connection_num = len(self.connection_dict)
@@ -976,6 +1680,15 @@ class Grid:
     print("Connection_dict updated successfully")
     self.smooth_out_path()
 
+  # connection_key is replaced by new_key in connection_dict, move its end nodes over
+  def update_connection_end(self, connection_end, connection_key, new_key):
+    """Helper Function"""
+    for node in connection_key:
+      if connection_end.get(node) == connection_key:
+        del connection_end[node]
+    for node in new_key:
+      connection_end[node] = new_key
+
   # eliminate useless sharp turns, only affect connection_dict
   def smooth_out_path(self):
     """Smooth the path a bit"""
@@ -990,9 +1703,9 @@ class Grid:
         last_node = this_path[i]
         next_node = this_path[i+2]
 
-        if last_node.coord[2] == next_node.coord[2] and \
-          abs(last_node.coord[1] - next_node.coord[1]) < 2 and \
-            abs(last_node.coord[0] - next_node.coord[0]) < 2:
+        if last_node[2] == next_node[2] and \
+          abs(last_node[1] - next_node[1]) < 2 and \
+            abs(last_node[0] - next_node[0]) < 2:
             to_remove_list.append(node)
             # move connection for junction if affected
             if last_node in self.saved_junction:
@@ -1007,7 +1720,7 @@ class Grid:
       for node in to_remove_list:
         this_path.remove(node)
 
-        print(f"Smoothed Node {node.coord} out of Path {list(map(lambda a: a.coord, key))}")
+        print(f"Smoothed Node {node} out of Path {key}")
       self.connection_dict[key] = this_path
 
 
@@ -1020,15 +1733,15 @@ class Grid:
     print("\n")
     for key, value in self.saved_path.items():
       print("Saved Path:")
-      print(f"{list(map(lambda a: a.coord, key))} : {list(map(lambda a: a.coord, value))}")
+      print(f"{key} : {value}")
 
   def print_saved_junction(self):
     """Helper Function"""
     print("\n")
     for key,value in self.saved_junction.items():
       end_connection_list = value
-      print(f"Junction: {key.coord}")
-      print(f"Connection points: {list(map(lambda a: a.coord, end_connection_list))}")
+      print(f"Junction: {key}")
+      print(f"Connection points: {end_connection_list}")
 
   def print_tip_ground_table(self):
     """Helper Function"""
@@ -1038,15 +1751,15 @@ class Grid:
       ground_node = value[0]
       is_start = value[1]
       path = value[2]
-      print(f"Tip: {tip_node.coord}, Ground: {ground_node.coord}, is_start = {is_start}")
-      print(f"Path: {list(map(lambda a: a.coord, path))}")
+      print(f"Tip: {tip_node}, Ground: {ground_node}, is_start = {is_start}")
+      print(f"Path: {path}")
 
   def print_connection_dict(self):
     """Helper Function"""
     print("\n")
     for key, value in self.connection_dict.items():
       print("Connection:")
-      print(f"{list(map(lambda a: a.coord, key))} : {list(map(lambda a: a.coord, value))}")
+      print(f"{key} : {value}")
 
   def register_error_message(self, error_message):
     """Helper Function"""
@@ -1127,11 +1840,11 @@ class test_path_finding():
     junction_list = []
 
     for key,value in self.grid.connection_dict.items():
-      this_pipe = list(map(lambda a: a.coord, value))
+      this_pipe = value
       pipe_list.append(this_pipe)
 
     for key,value in self.grid.saved_junction.items():
-      this_junction = [key.coord, list(map(lambda a: a.coord, value))]
+      this_junction = [key, value]
       junction_list.append(this_junction)
 
     for i,pipe in enumerate(pipe_list):
@@ -1147,6 +1860,46 @@ class test_path_finding():
 
 
 
+# route the same connections once per search mode on fresh grids
+# "BIDIRECTIONAL" is A star with bidirectional ground-ground paths
+# return {search_mode : {"time", "pushed", "expanded", "cost", "error_num"}}
+# cost is the summed step cost of all connections, it can differ between modes
+def compare_search_mode(dimention, connection_list, obstacle_list=(), mode_list=("ASTAR", "JPS", "HPA", "BIDIRECTIONAL")):
+  """Benchmark search modes on one netlist"""
+  result = {}
+  for search_mode in mode_list:
+    if search_mode == "BIDIRECTIONAL":
+      grid = Grid(dimention, "ASTAR", bidirectional_ground_path=True)
+    else:
+      grid = Grid(dimention, search_mode)
+    for coord in obstacle_list:
+      grid.make_obstacle(coord)
+
+    blockPrint()
+    start_time = time.perf_counter()
+    try:
+      for start_coord, end_coord in connection_list:
+        grid.connect_two_node(start_coord, end_coord)
+      grid.update_connection_dict()
+    finally:
+      enablePrint()
+    run_time = time.perf_counter() - start_time
+
+    result[search_mode] = {
+      "time": run_time,
+      "pushed": grid.total_search_count["pushed"],
+      "expanded": grid.total_search_count["expanded"],
+      "cost": sum(grid.get_path_cost(path) for path in grid.connection_dict.values()),
+      "error_num": len(grid.error_message_list),
+    }
+
+  for search_mode, data in result.items():
+    print(f"{search_mode:13} time {data['time']:.3f}s  pushed {data['pushed']}  expanded {data['expanded']}  cost {data['cost']:.2f}  errors {data['error_num']}")
+  return result
+
+
+
+
 # Disable
 def blockPrint():
   """Block terminal outputs"""
@@ -1170,7 +1923,7 @@ if __name__ == '__main__':
   # node = Node((1,2),(1,3))
   grid = Grid((20,20,5))
   # print(node)
-  # print(node.coord)
+  # print(node)
   # print(node.neighbors)
 
   # path1 = grid.add_path((0,0,0),(0,20,0))
@@ -1206,6 +1959,9 @@ if __name__ == '__main__':
   grid.connect_two_node((20,10,3), (6,1,4))
   grid.connect_two_node((0,10,3), (6,1,4))
 
+  # crossover cuts are done path by path, check them against cutting everything again
+  print(f"Crossover cut matches full recomputation: {grid.check_crossover_cut()}")
+
 
 
 
@@ -1216,7 +1972,7 @@ if __name__ == '__main__':
 
 
   # path = grid.path_finding((11,9,0),(12,10,5))
-  # path_coord = list(map(lambda a: a.coord, path))
+  # path_coord = path
   # make_pipe("p", path_coord)
 
   grid.update_connection_dict()
@@ -11,7 +11,11 @@ import math
 from math import sqrt
 import importlib.util
 import numpy as np
-import bpy
+try:
+  import bpy
+except ImportError:
+  # routing runs without Blender, see route_cli.py, only making the modules needs it
+  bpy = None
 
 # spec = importlib.util.spec_from_file_location("path_finding.py", "/Users/lhwang/Documents/GitHub/RMG Project/Fluid-Circuit-Generator/path_finding.py")
 # p = importlib.util.module_from_spec(spec)
@@ -19,6 +23,10 @@ import bpy
 # spec.loader.exec_module(p)
 
 import fluid_circuit_generator.path_finding as p
+import fluid_circuit_generator.parallel_routing as parallel_routing
+import fluid_circuit_generator.negotiated_routing as negotiated_routing
+import fluid_circuit_generator.rip_up_routing as rip_up_routing
+import fluid_circuit_generator.incremental_routing as incremental_routing
 
 
 
@@ -33,11 +41,21 @@ class PipeSystem:
   pipe_dimention = (.2, .15)
   unit_dimention = 1
   tip_length = 1
+  # "ASTAR", "JPS" or "HPA", see Grid.path_finding
+  search_mode = "ASTAR"
+  # search ground-ground paths from both ends, see Grid.bidirectional_path_finding
+  bidirectional_ground_path = False
+  # "DENSE" or "CHUNKED", see grid_storage.py
+  grid_storage = "DENSE"
+  # budget of rip up and reroute for failed connections, see rip_up_routing.py
+  # 0 iterations turns it off
+  rip_up_max_iteration = 20
+  rip_up_max_time = 30
 
 
   def __init__(self):
 
-    self.grid = p.Grid(self.grid_dimention)
+    self.grid = p.Grid(self.grid_dimention, self.search_mode, self.bidirectional_ground_path, self.grid_storage)
 
     # [(start_coord, end_coord)]
     self.to_connect_list = []
@@ -55,10 +73,15 @@ class PipeSystem:
     self.error_message_list = []
     # stores user related warning messages
     self.warning_message_list = []
+    # connection_dict, junction_dict and port_dict came from the routing cache, grid is empty
+    self.routing_loaded = False
 
 
-  def reset_grid(self, grid_dimention=None, pipe_dimention=None, unit_dimention=None, tip_length=None, obstacles=None):
-    """Top level function to Addjust dimentions of the grid and pipe system"""
+  def reset_grid(self, grid_dimention=None, pipe_dimention=None, unit_dimention=None, tip_length=None, obstacles=None, search_mode=None, grid_storage=None):
+    """
+    Top level function to Addjust dimentions of the grid and pipe system
+    obstacles is a bool occupancy array indexed [x, y, z] from grid coord 0, or [grid_coord]
+    """
     if grid_dimention is not None:
       self.grid_dimention = grid_dimention
     if pipe_dimention is not None:
@@ -67,10 +90,17 @@ class PipeSystem:
       self.unit_dimention = unit_dimention
     if tip_length is not None:
       self.tip_length = tip_length
+    if search_mode is not None:
+      self.search_mode = search_mode
+    if grid_storage is not None:
+      self.grid_storage = grid_storage
     self.__init__()
-    for coord in obstacles:
-      self.grid.make_obstacle(coord)
-    print(f"Pipe System Reset with grid_dimention={self.grid_dimention}, pipe_dimention={self.pipe_dimention}, unit_dimention={self.unit_dimention}, tip_length={self.tip_length}")
+    if isinstance(obstacles, np.ndarray) and obstacles.ndim == 3:
+      self.grid.add_obstacle_occupancy(obstacles)
+    elif obstacles is not None:
+      for coord in obstacles:
+        self.grid.make_obstacle(coord)
+    print(f"Pipe System Reset with grid_dimention={self.grid_dimention}, pipe_dimention={self.pipe_dimention}, unit_dimention={self.unit_dimention}, tip_length={self.tip_length}, search_mode={self.search_mode}, grid_storage={self.grid_storage}")
 
 
 
@@ -87,6 +117,128 @@ class PipeSystem:
 
     print("\n")
     print(f"Connecting Ports {start_port_coord} - {end_port_coord}")
+    start_grid_coord, end_grid_coord = self.snap_port_pair(start_port_coord, end_port_coord)
+    self.grid.connect_two_node(start_grid_coord, end_grid_coord)
+
+
+  # connect a list of (start_port_coord, end_port_coord)
+  # all ports are snapped here first, then routed one by one or in worker processes
+  def connect_port_list(self, connection_list, parallel=False, worker_num=None, negotiated=False):
+    """
+    Top level function
+    Use this to connect many pairs of ports
+    one by one routing rips up and reroutes paths in the way of failed connections, see rip_up_routing.py
+    parallel routes independent groups in worker processes, see parallel_routing.py
+    negotiated lets all connections negotiate for nodes first, see negotiated_routing.py
+    """
+    grid_connection_list = []
+    for start_port_coord, end_port_coord in connection_list:
+      print(f"Snapping Ports {start_port_coord} - {end_port_coord}")
+      grid_connection_list.append(self.snap_port_pair(start_port_coord, end_port_coord))
+
+    if negotiated:
+      negotiated_routing.route_negotiated(self.grid, grid_connection_list)
+      return
+    if parallel:
+      parallel_routing.route_parallel(self.grid, grid_connection_list, worker_num)
+      return
+    self.route_one_by_one(grid_connection_list, grid_connection_list)
+
+
+  # connect a list of (start_port_coord, end_port_coord), keeping the routing of the last build where it still fits
+  # routing_state is from get_routing_state of the last build, see incremental_routing.py
+  # same as connect_port_list without parallel or negotiated when nothing is kept
+  def connect_port_list_incremental(self, connection_list, routing_state):
+    """
+    Top level function
+    Use this to connect many pairs of ports after a small change to the design
+      ports that did not move keep their grid coord
+      groups whose ports all stayed keep their paths if nothing is in the way now
+      all other connections are snapped and routed one by one
+    """
+    old_port_dict = routing_state["port_dict"]
+    for connection in connection_list:
+      for port_coord in connection:
+        if port_coord in old_port_dict and port_coord not in self.port_dict:
+          self.port_dict[port_coord] = list(old_port_dict[port_coord])
+
+    # groups with a moved port are routed again without trying to keep them
+    to_route_list = []
+    keep_group_list = []
+    # {(start_grid_coord, end_grid_coord) : (start_port_coord, end_port_coord)}
+    port_connection_dict = {}
+    for port_group in parallel_routing.get_connection_group(connection_list):
+      if not all(port_coord in self.port_dict for connection in port_group for port_coord in connection):
+        to_route_list.extend(port_group)
+        continue
+      group = []
+      for connection in port_group:
+        grid_connection = tuple(self.get_port_grid_coord(port_coord) for port_coord in connection)
+        port_connection_dict[grid_connection] = connection
+        group.append(grid_connection)
+      keep_group_list.append(group)
+    for group in incremental_routing.keep_routed_group_list(self.grid, keep_group_list, routing_state["routed_group_list"]):
+      to_route_list.extend(port_connection_dict[grid_connection] for grid_connection in group)
+    # same order as connection_list
+    to_route_set = set(to_route_list)
+    to_route_list = [connection for connection in connection_list if connection in to_route_set]
+
+    # moved ports are snapped after the kept paths are in, so they don't land on them
+    grid_to_route_list = []
+    for start_port_coord, end_port_coord in to_route_list:
+      print(f"Snapping Ports {start_port_coord} - {end_port_coord}")
+      grid_to_route_list.append(self.snap_port_pair(start_port_coord, end_port_coord))
+    print(f"Routing {len(grid_to_route_list)} of {len(connection_list)} connections again")
+    grid_connection_list = [tuple(self.get_port_grid_coord(port_coord) for port_coord in connection) for connection in connection_list]
+    self.route_one_by_one(grid_to_route_list, grid_connection_list)
+
+
+  # route grid connections in order, failed ones are tried again by ripping up paths in their way
+  # grid_connection_list holds every connection on grid
+  def route_one_by_one(self, to_route_list, grid_connection_list):
+    """Helper Function"""
+    failed_list = []
+    # {failed connection : slice of the error list its try registered}
+    error_range_dict = {}
+    for start_grid_coord, end_grid_coord in to_route_list:
+      error_num = len(self.grid.error_message_list)
+      if not self.grid.connect_two_node(start_grid_coord, end_grid_coord):
+        failed_list.append((start_grid_coord, end_grid_coord))
+        error_range_dict[(start_grid_coord, end_grid_coord)] = (error_num, len(self.grid.error_message_list))
+    if failed_list and self.rip_up_max_iteration:
+      print(f"{len(failed_list)} connections failed, ripping up and rerouting")
+      rip_up_routing.rip_up_and_reroute(self.grid, grid_connection_list, failed_list, self.rip_up_max_iteration, self.rip_up_max_time, error_range_dict)
+
+  # everything the next build needs to keep this routing, see connect_port_list_incremental
+  # return {"routed_group_list", "port_dict"}
+  def get_routing_state(self):
+    """Helper Function"""
+    return {
+      "routed_group_list": incremental_routing.get_routed_group_list(self.grid),
+      "port_dict": {port_coord: list(value) for port_coord, value in self.port_dict.items()},
+    }
+
+
+  # connect every group of ports as one tree, see Grid.connect_node_group
+  # connection_list is only used for snapping, ports are snapped in pairs the same way as connect_port_list
+  def connect_port_group_list(self, connection_list, port_group_list):
+    """
+    Top level function
+    Use this to connect groups of ports with trees
+    """
+    for start_port_coord, end_port_coord in connection_list:
+      print(f"Snapping Ports {start_port_coord} - {end_port_coord}")
+      self.snap_port_pair(start_port_coord, end_port_coord)
+    for port_group in port_group_list:
+      grid_group = [self.get_port_grid_coord(port_coord) for port_coord in port_group]
+      if not self.grid.connect_node_group(grid_group):
+        print(f"Failed to connect port group {port_group}")
+
+
+  # snap both ports to the grid, reuse the grid coord of ports seen before
+  # return (start_grid_coord, end_grid_coord)
+  def snap_port_pair(self, start_port_coord, end_port_coord):
+    """Helper Function"""
     # start_tip_coord = (start_port_coord[0], start_port_coord[1], start_port_coord[2]-self.tip_length)
     # end_tip_coord = (end_port_coord[0], end_port_coord[1], end_port_coord[2]-self.tip_length)
     start_tip_coord = (start_port_coord[0], start_port_coord[1], start_port_coord[2]-self.tip_length)
@@ -115,8 +267,31 @@ class PipeSystem:
       self.port_dict[end_port_coord] = [end_port_coord, end_tip_coord, real_end_grid_coord]
 
     print(f"Corresponding Grid coord: {start_grid_coord} - {end_grid_coord}")
+    return start_grid_coord, end_grid_coord
 
-    self.grid.connect_two_node(start_grid_coord, end_grid_coord)
+
+  # grid coord of a snapped port
+  def get_port_grid_coord(self, port_coord):
+    """Helper Function"""
+    return tuple(map(lambda a: a//self.unit_dimention, self.port_dict[port_coord][2]))
+
+
+  # take a cached routing result instead of routing, see disk_cache.RoutingCache
+  def load_routing_result(self, result):
+    """
+    Top level function
+    Use this instead of connecting ports when the same design was routed before
+    """
+    self.connection_dict = result["connection_dict"]
+    self.junction_dict = result["junction_dict"]
+    self.port_dict = result["port_dict"]
+    self.routing_loaded = True
+    print(f"Routing result loaded: {len(self.connection_dict)} connections, {len(self.junction_dict)} junctions")
+
+  # return {"connection_dict", "junction_dict", "port_dict"}, only valid after fetch_grid_data
+  def get_routing_result(self):
+    """Helper Function"""
+    return {"connection_dict": self.connection_dict, "junction_dict": self.junction_dict, "port_dict": self.port_dict}
 
 
   # snap to grid towards destination, if not available, check around till z<0
@@ -225,13 +400,13 @@ class PipeSystem:
     """Get path data from Grid Object after all path finding is finished"""
     # get connection_dict
     for key,value in self.grid.connection_dict.items():
-      grid_tip_coord = tuple(map(lambda a: a.coord, key))
+      grid_tip_coord = key
       real_coord = []
       for coord in grid_tip_coord:
         real_coord.append(tuple(map(lambda a: a*self.unit_dimention, coord)))
       real_coord = tuple(real_coord)
 
-      grid_path_coord = tuple(map(lambda a: a.coord, value))
+      grid_path_coord = value
       real_path = []
       for coord in grid_path_coord:
         real_path.append(tuple(map(lambda a: a*self.unit_dimention, coord)))
@@ -240,9 +415,9 @@ class PipeSystem:
 
     # get junction_dict
     for key,value in self.grid.saved_junction.items():
-      real_junction_coord = tuple(map(lambda a: a*self.unit_dimention, key.coord))
+      real_junction_coord = tuple(map(lambda a: a*self.unit_dimention, key))
       real_connection_coord_list = []
-      connection_coord = tuple(map(lambda a: a.coord, value))
+      connection_coord = value
       for coord in connection_coord:
         real_connection_coord_list.append(tuple(map(lambda a: a*self.unit_dimention, coord)))
 
@@ -597,11 +772,22 @@ class PipeSystem:
     This is NOT Reversable
     Call once at the end
     """
-    self.grid.update_connection_dict()
-    self.fetch_grid_data()
-    self.construct_graph()
+    self.finish_routing()
     self.make_everything()
 
+  # everything finish_up_everything does before making modules, does not need Blender
+  def finish_routing(self):
+    """
+    Top level function
+    Only call after finishing all the connectings
+    Freeze all the connection data and organize them into usable form (graph)
+    """
+    # a loaded routing result is already in real world coordinates
+    if not self.routing_loaded:
+      self.grid.update_connection_dict()
+      self.fetch_grid_data()
+    self.construct_graph()
+
 
 
 
@@ -727,6 +913,9 @@ if __name__ == '__main__':
   pipe_system.connect_two_port((20,10,3), (6,1,4))
   pipe_system.connect_two_port((0,10,3), (6,1,4))
 
+  # crossover cuts are done path by path, check them against cutting everything again
+  print(f"Crossover cut matches full recomputation: {pipe_system.grid.check_crossover_cut()}")
+
 
 #   pipe_system.connect_two_port((15.5,10,12.3), (6,11.5,4))
 #   pipe_system.connect_two_port((20.5,10.8,13), (6,11.5,4))
@@ -0,0 +1,400 @@
+"""
+Rip Up Routing
+Recover connections that failed to route by moving the paths in their way
+  A relaxed search from tip to tip may go through paths of simple connections, at a cost
+  The simple connections on that path are ripped up, the failed connection is routed, then they are routed again
+  Victims that fail in turn rip up their own way within the same try, up to a few steps
+  A try that leaves any connection failed is undone, so rip up never makes the board worse
+  Connections are tried again after other tries changed the board, all within an iteration and time budget
+A simple connection has tips used by no other connection and one ground path without junctions,
+so it can be taken out and put back on its own
+"""
+
+import math
+import heapq
+import time
+
+import fluid_circuit_generator.path_finding as p
+
+
+
+
+# try to route the connections of failed_list again, connection_list holds every connection on grid
+# error_range_dict is {failed connection : (first, end)}, the slice of grid.error_message_list its first try registered
+# return stats of RipUpRouter.recover
+def rip_up_and_reroute(grid, connection_list, failed_list, max_iteration=20, max_time=30, error_range_dict=None):
+  """
+  Top level function
+  Use this after routing when some connections failed
+  """
+  router = RipUpRouter(grid, connection_list)
+  return router.recover(failed_list, max_iteration, max_time, error_range_dict)
+
+
+
+
+class RipUpRouter:
+  """
+  RipUpRouter object
+  Finds the paths blocking a failed connection and routes them again after it
+  """
+
+  # extra cost of going through a node of another connection in the relaxed search
+  rip_cost = 3
+  # connections ripped up at most for one failed connection
+  max_victim = 4
+  # tries of one connection before giving up on it
+  max_try = 2
+  # rip ups in one try, failed victims take the steps after the first
+  max_step = 4
+
+  def __init__(self, grid, connection_list):
+    self.grid = grid
+    self.connection_list = [(grid.get_node(start), grid.get_node(end)) for start, end in connection_list]
+    # number of connections using each tip node
+    # {tip_node : count}
+    self.tip_count = {}
+    for connection in self.connection_list:
+      for node in connection:
+        self.tip_count[node] = self.tip_count.get(node, 0) + 1
+    # connection that registered each message of grid.error_message_list, None for messages of others
+    # errors of the last failed try of a connection are removed by position once it is routed again
+    self.error_owner = []
+
+
+  # route every failed connection again, ripping up the simple connections in its way
+  # error_range_dict is {failed connection : (first, end)} slice of grid.error_message_list, see rip_up_and_reroute
+  # return {"failed", "recovered", "ripped", "rolled_back", "still_failed", "iteration", "time"}
+  def recover(self, failed_list, max_iteration=20, max_time=30, error_range_dict=None):
+    """Top level function"""
+    grid = self.grid
+    start_time = time.perf_counter()
+    # errors of the first try are already in the error list
+    self.error_owner = [None] * len(grid.error_message_list)
+    for connection, (first, end) in (error_range_dict or {}).items():
+      node_connection = (grid.get_node(connection[0]), grid.get_node(connection[1]))
+      for i in range(first, end):
+        self.error_owner[i] = node_connection
+    failed_list = [(grid.get_node(start), grid.get_node(end)) for start, end in failed_list]
+    stats = {"failed": len(failed_list), "recovered": 0, "ripped": 0, "rolled_back": 0, "still_failed": 0, "iteration": 0, "time": 0}
+    try_count = {connection: 0 for connection in failed_list}
+    to_try_list = list(failed_list)
+    still_failed = []
+
+    while to_try_list:
+      if stats["iteration"] >= max_iteration or time.perf_counter() - start_time > max_time:
+        print("Rip up and reroute budget used up")
+        still_failed += to_try_list
+        break
+      stats["iteration"] += 1
+      connection = to_try_list.pop(0)
+      try_count[connection] += 1
+      print(f"\nRip up and reroute try {stats['iteration']} for {connection}")
+
+      snapshot = self.get_snapshot()
+      result = self.try_connection(connection)
+      if result is None:
+        print(f"No way to free a path for {connection}")
+        still_failed.append(connection)
+        continue
+      ripped_num, is_routed = result
+      stats["ripped"] += ripped_num
+      if is_routed:
+        continue
+
+      # one failed connection before the try, one or more now
+      print(f"Rip up for {connection} did not route everything again, undoing it")
+      self.restore_snapshot(snapshot)
+      stats["rolled_back"] += 1
+      if try_count[connection] < self.max_try:
+        to_try_list.append(connection)
+      else:
+        still_failed.append(connection)
+
+    stats["still_failed"] = len(still_failed)
+    stats["recovered"] = len([connection for connection in failed_list if connection not in still_failed])
+    stats["time"] = time.perf_counter() - start_time
+    print(f"Rip up and reroute done: {stats}")
+    grid.register_warning_message(
+      f"WARNING: Rip up and reroute recovered {stats['recovered']} of {stats['failed']} failed connections "
+      f"in {stats['iteration']} tries, {stats['ripped']} paths ripped up, {stats['rolled_back']} tries undone, {stats['still_failed']} still failed")
+    return stats
+
+
+  # rip up the way of a failed connection and route it, then its victims
+  # victims that fail rip up their own way in the next steps, at most max_step rip ups in all
+  # return (number of paths ripped up, True if every connection involved is routed), None if nothing was ripped up
+  def try_connection(self, connection):
+    """Helper Function"""
+    pending_list = [connection]
+    ripped_num = 0
+    for step in range(self.max_step):
+      if not pending_list:
+        break
+      this_connection = pending_list.pop(0)
+      victim_list = self.find_victim(this_connection)
+      if victim_list is None:
+        if step == 0:
+          return None
+        print(f"No way to free a path for {this_connection}, victim of this try")
+        return ripped_num, False
+      for victim in victim_list:
+        self.rip_up(victim)
+      ripped_num += len(victim_list)
+      # every victim goes back in, even after the connection failed
+      for routed_connection in [this_connection] + victim_list:
+        if not self.route(routed_connection):
+          pending_list.append(routed_connection)
+    return ripped_num, not pending_list
+
+  # route a connection again, keep only the errors of its last try
+  # if both tip_ground paths are left from the failed try only the ground path is searched again
+  # return True if routed
+  def route(self, connection):
+    """Helper Function"""
+    grid = self.grid
+    self.remove_error_message(connection)
+    error_num = len(grid.error_message_list)
+    start_node, end_node = connection
+    if start_node in grid.tip_ground_table and end_node in grid.tip_ground_table:
+      self.route_ground(connection)
+    else:
+      self.clear_failed(connection)
+      grid.connect_two_node(start_node, end_node)
+    self.error_owner += [connection] * (len(grid.error_message_list) - error_num)
+    return len(grid.error_message_list) == error_num
+
+  # copy of everything a try can change
+  def get_snapshot(self):
+    """Helper Function"""
+    grid = self.grid
+    return {
+      "saved_path": {path_key: list(path) for path_key, path in grid.saved_path.items()},
+      "tip_ground_table": {tip_node: [ground_node, is_start, list(path)] for tip_node, (ground_node, is_start, path) in grid.tip_ground_table.items()},
+      "saved_junction": {junction_node: list(connection) for junction_node, connection in grid.saved_junction.items()},
+      "error_message_list": list(grid.error_message_list),
+      "warning_message_list": list(grid.warning_message_list),
+      "error_owner": list(self.error_owner),
+    }
+
+  # put the grid back to a snapshot, only paths that differ are removed and saved again
+  def restore_snapshot(self, snapshot):
+    """Helper Function"""
+    grid = self.grid
+    for path_key in list(grid.saved_path):
+      if snapshot["saved_path"].get(path_key) != grid.saved_path[path_key]:
+        grid.remove_saved_path(path_key)
+    for tip_node in list(grid.tip_ground_table):
+      if snapshot["tip_ground_table"].get(tip_node) != grid.tip_ground_table[tip_node]:
+        grid.remove_tip_ground_path(tip_node)
+    for tip_node, (ground_node, is_start, path) in snapshot["tip_ground_table"].items():
+      if tip_node not in grid.tip_ground_table:
+        grid.save_tip_ground_path(tip_node, ground_node, is_start, path)
+    for path_key, path in snapshot["saved_path"].items():
+      if path_key not in grid.saved_path:
+        grid.save_path(path_key, path)
+    grid.saved_junction.clear()
+    grid.saved_junction.update(snapshot["saved_junction"])
+    grid.error_message_list[:] = snapshot["error_message_list"]
+    grid.warning_message_list[:] = snapshot["warning_message_list"]
+    self.error_owner = list(snapshot["error_owner"])
+    grid.reset_grid()
+
+  # take the errors a connection registered out of the error list
+  def remove_error_message(self, connection):
+    """Helper Function"""
+    grid = self.grid
+    # messages registered by anything else since the last call belong to no connection
+    self.error_owner += [None] * (len(grid.error_message_list) - len(self.error_owner))
+    keep_list = [i for i, owner in enumerate(self.error_owner) if owner != connection]
+    grid.error_message_list[:] = [grid.error_message_list[i] for i in keep_list]
+    self.error_owner = [self.error_owner[i] for i in keep_list]
+
+  # second half of Grid.connect_two_node, tip_ground paths are already saved
+  def route_ground(self, connection):
+    """Helper Function"""
+    grid = self.grid
+    grid.reset_grid()
+    ground_node_list = [grid.tip_ground_table[tip_node][0] for tip_node in connection]
+    # ground nodes not on a saved path are new, same as connect_two_node
+    for ground_node in ground_node_list:
+      if ground_node not in grid.path_end:
+        grid.set_visited(ground_node, False)
+    grid.add_path(ground_node_list[0], ground_node_list[1])
+
+
+
+  ###########################################  victims  ########################################
+
+  # simple connections that are routed now
+  # return {connection : [path_key, start_tip_path, end_tip_path]}
+  def get_simple_connection(self):
+    """Helper Function"""
+    grid = self.grid
+    simple_dict = {}
+    for connection in self.connection_list:
+      start_node, end_node = connection
+      if self.tip_count[start_node] != 1 or self.tip_count[end_node] != 1:
+        continue
+      if start_node not in grid.tip_ground_table or end_node not in grid.tip_ground_table:
+        continue
+      start_ground_node = grid.tip_ground_table[start_node][0]
+      end_ground_node = grid.tip_ground_table[end_node][0]
+      for path_key in ((start_ground_node, end_ground_node), (end_ground_node, start_ground_node)):
+        if path_key not in grid.saved_path:
+          continue
+        if len(grid.path_end[start_ground_node]) != 1 or len(grid.path_end[end_ground_node]) != 1:
+          continue
+        if start_ground_node in grid.saved_junction or end_ground_node in grid.saved_junction:
+          continue
+        simple_dict[connection] = [path_key, grid.tip_ground_table[start_node][2], grid.tip_ground_table[end_node][2]]
+    return simple_dict
+
+  # relaxed search over the part of a failed connection that failed
+  #   ground node to ground node if both tip_ground paths are saved, else tip to ground below it
+  # nodes and cut edges of simple connections can be used at rip_cost, everything else in use is blocked
+  # return [connection] of simple connections on the way, None if there is no way or too many are in the way
+  def find_victim(self, connection):
+    """Helper Function"""
+    grid = self.grid
+    simple_dict = self.get_simple_connection()
+    simple_dict.pop(connection, None)
+
+    # {node_index : connection}
+    owner = {}
+    # {edge : (number of cuts by simple connections, connection)}
+    edge_owner = {}
+    for victim, (path_key, start_tip_path, end_tip_path) in simple_dict.items():
+      for node in grid.saved_path[path_key] + start_tip_path + end_tip_path:
+        owner[grid.get_index(node)] = victim
+      for edge in grid.crossover_log.get(path_key, []):
+        edge_owner[edge] = (edge_owner.get(edge, (0, None))[0] + 1, victim)
+
+    missing_tip_list = [tip_node for tip_node in connection if tip_node not in grid.tip_ground_table]
+    if missing_tip_list:
+      # tip_ground path failed, the tip paths left are taken out before the next try
+      start_node = missing_tip_list[0]
+      end_node = (start_node[0], start_node[1], 0)
+      own_node = set()
+      for tip_node in connection:
+        if tip_node in grid.tip_ground_table and self.tip_count[tip_node] == 1:
+          own_node.update(grid.get_index(node) for node in grid.tip_ground_table[tip_node][2])
+    else:
+      start_node, end_node = [grid.tip_ground_table[tip_node][0] for tip_node in connection]
+      own_node = {grid.get_index(start_node), grid.get_index(end_node)}
+    # tips are ports, never pass through them
+    tip_index = {grid.get_index(node) for node in self.tip_count} - {grid.get_index(start_node)}
+
+    start_index = grid.get_index(start_node)
+    end_index = grid.get_index(end_node)
+    end_x, end_y, end_z = end_node
+    x_mask, y_mask, z_mask = grid.axis_valid_mask
+    g_dict = {start_index: 0}
+    parent = {start_index: -1}
+    closed = set()
+    # (key, push order, node_index)
+    search_queue = [(0, 0, start_index)]
+    node_count = 0
+
+    while search_queue:
+      this_index = heapq.heappop(search_queue)[2]
+      if this_index == end_index:
+        break
+      if this_index in closed:
+        continue
+      closed.add(this_index)
+
+      x, y, z = grid.get_coord(this_index)
+      valid_mask = x_mask[x] & y_mask[y] & z_mask[z]
+      blocked_mask = int(grid.blocked_mask[this_index])
+      this_g = g_dict[this_index]
+      this_potential = .1 if z else 0
+      for direction in range(p.NEIGHBOR_NUM):
+        if not valid_mask & p.NEIGHBOR_BIT[direction]:
+          continue
+        neighbor_index = this_index + grid.neighbor_step[direction]
+        if neighbor_index in closed or neighbor_index in tip_index or grid.obstacle[neighbor_index]:
+          continue
+        extra_cost = 0
+        if grid.occupied[neighbor_index] and neighbor_index not in own_node:
+          if neighbor_index not in owner:
+            continue
+          extra_cost += self.rip_cost
+        if blocked_mask & p.NEIGHBOR_BIT[direction]:
+          # edge is only open if every cut comes from simple connections
+          edge = self.get_edge(this_index, direction)
+          if edge_owner.get(edge, (0, None))[0] != grid.blocked_edge_count.get(edge, 0):
+            continue
+          extra_cost += self.rip_cost
+
+        dx, dy, dz = p.NEIGHBOR_OFFSETS[direction]
+        neighbor_z = z + dz
+        cost = p.GROUND_STEP_COST[direction] if neighbor_z == 0 else p.STEP_COST[direction]
+        new_g = this_g + cost + this_potential - (.1 if neighbor_z else 0) + extra_cost
+        if new_g >= g_dict.get(neighbor_index, math.inf):
+          continue
+        g_dict[neighbor_index] = new_g
+        parent[neighbor_index] = this_index
+        h = .9*max(abs(x+dx-end_x), abs(y+dy-end_y), end_z-neighbor_z)
+        node_count += 1
+        heapq.heappush(search_queue, (new_g + h, node_count, neighbor_index))
+
+    grid.record_search_count(node_count, len(closed))
+    if end_index not in parent:
+      return None
+
+    victim_list = []
+    this_index = end_index
+    while this_index != -1:
+      last_index = parent[this_index]
+      victim = owner.get(this_index)
+      if last_index != -1:
+        direction = p.DIRECTION_INDEX[tuple(b - a for a, b in zip(grid.get_coord(last_index), grid.get_coord(this_index)))]
+        edge_victim = edge_owner.get(self.get_edge(last_index, direction), (0, None))[1]
+        if edge_victim is not None and edge_victim not in victim_list:
+          victim_list.append(edge_victim)
+      if victim is not None and this_index not in own_node and victim not in victim_list:
+        victim_list.append(victim)
+      this_index = last_index
+    if len(victim_list) > self.max_victim:
+      print(f"{len(victim_list)} connections in the way of {connection}, more than {self.max_victim}")
+      return None
+    print(f"Connections in the way of {connection}: {victim_list}")
+    return victim_list
+
+  # edge key used by Grid.unlink_nodes, smaller node index first
+  def get_edge(self, index, direction):
+    """Helper Function"""
+    step = self.grid.neighbor_step[direction]
+    if step < 0:
+      return (index + step, p.OPPOSITE_DIRECTION[direction])
+    return (index, direction)
+
+
+  ###########################################  rip up  ########################################
+
+  # take a simple connection out of the grid
+  def rip_up(self, connection):
+    """Helper Function"""
+    grid = self.grid
+    print(f"Ripping up {connection}")
+    start_node, end_node = connection
+    start_ground_node = grid.tip_ground_table[start_node][0]
+    end_ground_node = grid.tip_ground_table[end_node][0]
+    if (start_ground_node, end_ground_node) in grid.saved_path:
+      grid.remove_saved_path((start_ground_node, end_ground_node))
+    else:
+      grid.remove_saved_path((end_ground_node, start_ground_node))
+    grid.remove_tip_ground_path(start_node)
+    grid.remove_tip_ground_path(end_node)
+    grid.reset_grid()
+
+  # take out the tip_ground paths a failed try left behind, tips used by other connections stay
+  # a failed try never saves a ground path
+  def clear_failed(self, connection):
+    """Helper Function"""
+    grid = self.grid
+    for tip_node in connection:
+      if tip_node in grid.tip_ground_table and self.tip_count[tip_node] == 1:
+        grid.remove_tip_ground_path(tip_node)
+    grid.reset_grid()
@@ -0,0 +1,185 @@
+"""
+Route CLI
+Route designs without Blender
+  Input: a json netlist of port coordinates, and obstacle voxels
+  Output: json of paths, junctions and ports, the same data PipeSystem makes modules from
+Run from the repository root:
+  python -m fluid_circuit_generator.route_cli design.json --obstacle voxels.npy --output design.route.json
+  python -m fluid_circuit_generator.route_cli *.json --output-dir routed/
+
+Netlist json:
+  {
+    "connection_list": [[[x, y, z], [x, y, z]], ...],   port coordinates in mm, required
+    "grid_dimention": [x, y, z],           optional, fits the ports like GateAssembly.prepare_for_connection if missing
+    "pipe_dimention": [inner radius, thickness],
+    "unit_dimention": 1,
+    "tip_length": 1,
+    "search_mode": "ASTAR",                "ASTAR", "JPS" or "HPA"
+    "grid_storage": "DENSE",               "DENSE" or "CHUNKED"
+    "routing_mode": "SEQUENTIAL",          "SEQUENTIAL", "PARALLEL", "NEGOTIATED" or "STEINER"
+    "obstacle_file": "voxels.npy"          optional, relative to the netlist, --obstacle wins
+  }
+Obstacle voxels:
+  .npy: boolean array indexed [x, y, z] in grid coordinates, cropped to the grid
+  .json: list of grid coordinates [[x, y, z], ...]
+  .stl: obstacle mesh in mm, voxelized with voxelizer.get_occupancy like obstacles in Blender
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import numpy as np
+
+import fluid_circuit_generator.pipe_system as pipe_system
+import fluid_circuit_generator.parallel_routing as parallel_routing
+import fluid_circuit_generator.path_finding as p
+import fluid_circuit_generator.voxelizer as voxelizer
+
+
+
+
+# route one netlist
+# return the result as a json serializable dict, see write_result
+def route_netlist(netlist, obstacle_list=(), quiet=True):
+  """
+  Top level function
+  Use this to route a design given as a netlist dict
+  obstacle_list is a bool occupancy array indexed [x, y, z] or [grid_coord]
+  """
+  connection_list = [(tuple(start), tuple(end)) for start, end in netlist["connection_list"]]
+  unit_dimention = netlist.get("unit_dimention", pipe_system.PipeSystem.unit_dimention)
+  grid_dimention = netlist.get("grid_dimention")
+  if grid_dimention is None:
+    grid_dimention = get_grid_dimention(connection_list, unit_dimention)
+  routing_mode = netlist.get("routing_mode", "SEQUENTIAL")
+
+  if quiet:
+    p.blockPrint()
+  try:
+    start_time = time.perf_counter()
+    pipe = pipe_system.PipeSystem()
+    pipe.reset_grid(
+      tuple(grid_dimention),
+      tuple(netlist.get("pipe_dimention", pipe.pipe_dimention)),
+      unit_dimention,
+      netlist.get("tip_length", pipe.tip_length),
+      obstacle_list,
+      netlist.get("search_mode", pipe.search_mode),
+      netlist.get("grid_storage", pipe.grid_storage))
+    pipe.to_connect_list = connection_list[:]
+    if routing_mode == "STEINER":
+      port_group_list = []
+      for group in parallel_routing.get_connection_group(connection_list):
+        port_group = []
+        for connection in group:
+          port_group.extend(port for port in connection if port not in port_group)
+        port_group_list.append(port_group)
+      pipe.connect_port_group_list(connection_list, port_group_list)
+    else:
+      pipe.connect_port_list(connection_list, parallel=routing_mode == "PARALLEL", negotiated=routing_mode == "NEGOTIATED")
+    pipe.finish_routing()
+    routing_time = time.perf_counter() - start_time
+  finally:
+    if quiet:
+      p.enablePrint()
+
+  return {
+    "connection_list": [{"start": list(key[0]), "end": list(key[1]), "path": [list(coord) for coord in path]}
+      for key, path in pipe.connection_dict.items()],
+    "junction_list": [{"coord": list(coord), "connection": [list(node) for node in connection]}
+      for coord, connection in pipe.junction_dict.items()],
+    "port_list": [{"port": list(port), "tip": list(tip), "grid": list(grid)} for port, tip, grid in pipe.port_dict.values()],
+    "error_message_list": list(pipe.get_error_message()),
+    "warning_message_list": list(pipe.get_warning_message()),
+    "stats": {
+      "grid_dimention": list(grid_dimention),
+      "time": round(routing_time, 4),
+      "pushed": pipe.grid.total_search_count["pushed"],
+      "expanded": pipe.grid.total_search_count["expanded"],
+    },
+  }
+
+
+# grid that fits all ports, same as GateAssembly.prepare_for_connection
+def get_grid_dimention(connection_list, unit_dimention):
+  """Helper Function"""
+  max_real_dimention = (0,0,0)
+  for connection in connection_list:
+    for port_coord in connection:
+      max_real_dimention = tuple(map(max, max_real_dimention, port_coord))
+  return tuple(map(lambda x: int(x//unit_dimention)+1, max_real_dimention))
+
+
+# read obstacle voxels, see the top of this file
+# return bool occupancy array indexed [x, y, z] for .npy and .stl, [grid_coord] for .json
+def load_obstacle(file_path, grid_dimention=None, unit_dimention=1):
+  """Helper Function"""
+  if file_path.lower().endswith(".stl"):
+    if grid_dimention is None:
+      raise ValueError(f"{file_path}: grid_dimention is needed to voxelize an STL obstacle")
+    return voxelizer.get_occupancy(voxelizer.read_stl(file_path), grid_dimention, unit_dimention)
+  if file_path.endswith(".npy"):
+    occupancy = np.load(file_path).astype(bool)
+    if grid_dimention is not None:
+      occupancy = occupancy[:grid_dimention[0]+1, :grid_dimention[1]+1, :grid_dimention[2]+1]
+    return occupancy
+  with open(file_path) as file:
+    return [tuple(coord) for coord in json.load(file)]
+
+
+# route one netlist file and write the result
+def route_file(netlist_path, output_path, obstacle_path=None, quiet=True):
+  """Helper Function"""
+  with open(netlist_path) as file:
+    netlist = json.load(file)
+  if obstacle_path is None and netlist.get("obstacle_file"):
+    obstacle_path = os.path.join(os.path.dirname(netlist_path), netlist["obstacle_file"])
+  obstacle_list = []
+  if obstacle_path is not None:
+    unit_dimention = netlist.get("unit_dimention", pipe_system.PipeSystem.unit_dimention)
+    grid_dimention = netlist.get("grid_dimention")
+    if grid_dimention is None:
+      connection_list = [(tuple(start), tuple(end)) for start, end in netlist["connection_list"]]
+      grid_dimention = get_grid_dimention(connection_list, unit_dimention)
+    obstacle_list = load_obstacle(obstacle_path, grid_dimention, unit_dimention)
+
+  result = route_netlist(netlist, obstacle_list, quiet)
+  with open(output_path, "w") as file:
+    json.dump(result, file, indent=1)
+  print(f"{netlist_path}: {len(result['connection_list'])} paths, {len(result['junction_list'])} junctions, "
+    f"{len(result['error_message_list'])} errors, {result['stats']['time']}s -> {output_path}")
+  return result
+
+
+def main(argv=None):
+  """Command line entry, see the top of this file"""
+  parser = argparse.ArgumentParser(prog="python -m fluid_circuit_generator.route_cli", description="Route fluid circuit netlists without Blender")
+  parser.add_argument("netlist", nargs="+", help="netlist json files")
+  parser.add_argument("--obstacle", help="obstacle voxel file (.npy or .json) or mesh (.stl), only with one netlist")
+  parser.add_argument("--output", help="result json, only with one netlist")
+  parser.add_argument("--output-dir", help="folder for <netlist name>.route.json of every netlist")
+  parser.add_argument("--verbose", action="store_true", help="show the routing log")
+  args = parser.parse_args(argv)
+
+  if len(args.netlist) > 1 and (args.obstacle or args.output):
+    parser.error("--obstacle and --output only work with one netlist, use obstacle_file and --output-dir")
+  if args.output_dir:
+    os.makedirs(args.output_dir, exist_ok=True)
+
+  failed_num = 0
+  for netlist_path in args.netlist:
+    if args.output:
+      output_path = args.output
+    else:
+      name = os.path.splitext(os.path.basename(netlist_path))[0] + ".route.json"
+      output_path = os.path.join(args.output_dir or os.path.dirname(netlist_path), name)
+    result = route_file(netlist_path, output_path, args.obstacle, not args.verbose)
+    failed_num += bool(result["error_message_list"])
+  # non zero exit code if any design has errors, so build servers notice
+  return 1 if failed_num else 0
+
+
+if __name__ == "__main__":
+  sys.exit(main())
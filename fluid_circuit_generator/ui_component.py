@@ -625,6 +625,11 @@ class MESH_OT_make_assembly(bpy.types.Operator):
       error_list.clear()
       return {'CANCELLED'}
 
+    # a new build of the same assembly only routes again what changed since the last one
+    self.gate_list.clear()
+    self.connection_list.clear()
+    self.assembly.reset_design()
+
     self.get_all_gates()
     self.get_all_connections()
 
@@ -797,7 +802,8 @@ class MESH_OT_make_assembly(bpy.types.Operator):
       tip_length = tip_len,
       stage_height = stage_height,
       stage_margin = stage_margin,
-      tip_offset = tip_offset):
+      tip_offset = tip_offset,
+      obstacle_mode = "REMESH" if pipe_prop.remesh_obstacles else "WINDING"):
 
       print("\n\n\nin add_all_connections\n", self.assembly.obstacle_list)
 
@@ -805,7 +811,7 @@ class MESH_OT_make_assembly(bpy.types.Operator):
 
         self.assembly.add_connection(connection_unit[0], connection_unit[1])
 
-    self.assembly.make_connections()
+    self.assembly.make_connections(parallel=pipe_prop.parallel_routing, negotiated=pipe_prop.negotiated_routing, steiner=pipe_prop.steiner_routing, use_cache=pipe_prop.use_routing_cache, incremental=pipe_prop.incremental_routing)
     self.assembly.update_connection_dict()
 
     print(self.assembly.get_warning_message())
@@ -845,6 +851,22 @@ class MESH_OT_make_assembly(bpy.types.Operator):
 
 
 
+class MESH_OT_clear_routing_cache(bpy.types.Operator):
+  """
+  Remove all saved routings and obstacle occupancies
+  Next Make Assembly voxelizes and routes everything again
+  """
+  bl_idname = "mesh.clear_routing_cache"
+  bl_label = "Clear Routing Cache"
+
+  def execute(self, context):
+    removed_num = bpy.types.MESH_OT_make_assembly.assembly.clear_routing_cache()
+    self.report({"INFO"}, f"Routing cache cleared, {removed_num} routings removed")
+    return {'FINISHED'}
+
+
+
+
 class MESH_OT_make_preview_pipe(bpy.types.Operator):
   """
   Makes a example section of pipe,
@@ -1863,6 +1885,25 @@ class PipePropertyGroup(bpy.types.PropertyGroup):
 
   add_custom_tip: bpy.props.BoolProperty(default = False)
 
+  # NOT enabled in UI
+  # route independent connection groups in worker processes
+  parallel_routing: bpy.props.BoolProperty(default = False)
+  # NOT enabled in UI
+  # let all connections negotiate for nodes before saving them
+  negotiated_routing: bpy.props.BoolProperty(default = False)
+  # NOT enabled in UI
+  # route every connection group as one tree
+  steiner_routing: bpy.props.BoolProperty(default = False)
+  # NOT enabled in UI
+  # reuse the routing of a design made before, see disk_cache.py
+  use_routing_cache: bpy.props.BoolProperty(default = True)
+  # NOT enabled in UI
+  # keep paths of the last build that a change did not touch
+  incremental_routing: bpy.props.BoolProperty(default = True)
+  # NOT enabled in UI
+  # voxelize obstacles with a remesh in Blender, slow, only for broken meshes, see GateAssembly.obstacle_mode
+  remesh_obstacles: bpy.props.BoolProperty(default = False)
+
   tip_offset: bpy.props.FloatProperty(
     default = 3,
     min = 0,
@@ -2208,6 +2249,7 @@ class VIEW3D_PT_make_assembly_panel(bpy.types.Panel):
         # col.prop(ui_prop, "preview_pipe_thickness", text="line thickness (mm)")
       else:
         row.operator("mesh.delete_preview_connection", text="Hide Preview")
+    layout.operator("mesh.clear_routing_cache", text="Clear Routing Cache")
     
     # row.operator("mesh.debug_command", text="Debug Button")
 
@@ -2380,6 +2422,7 @@ class_to_register = [
   MESH_OT_cancel_connection_port,
   MESH_OT_check_connection_selection,
   MESH_OT_make_assembly,
+  MESH_OT_clear_routing_cache,
   MESH_OT_make_preview_pipe,
   MESH_OT_delete_preview_pipe,
   MESH_OT_make_preview_connection,
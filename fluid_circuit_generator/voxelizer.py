@@ -0,0 +1,401 @@
+"""
+Voxelizer
+Obstacle occupancy of the whole grid lattice from a triangle mesh, with NumPy instead of one Blender call per point
+  Near: lattice points closer to a triangle than distance, only points around each triangle are checked
+  Inside, two modes:
+    "WINDING": generalized winding number from a TriangleBVH, works on meshes with small holes or doubled faces
+      it only changes across the surface, so it is found once for each run of lattice points along z between points of the near band
+    "RAY": a ray from every lattice point goes up (+z), a point is inside when the ray crosses the mesh an odd number of times
+      the crossings of one column are found once for all its points, faster but needs a closed mesh
+  Both only run in the window of the lattice inside the bounding box of the mesh grown by distance,
+  so a small obstacle costs the same on any board size
+Triangles come from Blender (see GateAssembly.get_object_triangles) or from an STL file (read_stl)
+Nothing in here needs Blender
+"""
+
+import struct
+import numpy as np
+
+
+# most lattice point - triangle pairs checked at once, bounds the memory of get_near_occupancy
+PAIR_BATCH = 1 << 21
+
+# lattice points are moved by this (times unit_dimention) for the ray test,
+# so rays never go exactly through an edge or a vertex sitting on the lattice
+RAY_JITTER = (1.2345e-6, 2.3456e-6)
+
+# triangles in a leaf of TriangleBVH
+BVH_LEAF_SIZE = 8
+# a BVH node counts as one dipole for points farther than this times its radius, larger is more accurate
+BVH_BETA = 2.
+# points evaluated at once by TriangleBVH.get_winding_number
+POINT_BATCH = 1 << 12
+# slack (times unit_dimention) of the band that splits winding number runs, see get_window_occupancy
+BAND_EPSILON = 1e-6
+
+
+
+
+# occupancy of the lattice points (x*unit_dimention, y*unit_dimention, z*unit_dimention)
+# triangle_array is float (n, 3, 3) in world coordinates
+# occupancy is merged into when given, else a new one is made
+# return bool array of shape (grid_dimention[0]+1, grid_dimention[1]+1, grid_dimention[2]+1), indexed [x, y, z]
+def get_occupancy(triangle_array, grid_dimention, unit_dimention, distance=None, occupancy=None, inside_mode="WINDING", bvh=None):
+  """
+  Top level function
+  Use this to voxelize one obstacle mesh, distance is unit_dimention/2 by default
+  """
+  if occupancy is None:
+    occupancy = np.zeros(tuple(int(d) + 1 for d in grid_dimention), dtype=bool)
+  low, window_occupancy = get_window_occupancy(triangle_array, grid_dimention, unit_dimention, distance, inside_mode, bvh)
+  if window_occupancy is not None:
+    high = low + window_occupancy.shape
+    occupancy[low[0]:high[0], low[1]:high[1], low[2]:high[2]] |= window_occupancy
+  return occupancy
+
+
+# occupancy of only the lattice window the mesh can reach
+# grid_dimention None only clips the window at 0, the window can then be cut to any grid with crop_window
+# inside_mode is "WINDING" or "RAY", see the top of this file
+# bvh is the TriangleBVH of triangle_array for "WINDING", made here if not given
+# return (window low corner grid coord, bool array of the window), (None, None) when the mesh is outside the grid
+def get_window_occupancy(triangle_array, grid_dimention, unit_dimention, distance=None, inside_mode="WINDING", bvh=None):
+  """
+  Top level function
+  Use this to voxelize one obstacle mesh without making an array of the whole grid
+  """
+  if distance is None:
+    distance = unit_dimention / 2
+  triangle_array = np.asarray(triangle_array, dtype=np.float64).reshape(-1, 3, 3)
+  window = get_window(triangle_array, grid_dimention, unit_dimention, distance)
+  if window is None:
+    return None, None
+  low, high = window
+  # voxelize as if the window was the whole grid
+  shifted_array = triangle_array - low * unit_dimention
+  shape = tuple(high - low + 1)
+  if distance > 0:
+    near, band = get_near_band(shifted_array, shape, unit_dimention, distance)
+  else:
+    near = np.zeros(shape, dtype=bool)
+    band = near
+
+  if inside_mode == "RAY":
+    return low, near | get_inside_occupancy(shifted_array, shape, unit_dimention)
+  if inside_mode != "WINDING":
+    raise ValueError(f"Unknown inside_mode {inside_mode}, use WINDING or RAY")
+  if bvh is None:
+    bvh = TriangleBVH(triangle_array)
+
+  # points to evaluate, one for each run along z when runs can't cross the surface, else all points not near
+  # a surface between two points one unit apart is at most half a unit from one of them,
+  # so a run is split next to every point of the band (distance included), not only next to near points
+  if distance >= unit_dimention / 2:
+    run_start = ~near
+    run_start[:, :, 1:] &= band[:, :, :-1] | band[:, :, 1:]
+  else:
+    run_start = ~near
+  start_index = np.argwhere(run_start)
+  is_inside = np.abs(bvh.get_winding_number((start_index + low) * unit_dimention)) > .5
+  # points of a run take the value of its start, labels count run starts in x, y, z order
+  run_label = np.cumsum(run_start.ravel()).reshape(shape) - 1
+  run_label = np.maximum(run_label, 0)
+  inside = np.zeros(shape, dtype=bool)
+  if len(is_inside):
+    inside = is_inside[run_label] & ~near
+  return low, near | inside
+
+
+# lattice window of the bounding box of the mesh grown by distance, clipped to the grid
+# return (low, high) inclusive int arrays, None if empty
+def get_window(triangle_array, grid_dimention, unit_dimention, distance):
+  """Helper Function"""
+  if len(triangle_array) == 0:
+    return None
+  point_array = triangle_array.reshape(-1, 3)
+  low = np.ceil((point_array.min(axis=0) - distance) / unit_dimention).astype(np.int64)
+  high = np.floor((point_array.max(axis=0) + distance) / unit_dimention).astype(np.int64)
+  low = np.maximum(low, 0)
+  if grid_dimention is not None:
+    high = np.minimum(high, np.array(grid_dimention, dtype=np.int64))
+  if np.any(low > high):
+    return None
+  return low, high
+
+
+# part of an occupancy window inside the grid
+# return (low, bool array), (None, None) if nothing is left
+def crop_window(low, occupancy, grid_dimention):
+  """Helper Function"""
+  if occupancy is None:
+    return None, None
+  size = np.minimum(np.array(occupancy.shape), np.array(grid_dimention, dtype=np.int64) + 1 - low)
+  if occupancy.size == 0 or np.any(size <= 0):
+    return None, None
+  return low, occupancy[:size[0], :size[1], :size[2]]
+
+
+# ray parity test of every lattice point
+def get_inside_occupancy(triangle_array, shape, unit_dimention):
+  """Helper Function"""
+  # work in lattice units, jitter moves the rays off the lattice
+  triangle_array = triangle_array / unit_dimention
+  a = triangle_array[:, 0]
+  b = triangle_array[:, 1]
+  c = triangle_array[:, 2]
+  # triangles standing on their side have no area seen from below
+  area = (b[:, 0] - a[:, 0]) * (c[:, 1] - a[:, 1]) - (b[:, 1] - a[:, 1]) * (c[:, 0] - a[:, 0])
+  keep = np.abs(area) > 1e-12
+  a, b, c, area = a[keep], b[keep], c[keep], area[keep]
+
+  # columns under each triangle
+  low = np.ceil(np.minimum(np.minimum(a[:, :2], b[:, :2]), c[:, :2]) - RAY_JITTER).astype(np.int64)
+  high = np.floor(np.maximum(np.maximum(a[:, :2], b[:, :2]), c[:, :2]) - RAY_JITTER).astype(np.int64)
+  low = np.maximum(low, 0)
+  high = np.minimum(high, np.array(shape[:2]) - 1)
+  triangle_id, (column_x, column_y) = expand_range(low, high)
+
+  # barycentric coordinates of the column in the triangle seen from above
+  px = column_x + RAY_JITTER[0]
+  py = column_y + RAY_JITTER[1]
+  ta, tb, tc, t_area = a[triangle_id], b[triangle_id], c[triangle_id], area[triangle_id]
+  w_a = ((tb[:, 0] - px) * (tc[:, 1] - py) - (tb[:, 1] - py) * (tc[:, 0] - px)) / t_area
+  w_b = ((tc[:, 0] - px) * (ta[:, 1] - py) - (tc[:, 1] - py) * (ta[:, 0] - px)) / t_area
+  w_c = 1 - w_a - w_b
+  hit = (w_a >= 0) & (w_b >= 0) & (w_c >= 0)
+  cross_z = (w_a * ta[:, 2] + w_b * tb[:, 2] + w_c * tc[:, 2])[hit]
+  column_x, column_y = column_x[hit], column_y[hit]
+
+  # a crossing at cross_z counts for every lattice point below it
+  # count at ceil(cross_z), then sum from the top, cross_count[z+1] is the number of crossings above z
+  first_z = np.clip(np.ceil(cross_z).astype(np.int64), 0, shape[2])
+  cross_count = np.zeros((shape[0], shape[1], shape[2] + 1), dtype=np.int32)
+  np.add.at(cross_count, (column_x, column_y, first_z), 1)
+  cross_count = np.cumsum(cross_count[:, :, ::-1], axis=2)[:, :, ::-1]
+  return (cross_count[:, :, 1:] % 2).astype(bool)
+
+
+# lattice points closer than distance to any triangle
+def get_near_occupancy(triangle_array, shape, unit_dimention, distance):
+  """Helper Function"""
+  return get_near_band(triangle_array, shape, unit_dimention, distance)[0]
+
+# lattice points closer than distance to any triangle,
+# and the band of points not farther than distance (plus BAND_EPSILON) used to split winding number runs
+# return (near, band) bool arrays
+def get_near_band(triangle_array, shape, unit_dimention, distance):
+  """Helper Function"""
+  triangle_array = triangle_array / unit_dimention
+  distance = distance / unit_dimention
+  band_distance = distance + BAND_EPSILON
+  occupancy = np.zeros(shape, dtype=bool)
+  band = np.zeros(shape, dtype=bool)
+
+  # lattice box around each triangle grown by the band
+  low = np.ceil(triangle_array.min(axis=1) - band_distance).astype(np.int64)
+  high = np.floor(triangle_array.max(axis=1) + band_distance).astype(np.int64)
+  low = np.maximum(low, 0)
+  high = np.minimum(high, np.array(shape) - 1)
+  pair_num = np.prod(np.maximum(high - low + 1, 0), axis=1)
+
+  for batch in get_batch_list(pair_num):
+    triangle_id, (x, y, z) = expand_range(low[batch], high[batch])
+    point = np.stack((x, y, z), axis=1).astype(np.float64)
+    point_distance = get_point_triangle_distance(point, triangle_array[batch][triangle_id])
+    near = point_distance < distance
+    occupancy[x[near], y[near], z[near]] = True
+    in_band = point_distance <= band_distance
+    band[x[in_band], y[in_band], z[in_band]] = True
+  return occupancy, band
+
+
+# split triangles into slices of about PAIR_BATCH pairs, a triangle with more pairs gets a slice of its own
+def get_batch_list(pair_num):
+  """Helper Function"""
+  batch_list = []
+  batch_start = 0
+  batch_size = 0
+  for i, num in enumerate(pair_num):
+    if batch_size and batch_size + num > PAIR_BATCH:
+      batch_list.append(slice(batch_start, i))
+      batch_start = i
+      batch_size = 0
+    batch_size += num
+  if batch_start < len(pair_num):
+    batch_list.append(slice(batch_start, len(pair_num)))
+  return batch_list
+
+
+# distance of every point to its triangle, point is (n, 3), triangle is (n, 3, 3)
+# inside the triangle seen along its normal it is the plane distance, else the distance to the nearest edge
+def get_point_triangle_distance(point, triangle):
+  """Helper Function"""
+  a, b, c = triangle[:, 0], triangle[:, 1], triangle[:, 2]
+  normal = np.cross(b - a, c - a)
+  normal_length = np.linalg.norm(normal, axis=1)
+  flat = normal_length > 1e-12
+  normal[flat] /= normal_length[flat, None]
+  plane_distance = np.einsum("ij,ij->i", point - a, normal)
+  projected = point - plane_distance[:, None] * normal
+  # projected point is inside when it is on the inner side of all three edges
+  inside = flat.copy()
+  for start, end in ((a, b), (b, c), (c, a)):
+    inside &= np.einsum("ij,ij->i", np.cross(end - start, projected - start), normal) >= 0
+
+  edge_distance = np.minimum(np.minimum(get_point_segment_distance(point, a, b), get_point_segment_distance(point, b, c)),
+    get_point_segment_distance(point, c, a))
+  return np.where(inside, np.abs(plane_distance), edge_distance)
+
+def get_point_segment_distance(point, start, end):
+  """Helper Function"""
+  segment = end - start
+  length_square = np.einsum("ij,ij->i", segment, segment)
+  t = np.einsum("ij,ij->i", point - start, segment) / np.maximum(length_square, 1e-24)
+  t = np.clip(t, 0, 1)
+  return np.linalg.norm(point - start - t[:, None] * segment, axis=1)
+
+
+# every integer point of the boxes low..high (inclusive), low and high are (n, d)
+# return (box index of each point, tuple of d coordinate arrays)
+def expand_range(low, high):
+  """Helper Function"""
+  size = np.maximum(high - low + 1, 0)
+  count = np.prod(size, axis=1)
+  box_id = np.repeat(np.arange(len(low)), count)
+  offset = np.arange(count.sum()) - np.repeat(np.cumsum(count) - count, count)
+  coord_list = []
+  # last axis changes fastest
+  for axis in range(low.shape[1]-1, -1, -1):
+    axis_size = size[box_id, axis]
+    coord_list.insert(0, low[box_id, axis] + offset % np.maximum(axis_size, 1))
+    offset = offset // np.maximum(axis_size, 1)
+  return box_id, tuple(coord_list)
+
+
+# read a binary or ascii STL file
+# return float (n, 3, 3) triangles
+def read_stl(file_path):
+  """Top level function"""
+  with open(file_path, "rb") as file:
+    data = file.read()
+  # binary: 80 byte header, triangle count, 50 bytes per triangle
+  if len(data) >= 84:
+    triangle_num = struct.unpack("<I", data[80:84])[0]
+    if len(data) == 84 + 50 * triangle_num:
+      record = np.frombuffer(data, dtype=np.dtype([("normal", "<f4", 3), ("vertex", "<f4", (3, 3)), ("attribute", "<u2")]),
+        count=triangle_num, offset=84)
+      return record["vertex"].astype(np.float64)
+  vertex_list = [line.split()[1:4] for line in data.decode("utf-8", "ignore").splitlines() if line.strip().startswith("vertex")]
+  return np.array(vertex_list, dtype=np.float64).reshape(-1, 3, 3)
+
+
+class TriangleBVH:
+  """
+  Bounding volume hierarchy of a triangle mesh for fast generalized winding numbers
+  Each node is a range of the sorted triangles, with the dipole of its triangles for points far away
+  Make it once for an obstacle and reuse it while the obstacle does not change
+  """
+
+  def __init__(self, triangle_array):
+    triangle_array = np.asarray(triangle_array, dtype=np.float64).reshape(-1, 3, 3)
+    centroid = triangle_array.mean(axis=1)
+    order = np.arange(len(triangle_array))
+    # [start, end, left, right] of each node, children are -1 for leaves, node 0 is the root
+    node_list = []
+    stack = [(0, len(triangle_array), -1, 0)] if len(triangle_array) else []
+    while stack:
+      start, end, parent, side = stack.pop()
+      node_index = len(node_list)
+      node_list.append([start, end, -1, -1])
+      if parent >= 0:
+        node_list[parent][2 + side] = node_index
+      if end - start <= BVH_LEAF_SIZE:
+        continue
+      # split at the median of the longest axis of the centroids
+      node_centroid = centroid[order[start:end]]
+      axis = np.argmax(node_centroid.max(axis=0) - node_centroid.min(axis=0))
+      middle = (end - start) // 2
+      order[start:end] = order[start:end][np.argpartition(node_centroid[:, axis], middle)]
+      stack.append((start + middle, end, node_index, 1))
+      stack.append((start, start + middle, node_index, 0))
+
+    self.triangle_array = triangle_array[order]
+    node_array = np.array(node_list, dtype=np.int64).reshape(-1, 4)
+    self.node_start, self.node_end, self.node_left, self.node_right = node_array.T
+
+    # area weighted normal of each triangle, sums of ranges come from prefix sums
+    a, b, c = self.triangle_array[:, 0], self.triangle_array[:, 1], self.triangle_array[:, 2]
+    area_normal = np.cross(b - a, c - a) / 2
+    area = np.linalg.norm(area_normal, axis=1)
+    prefix_dipole = np.concatenate((np.zeros((1, 3)), np.cumsum(area_normal, axis=0)))
+    prefix_area = np.concatenate(([0], np.cumsum(area)))
+    prefix_center = np.concatenate((np.zeros((1, 3)), np.cumsum(area[:, None] * self.triangle_array.mean(axis=1), axis=0)))
+    node_area = prefix_area[self.node_end] - prefix_area[self.node_start]
+    self.node_dipole = prefix_dipole[self.node_end] - prefix_dipole[self.node_start]
+    node_box_low = np.array([self.triangle_array[start:end].reshape(-1, 3).min(axis=0) for start, end in zip(self.node_start, self.node_end)]).reshape(-1, 3)
+    node_box_high = np.array([self.triangle_array[start:end].reshape(-1, 3).max(axis=0) for start, end in zip(self.node_start, self.node_end)]).reshape(-1, 3)
+    # area weighted center, box center for nodes without area
+    box_center = (node_box_low + node_box_high) / 2
+    has_area = node_area > 1e-12
+    self.node_center = box_center.copy()
+    self.node_center[has_area] = (prefix_center[self.node_end] - prefix_center[self.node_start])[has_area] / node_area[has_area, None]
+    # radius reaches every corner of the box
+    self.node_radius = np.linalg.norm(np.maximum(np.abs(node_box_low - self.node_center), np.abs(node_box_high - self.node_center)), axis=1)
+
+
+  # winding number of each point, about 1 inside and 0 outside, -1 inside when all faces point in
+  # point_array is float (n, 3)
+  def get_winding_number(self, point_array):
+    """Top level function"""
+    point_array = np.asarray(point_array, dtype=np.float64).reshape(-1, 3)
+    winding_number = np.zeros(len(point_array))
+    if len(self.node_start) == 0:
+      return winding_number
+    for batch_start in range(0, len(point_array), POINT_BATCH):
+      batch_point = point_array[batch_start:batch_start + POINT_BATCH]
+      winding_number[batch_start:batch_start + len(batch_point)] = self.get_batch_winding_number(batch_point)
+    return winding_number
+
+  def get_batch_winding_number(self, point_array):
+    """Helper Function"""
+    solid_angle = np.zeros(len(point_array))
+    # (point, node) pairs still to visit, every point starts at the root
+    point_index = np.arange(len(point_array))
+    node_index = np.zeros(len(point_array), dtype=np.int64)
+    while len(point_index):
+      offset = self.node_center[node_index] - point_array[point_index]
+      distance = np.linalg.norm(offset, axis=1)
+      far = distance > BVH_BETA * self.node_radius[node_index]
+      # far nodes are one dipole
+      far_value = np.einsum("ij,ij->i", offset[far], self.node_dipole[node_index[far]]) / distance[far]**3
+      solid_angle += np.bincount(point_index[far], far_value, len(point_array))
+
+      # close leaves are summed triangle by triangle
+      leaf = ~far & (self.node_left[node_index] < 0)
+      leaf_point = point_index[leaf]
+      leaf_node = node_index[leaf]
+      pair_id, (triangle_index,) = expand_range(self.node_start[leaf_node][:, None], self.node_end[leaf_node][:, None] - 1)
+      triangle_value = get_solid_angle(point_array[leaf_point[pair_id]], self.triangle_array[triangle_index])
+      solid_angle += np.bincount(leaf_point[pair_id], triangle_value, len(point_array))
+
+      # close inner nodes open up
+      inner = ~far & ~leaf
+      point_index = np.concatenate((point_index[inner], point_index[inner]))
+      node_index = np.concatenate((self.node_left[node_index[inner]], self.node_right[node_index[inner]]))
+    return solid_angle / (4 * np.pi)
+
+
+# signed solid angle of each triangle seen from its point (Van Oosterom and Strackee)
+# point is (n, 3), triangle is (n, 3, 3), positive when the point is behind the front face
+def get_solid_angle(point, triangle):
+  """Helper Function"""
+  a = triangle[:, 0] - point
+  b = triangle[:, 1] - point
+  c = triangle[:, 2] - point
+  length_a = np.linalg.norm(a, axis=1)
+  length_b = np.linalg.norm(b, axis=1)
+  length_c = np.linalg.norm(c, axis=1)
+  numerator = np.einsum("ij,ij->i", a, np.cross(b, c))
+  denominator = (length_a * length_b * length_c + np.einsum("ij,ij->i", a, b) * length_c
+    + np.einsum("ij,ij->i", b, c) * length_a + np.einsum("ij,ij->i", c, a) * length_b)
+  return 2 * np.arctan2(numerator, denominator)
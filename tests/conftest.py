@@ -0,0 +1,57 @@
+"""Shared helpers of the tests, run with python -m pytest from the repository root"""
+
+import os
+import sys
+import random
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+
+# triangles of an axis aligned box, faces point out
+def make_box(low, high):
+  """Helper Function"""
+  x0, y0, z0 = low
+  x1, y1, z1 = high
+  corner = np.array([[x, y, z] for x in (x0, x1) for y in (y0, y1) for z in (z0, z1)], dtype=np.float64)
+  face = [(0,1,3), (0,3,2), (4,6,7), (4,7,5), (0,4,5), (0,5,1), (2,3,7), (2,7,6), (0,2,6), (0,6,4), (1,5,7), (1,7,3)]
+  return corner[np.array(face)]
+
+# triangles of a uv sphere
+def make_sphere(center, radius, segment=24):
+  """Helper Function"""
+  theta = np.linspace(0, np.pi, segment+1)
+  phi = np.linspace(0, 2*np.pi, 2*segment+1)
+  def point(i, j):
+    return np.asarray(center) + radius * np.array([np.sin(theta[i])*np.cos(phi[j]), np.sin(theta[i])*np.sin(phi[j]), np.cos(theta[i])])
+  triangle_list = []
+  for i in range(segment):
+    for j in range(2*segment):
+      a, b, c, d = point(i, j), point(i+1, j), point(i+1, j+1), point(i, j+1)
+      triangle_list.append([a, b, c])
+      triangle_list.append([a, c, d])
+  return np.array(triangle_list)
+
+# random connections between distinct tips on the top layer of a (size+1, size+1, height+1) grid
+def make_board(seed, connection_num, size=14, height=3):
+  """Helper Function"""
+  rng = random.Random(seed)
+  used = set()
+  connection_list = []
+  while len(connection_list) < connection_num:
+    start = (rng.randint(0, size), rng.randint(0, size), height)
+    end = (rng.randint(0, size), rng.randint(0, size), height)
+    if start in used or end in used or start == end:
+      continue
+    used |= {start, end}
+    connection_list.append((start, end))
+  return connection_list
+
+# netlist of the path_finding.py demo on a (20,20,5) grid, tips shared between connections make junctions
+SAMPLE_CONNECTION_LIST = [
+  ((15,10,2), (0,10,3)), ((2,13,3),(15,10,2)), ((4,3,4), (0,10,3)), ((0,9,3),(15,9,3)),
+  ((1,10,5), (20,10,3)), ((5,9,3),(12,9,5)), ((6,9,4),(11,9,5)), ((7,9,5),(10,9,5)),
+  ((0,0,5), (10,10,5)), ((8,11,5),(12,0,5)), ((16,11,5),(12,0,5)), ((0,0,5), (12,0,5)),
+  ((4,3,4), (0,0,5)), ((4,3,4), (12,0,5)), ((4,3,4), (3,0,5)), ((12,0,5), (6,1,4)),
+  ((15,10,2), (6,1,4)), ((20,10,3), (6,1,4)), ((0,10,3), (6,1,4)),
+]
@@ -0,0 +1,36 @@
+"""Synthetic boards are reproducible and every routing mode runs on them"""
+
+import json
+import pytest
+
+from benchmarks import synthetic_board, run_benchmark
+
+
+def test_board_is_seeded():
+  board = synthetic_board.make_board(0, "small")
+  assert board == synthetic_board.make_board(0, "small")
+  assert board["connection_list"] != synthetic_board.make_board(1, "small")["connection_list"]
+  tip_set = {tip for net in board["net_list"] for tip in net}
+  assert not tip_set & set(map(tuple, board["obstacle_list"]))
+  assert all(0 <= a <= d for tip in tip_set for a, d in zip(tip, board["dimention"]))
+
+
+@pytest.mark.parametrize("mode", run_benchmark.MODE_LIST)
+def test_every_mode_routes_small_board(mode):
+  report = run_benchmark.run_benchmark(["small"], [mode], [0], measure_memory=False)
+  case, = report["result_list"]
+  assert case["routed_net"] + case["failed_net"] == case["net_num"]
+  assert case["expanded"] > 0 and case["tube_length"] > 0
+  assert "peak_memory" not in case
+
+
+# prints go through sys.__stdout__ after path_finding.enablePrint, so they are read from the file descriptor
+def test_main_writes_and_compares_report(tmp_path, capfd):
+  output_path = str(tmp_path / "report.json")
+  run_benchmark.main(["--scale", "small", "--seed", "0", "--no-memory", "--output", output_path])
+  with open(output_path) as file:
+    report = json.load(file)
+  assert report["result_list"][0]["scale"] == "small"
+  capfd.readouterr()
+  run_benchmark.main(["--compare", output_path, output_path])
+  assert capfd.readouterr().out.rstrip().endswith("small 0 sequential ASTAR DENSE: same")
@@ -0,0 +1,81 @@
+"""Disk caches: occupancy round trip, routing round trip and least recently used eviction"""
+
+import os
+import numpy as np
+import pytest
+
+from fluid_circuit_generator import disk_cache
+
+
+@pytest.mark.parametrize("shape", [(1,1,1), (3,5,7), (8,8,8), (13,2,9)])
+def test_occupancy_round_trip(tmp_path, shape):
+  cache = disk_cache.OccupancyCache(str(tmp_path))
+  occupancy = np.random.default_rng(sum(shape)).random(shape) < .3
+  key = {"object": "abc", "unit_dimention": 1, "obstacle_mode": "WINDING", "shape": list(shape)}
+  assert cache.load(key) is None
+  assert cache.save(key, (4, -2, 0), occupancy)
+  low, loaded = cache.load(key)
+  assert low.tolist() == [4, -2, 0]
+  assert loaded.dtype == bool and np.array_equal(loaded, occupancy)
+  # packed to bits, well under one byte per node
+  entry_list = cache.disk_cache.get_entry_list()
+  assert len(entry_list) == 1 and entry_list[0][2] < occupancy.size + 1024
+
+
+def test_occupancy_empty_window_and_broken_entry(tmp_path):
+  cache = disk_cache.OccupancyCache(str(tmp_path))
+  cache.save("empty", np.zeros(3, dtype=np.int64), np.zeros((0, 0, 0), dtype=bool))
+  low, loaded = cache.load("empty")
+  assert loaded.shape == (0, 0, 0)
+
+  cache.save("broken", (0, 0, 0), np.ones((2, 2, 2), dtype=bool))
+  key_hash = disk_cache.get_key_hash([disk_cache.OCCUPANCY_CACHE_VERSION, "broken"])
+  with open(cache.disk_cache.get_file_path(key_hash), "wb") as file:
+    file.write(b"not a npz file")
+  assert cache.load("broken") is None
+
+
+def test_routing_round_trip(tmp_path):
+  cache = disk_cache.RoutingCache(str(tmp_path))
+  result = {
+    "connection_dict": {((0,0,5), (4,2,5)): [(0,0,5), (0,0,0), (4,2,0), (4,2,5)]},
+    "junction_dict": {(2,2,0): [(0,0,5), (4,2,5)]},
+    "port_dict": {(0,0,5): [(0,0,5.5)]},
+  }
+  cache.save({"design": 1}, result)
+  assert cache.load({"design": 1}) == result
+  assert cache.load({"design": 2}) is None
+
+
+def test_eviction_removes_least_recently_used(tmp_path):
+  cache = disk_cache.DiskCache(str(tmp_path), max_size=250, suffix=".cache")
+  for i, key_hash in enumerate(["a", "b", "c"]):
+    cache.put(key_hash, bytes(100))
+    os.utime(cache.get_file_path(key_hash), (1000 + i, 1000 + i))
+  # putting c went over max_size, a was the least recently used
+  assert cache.get("a") is None and cache.get("b") is not None
+  # b was just used, c is now the oldest
+  os.utime(cache.get_file_path("b"), (2000, 2000))
+  cache.put("d", bytes(100))
+  assert cache.get("c") is None
+  assert cache.get("b") is not None and cache.get("d") is not None
+
+
+def test_newest_entry_always_kept(tmp_path):
+  cache = disk_cache.DiskCache(str(tmp_path), max_size=10, suffix=".cache")
+  cache.put("big", bytes(100))
+  assert cache.get("big") == bytes(100)
+
+
+def test_caches_sharing_a_folder_evict_on_their_own(tmp_path):
+  routing_cache = disk_cache.RoutingCache(str(tmp_path))
+  occupancy_cache = disk_cache.OccupancyCache(str(tmp_path), max_size=1)
+  routing_cache.save("design", {"connection_dict": {}, "junction_dict": {}, "port_dict": {}})
+  occupancy_cache.save("first", (0, 0, 0), np.ones((4, 4, 4), dtype=bool))
+  first_hash = disk_cache.get_key_hash([disk_cache.OCCUPANCY_CACHE_VERSION, "first"])
+  os.utime(occupancy_cache.disk_cache.get_file_path(first_hash), (1000, 1000))
+  occupancy_cache.save("second", (0, 0, 0), np.ones((4, 4, 4), dtype=bool))
+  assert routing_cache.load("design") is not None
+  assert occupancy_cache.load("second") is not None
+  assert occupancy_cache.load("first") is None
+  assert occupancy_cache.clear() == 1 and routing_cache.load("design") is not None
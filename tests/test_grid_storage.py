@@ -0,0 +1,77 @@
+"""ChunkedLayer against a dense numpy layer, and routing on both storages"""
+
+import numpy as np
+import pytest
+
+from conftest import SAMPLE_CONNECTION_LIST
+import fluid_circuit_generator.path_finding as p
+from fluid_circuit_generator.grid_storage import ChunkedLayer
+
+
+SHAPE = (21, 37, 6)
+
+
+def test_set_and_get_match_dense():
+  rng = np.random.default_rng(0)
+  layer = ChunkedLayer(SHAPE, np.int32, 7)
+  dense = np.full(np.prod(SHAPE), 7, dtype=np.int32)
+  for index, value in zip(rng.integers(0, dense.size, 500), rng.integers(-50, 50, 500)):
+    layer[int(index)] = int(value)
+    dense[index] = value
+  assert all(layer[index] == dense[index] for index in range(dense.size))
+  assert np.array_equal(layer.get_box((slice(None),)*3), dense.reshape(SHAPE))
+
+
+def test_box_round_trip():
+  rng = np.random.default_rng(1)
+  layer = ChunkedLayer(SHAPE, np.uint32, 0)
+  dense = np.zeros(SHAPE, dtype=np.uint32)
+  for _ in range(20):
+    low = rng.integers(0, SHAPE)
+    high = [int(rng.integers(l + 1, s + 1)) for l, s in zip(low, SHAPE)]
+    box = tuple(slice(int(l), h) for l, h in zip(low, high))
+    value = rng.integers(0, 3, [h - l for l, h in zip(low, high)]).astype(np.uint32)
+    layer.set_box(box, value)
+    dense[box] = value
+    check_low = rng.integers(0, SHAPE)
+    check_box = tuple(slice(int(l), int(rng.integers(l + 1, s + 1))) for l, s in zip(check_low, SHAPE))
+    assert np.array_equal(layer.get_box(check_box), dense[check_box])
+  assert np.array_equal(layer.get_box((slice(None),)*3), dense)
+
+
+def test_set_box_skips_default_chunks():
+  layer = ChunkedLayer(SHAPE, bool, False)
+  layer.set_box((slice(0, 21), slice(0, 37), slice(0, 6)), np.zeros(SHAPE, dtype=bool))
+  assert not layer.chunk_dict
+  layer.set_box((slice(20, 21), slice(36, 37), slice(5, 6)), np.ones((1,1,1), dtype=bool))
+  assert len(layer.chunk_dict) == 1
+
+
+def test_copy_and_fill():
+  layer = ChunkedLayer(SHAPE, np.float64, 0)
+  layer[100] = 2.5
+  layer_copy = layer.copy()
+  layer[100] = 1
+  assert layer_copy[100] == 2.5
+  layer.fill(3)
+  assert not layer.chunk_dict and layer[100] == 3 and layer_copy[100] == 2.5
+
+
+@pytest.mark.parametrize("search_mode", ["ASTAR", "JPS", "HPA"])
+def test_routing_same_on_both_storages(search_mode):
+  obstacle = np.zeros((6,6,3), dtype=bool)
+  obstacle[1:5, 1:5, :] = True
+  result_list = []
+  for storage in ("DENSE", "CHUNKED"):
+    grid = p.Grid((20,20,5), search_mode=search_mode, storage=storage)
+    grid.add_obstacle_occupancy(obstacle, (3, 12, 0))
+    p.blockPrint()
+    for start, end in SAMPLE_CONNECTION_LIST:
+      grid.connect_two_node(start, end)
+    p.enablePrint()
+    result_list.append((grid.saved_path, grid.tip_ground_table, grid.error_message_list,
+      grid.get_layer_box(grid.occupied), grid.get_layer_box(grid.obstacle), grid.get_layer_box(grid.blocked_mask)))
+  dense, chunked = result_list
+  assert dense[:3] == chunked[:3]
+  for dense_layer, chunked_layer in zip(dense[3:], chunked[3:]):
+    assert np.array_equal(dense_layer, chunked_layer)
@@ -0,0 +1,58 @@
+"""Parallel routing of groups that do not collide gives the sequential result"""
+
+import numpy as np
+import pytest
+
+import fluid_circuit_generator.path_finding as p
+import fluid_circuit_generator.parallel_routing as parallel_routing
+
+
+DIMENTION = (40, 40, 6)
+# one group in each corner of the grid, far enough apart to never meet
+CONNECTION_LIST = [
+  ((2,2,6), (12,8,6)), ((12,8,6), (4,14,6)),
+  ((28,3,6), (37,12,6)),
+  ((3,27,6), (14,37,6)), ((14,37,6), (4,35,6)),
+  ((27,27,6), (38,38,6)),
+]
+
+
+# grid with an obstacle wall next to every group
+def make_grid(storage):
+  """Helper Function"""
+  grid = p.Grid(DIMENTION, storage=storage)
+  wall = np.ones((1, 6, 3), dtype=bool)
+  for low in [(7,3,0), (32,5,0), (8,30,0), (32,31,0)]:
+    grid.add_obstacle_occupancy(wall, low)
+  return grid
+
+
+@pytest.mark.parametrize("storage", ["DENSE", "CHUNKED"])
+def test_obstacle_box_list_round_trip(storage):
+  grid = make_grid(storage)
+  grid.make_obstacle((39,39,6))
+  other_grid = p.Grid(DIMENTION, storage=storage)
+  for low, occupancy in parallel_routing.get_obstacle_box_list(grid):
+    other_grid.add_obstacle_occupancy(occupancy, low)
+  assert np.array_equal(grid.get_layer_box(grid.obstacle), other_grid.get_layer_box(other_grid.obstacle))
+  assert parallel_routing.get_obstacle_box_list(p.Grid(DIMENTION, storage=storage)) == []
+
+
+@pytest.mark.parametrize("storage", ["DENSE", "CHUNKED"])
+def test_parallel_matches_sequential(storage):
+  sequential_grid = make_grid(storage)
+  p.blockPrint()
+  for start, end in CONNECTION_LIST:
+    sequential_grid.connect_two_node(start, end)
+  parallel_grid = make_grid(storage)
+  stats = parallel_routing.route_parallel(parallel_grid, CONNECTION_LIST, worker_num=2)
+  p.enablePrint()
+
+  assert stats["group_num"] == 4 and stats["merged"] == 4 and stats["rerouted"] == 0
+  assert not sequential_grid.error_message_list and not parallel_grid.error_message_list
+  assert parallel_grid.saved_path == sequential_grid.saved_path
+  assert parallel_grid.tip_ground_table == sequential_grid.tip_ground_table
+  assert parallel_grid.saved_junction == sequential_grid.saved_junction
+  for layer in ("occupied", "blocked_mask"):
+    assert np.array_equal(parallel_grid.get_layer_box(getattr(parallel_grid, layer)), sequential_grid.get_layer_box(getattr(sequential_grid, layer)))
+  assert parallel_grid.blocked_edge_count == sequential_grid.blocked_edge_count
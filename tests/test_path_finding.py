@@ -0,0 +1,57 @@
+"""Incremental crossover cuts of Grid against cutting every saved path again"""
+
+import copy
+import numpy as np
+import pytest
+
+from conftest import SAMPLE_CONNECTION_LIST
+import fluid_circuit_generator.path_finding as p
+
+
+# grid with the sample netlist routed
+def route_sample(storage):
+  """Helper Function"""
+  grid = p.Grid((20,20,5), storage=storage)
+  p.blockPrint()
+  for start, end in SAMPLE_CONNECTION_LIST:
+    grid.connect_two_node(start, end)
+  p.enablePrint()
+  return grid
+
+
+@pytest.mark.parametrize("storage", ["DENSE", "CHUNKED"])
+def test_incremental_cut_matches_full_cut(storage):
+  grid = route_sample(storage)
+  assert grid.saved_path and grid.blocked_edge_count
+
+  full_grid = copy.deepcopy(grid)
+  p.blockPrint()
+  full_grid.cut_all_crossover()
+  p.enablePrint()
+  assert np.array_equal(grid.get_layer_box(grid.blocked_mask), full_grid.get_layer_box(full_grid.blocked_mask))
+  assert grid.blocked_edge_count == full_grid.blocked_edge_count
+
+
+@pytest.mark.parametrize("storage", ["DENSE", "CHUNKED"])
+def test_check_crossover_cut_leaves_grid(storage):
+  grid = route_sample(storage)
+  blocked_mask = grid.blocked_mask
+  mask_copy = grid.get_layer_box(blocked_mask).copy()
+  edge_count = dict(grid.blocked_edge_count)
+  crossover_log = {path_key: list(edge_list) for path_key, edge_list in grid.crossover_log.items()}
+
+  assert grid.check_crossover_cut()
+  assert grid.blocked_mask is blocked_mask
+  assert np.array_equal(grid.get_layer_box(grid.blocked_mask), mask_copy)
+  assert grid.blocked_edge_count == edge_count
+  assert grid.crossover_log == crossover_log
+
+
+def test_check_crossover_cut_finds_stale_count():
+  grid = route_sample("DENSE")
+  edge = next(iter(grid.blocked_edge_count))
+  # mask is the same, only the count is off
+  grid.blocked_edge_count[edge] += 1
+  error_num = len(grid.error_message_list)
+  assert not grid.check_crossover_cut()
+  assert len(grid.error_message_list) == error_num + 1
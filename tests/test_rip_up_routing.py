@@ -0,0 +1,70 @@
+"""Rip up and reroute never leaves the board worse than it found it"""
+
+import numpy as np
+import pytest
+
+from conftest import make_board
+import fluid_circuit_generator.path_finding as p
+import fluid_circuit_generator.rip_up_routing as ru
+
+
+# route a board one by one the way route_one_by_one does
+def route_board(connection_list):
+  """Helper Function"""
+  grid = p.Grid((14, 14, 3))
+  failed_list = []
+  error_range_dict = {}
+  p.blockPrint()
+  for start, end in connection_list:
+    error_num = len(grid.error_message_list)
+    if not grid.connect_two_node(start, end):
+      failed_list.append((start, end))
+      error_range_dict[(start, end)] = (error_num, len(grid.error_message_list))
+  p.enablePrint()
+  return grid, failed_list, error_range_dict
+
+# occupancy of the saved paths only
+def get_path_occupancy(grid):
+  """Helper Function"""
+  occupied = np.zeros_like(grid.occupied)
+  for path in list(grid.saved_path.values()) + [tip_path for _, _, tip_path in grid.tip_ground_table.values()]:
+    for node in path:
+      occupied[grid.get_index(node)] = 1
+  return occupied
+
+
+@pytest.mark.parametrize("seed", range(12))
+def test_rip_up_never_adds_errors(seed):
+  grid, failed_list, error_range_dict = route_board(make_board(seed, 34))
+  if not failed_list:
+    pytest.skip("nothing failed")
+  error_num = len(grid.error_message_list)
+  p.blockPrint()
+  stats = ru.rip_up_and_reroute(grid, make_board(seed, 34), failed_list, error_range_dict=error_range_dict)
+  p.enablePrint()
+  assert len(grid.error_message_list) <= error_num
+  assert stats["recovered"] + stats["still_failed"] == stats["failed"]
+  assert stats["rolled_back"] <= stats["iteration"]
+  assert (get_path_occupancy(grid) == (grid.occupied != 0)).all()
+
+
+def test_rolled_back_try_restores_grid():
+  # seed 15 has tries that are undone
+  connection_list = make_board(15, 34)
+  grid, failed_list, error_range_dict = route_board(connection_list)
+  saved_path = dict(grid.saved_path)
+  tip_ground_table = {tip_node: list(value) for tip_node, value in grid.tip_ground_table.items()}
+  error_message_list = list(grid.error_message_list)
+  occupied = grid.occupied.copy()
+  blocked_mask = grid.blocked_mask.copy()
+  blocked_edge_count = dict(grid.blocked_edge_count)
+  p.blockPrint()
+  stats = ru.rip_up_and_reroute(grid, connection_list, failed_list, error_range_dict=error_range_dict)
+  p.enablePrint()
+  assert stats["recovered"] == 0 and stats["rolled_back"] == stats["iteration"]
+  assert grid.saved_path == saved_path
+  assert {tip_node: list(value) for tip_node, value in grid.tip_ground_table.items()} == tip_ground_table
+  assert grid.error_message_list == error_message_list
+  assert (grid.occupied == occupied).all()
+  assert (grid.blocked_mask == blocked_mask).all()
+  assert {edge: count for edge, count in grid.blocked_edge_count.items() if count} == {edge: count for edge, count in blocked_edge_count.items() if count}
@@ -0,0 +1,99 @@
+import numpy as np
+import pytest
+
+from fluid_circuit_generator import voxelizer
+from conftest import make_box, make_sphere
+
+
+# faces on half unit coords are exactly half a unit from the lattice on both sides
+@pytest.mark.parametrize("low, high", [
+  ((2.5, 2.5, 2.5), (8.5, 8.5, 8.5)),
+  ((2.3, 2.3, 2.3), (8.3, 8.3, 8.3)),
+  ((2.5, 2, 3.5), (8.5, 7.5, 6)),
+  ((0, 0, 0), (5.5, 5.5, 5.5)),
+  ((-3.5, 1.5, 0.5), (4.5, 9.5, 10.5)),
+])
+def test_winding_matches_ray_on_boxes(low, high):
+  triangle_array = make_box(low, high)
+  winding = voxelizer.get_occupancy(triangle_array, (12, 12, 12), 1, inside_mode="WINDING")
+  ray = voxelizer.get_occupancy(triangle_array, (12, 12, 12), 1, inside_mode="RAY")
+  assert winding.any()
+  assert np.array_equal(winding, ray)
+
+def test_half_unit_box_is_filled():
+  occupancy = voxelizer.get_occupancy(make_box((2.5, 2.5, 2.5), (8.5, 8.5, 8.5)), (12, 12, 12), 1)
+  assert occupancy[3:9, 3:9, 3:9].all()
+  assert occupancy.sum() == 6**3
+
+@pytest.mark.parametrize("unit_dimention", [1, 2, 3])
+def test_winding_matches_ray_on_sphere(unit_dimention):
+  triangle_array = make_sphere((10.3, 9.7, 8.1), 6.2)
+  winding = voxelizer.get_occupancy(triangle_array, (20, 20, 16), unit_dimention, inside_mode="WINDING")
+  ray = voxelizer.get_occupancy(triangle_array, (20, 20, 16), unit_dimention, inside_mode="RAY")
+  assert np.array_equal(winding, ray)
+
+def test_winding_number_of_bvh_matches_exact_sum():
+  triangle_array = make_sphere((10, 10, 10), 6, 16)
+  point_array = np.random.default_rng(0).uniform(0, 20, (500, 3))
+  exact = np.array([voxelizer.get_solid_angle(np.repeat(point[None], len(triangle_array), 0), triangle_array).sum()
+    for point in point_array]) / (4 * np.pi)
+  approx = voxelizer.TriangleBVH(triangle_array).get_winding_number(point_array)
+  assert np.array_equal(np.abs(exact) > .5, np.abs(approx) > .5)
+
+def test_winding_tolerates_holes():
+  triangle_array = make_sphere((15, 15, 15), 10, 24)
+  closed = voxelizer.get_occupancy(triangle_array, (30, 30, 30), 1, inside_mode="RAY")
+  keep = np.random.default_rng(0).random(len(triangle_array)) > .1
+  holed = voxelizer.get_occupancy(triangle_array[keep], (30, 30, 30), 1, inside_mode="WINDING")
+  assert (closed ^ holed).sum() < closed.sum() * .01
+
+
+# every lattice point inside the box or closer than distance to it
+def get_box_occupancy(low, high, grid_dimention, unit_dimention, distance):
+  """Helper Function"""
+  axis_list = [np.arange(d + 1) * unit_dimention for d in grid_dimention]
+  point = np.stack(np.meshgrid(*axis_list, indexing="ij"), axis=-1)
+  outside = np.maximum(np.maximum(np.array(low) - point, point - np.array(high)), 0)
+  return np.linalg.norm(outside, axis=-1) < distance
+
+@pytest.mark.parametrize("inside_mode", ["WINDING", "RAY"])
+@pytest.mark.parametrize("low, high, unit_dimention", [
+  ((1.2, 2.7, 0.4), (6.9, 4.1, 5.3), 1),
+  ((3.1, 0.2, 2.2), (4.4, 9.8, 2.9), 1),
+  ((2, 4, 6), (17, 9, 11), 2.5),
+])
+def test_box_matches_brute_force(inside_mode, low, high, unit_dimention):
+  occupancy = voxelizer.get_occupancy(make_box(low, high), (12, 12, 12), unit_dimention, inside_mode=inside_mode)
+  assert np.array_equal(occupancy, get_box_occupancy(low, high, (12, 12, 12), unit_dimention, unit_dimention/2))
+
+def test_window_matches_whole_grid():
+  triangle_array = make_sphere((14.2, 3.1, 6.6), 5.3)
+  occupancy = voxelizer.get_occupancy(triangle_array, (16, 16, 10), 1)
+  # window cut only at 0, then cropped to the grid
+  low, window_occupancy = voxelizer.get_window_occupancy(triangle_array, None, 1)
+  assert window_occupancy.shape[0] > 17 - low[0]
+  low, window_occupancy = voxelizer.crop_window(low, window_occupancy, (16, 16, 10))
+  whole = np.zeros_like(occupancy)
+  high = low + window_occupancy.shape
+  whole[low[0]:high[0], low[1]:high[1], low[2]:high[2]] = window_occupancy
+  assert np.array_equal(whole, occupancy)
+  assert voxelizer.get_window_occupancy(triangle_array + 100, (16, 16, 10), 1) == (None, None)
+
+def test_read_stl_ascii_and_binary(tmp_path):
+  triangle_array = make_box((0.5, 1, 1.5), (2, 3.25, 4))
+  ascii_path = tmp_path / "box_ascii.stl"
+  with open(ascii_path, "w") as file:
+    file.write("solid box\n")
+    for triangle in triangle_array:
+      file.write("  facet normal 0 0 0\n    outer loop\n")
+      for vertex in triangle:
+        file.write(f"      vertex {vertex[0]} {vertex[1]} {vertex[2]}\n")
+      file.write("    endloop\n  endfacet\n")
+    file.write("endsolid box\n")
+  binary_path = tmp_path / "box_binary.stl"
+  record = np.zeros(len(triangle_array), dtype=np.dtype([("normal", "<f4", 3), ("vertex", "<f4", (3, 3)), ("attribute", "<u2")]))
+  record["vertex"] = triangle_array
+  with open(binary_path, "wb") as file:
+    file.write(b"\0" * 80 + np.uint32(len(triangle_array)).tobytes() + record.tobytes())
+  assert np.array_equal(voxelizer.read_stl(ascii_path), triangle_array)
+  assert np.array_equal(voxelizer.read_stl(binary_path), triangle_array)